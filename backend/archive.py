@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import APIRouter
+from sqlalchemy import delete, func, insert, select, text
+
+import config
+import models
+from database import async_engine, engine
+
+# archive.py moves answered prayer requests out of the hot tables. A checked request
+# whose last change (updatedAt, else createdAt) is older than ARCHIVE_AFTER_DAYS moves
+# to ArchivedPrayerRequests together with its updates, tag links and journal links,
+# keeping its id, so the default lists and their indexes only hold what users
+# mostly look at. GET /prayer-requests/ and the detail routes read the archive too
+# with ?include_archived=true.
+#
+# A background job runs every ARCHIVE_INTERVAL seconds and moves ARCHIVE_BATCH_SIZE
+# requests per transaction, so writers are never held up for long. To the rest of
+# the schema archiving is a delete: search, /sync (a tombstone) and the tag usage
+# counts drop the request and the journal entries it was linked to change. /stats
+# counts the archive as well, so answered totals stay put.
+
+logger = logging.getLogger(__name__)
+
+# (archive table, hot table, column holding the prayer request id), copied in this
+# order and deleted from the hot tables in reverse
+ARCHIVED_TABLES = (
+    (models.ArchivedPrayerRequest.__table__, models.PrayerRequest.__table__, "id"),
+    (models.ArchivedPrayerRequestUpdate.__table__, models.PrayerRequestUpdate.__table__, "prayerRequestId"),
+    (models.archivedPrayerRequestTag, models.prayerRequestTag, "prayerRequestId"),
+    (models.archivedJournalPrayerRequest, models.journal_prayer_request, "prayerRequestId"),
+)
+
+def archive_schema_statements():
+    # Archived links go away with the entry or tag they point to
+    return [
+        'CREATE TRIGGER IF NOT EXISTS "JournalEntries_archive_ad" AFTER DELETE ON "JournalEntries" BEGIN '
+        'DELETE FROM "ArchivedJournalPrayerRequest" WHERE "journalId" = old.id; END',
+        'CREATE TRIGGER IF NOT EXISTS "tags_archive_ad" AFTER DELETE ON "tags" BEGIN '
+        'DELETE FROM "ArchivedPrayerRequestTag" WHERE "tagId" = old.id; END',
+    ]
+
+def create_archive_schema(bind=engine):
+    with bind.begin() as connection:
+        for archived, _, _ in ARCHIVED_TABLES:
+            archived.create(bind=connection, checkfirst=True)
+        for statement in archive_schema_statements():
+            connection.execute(text(statement))
+
+def eligible(cutoff: datetime):
+    # The hot tables are AUTOINCREMENT, so an archived id is never handed out again
+    # and ids stay unique across the hot and archived tables.
+    request = models.PrayerRequest
+    return (
+        select(request.id)
+        .where(
+            request.checked.is_(True),
+            func.coalesce(request.updatedAt, request.createdAt) < cutoff,
+        )
+        .order_by(request.id)
+    )
+
+def move_to_archive(connection, ids: List[int]):
+    # A request already in the archive under the same id fails the INSERT, and with
+    # it the transaction, rather than losing the hot copy
+    for archived, hot, column in ARCHIVED_TABLES:
+        columns = [c.name for c in hot.columns]
+        connection.execute(
+            insert(archived).from_select(columns, select(*hot.columns).where(hot.c[column].in_(ids)))
+        )
+    for _, hot, column in reversed(ARCHIVED_TABLES):
+        connection.execute(delete(hot).where(hot.c[column].in_(ids)))
+
+def archive_batch(connection, cutoff: datetime, batch_size: int) -> int:
+    # Moves up to batch_size eligible requests; returns how many moved
+    ids = list(connection.execute(eligible(cutoff).limit(batch_size)).scalars())
+    if ids:
+        move_to_archive(connection, ids)
+    return len(ids)
+
+async def application_database():
+    yield async_engine
+
+class Archiver:
+    def __init__(self):
+        # Async generator of the engines to archive; with SHARDING on, every
+        # tenant's (shards.ShardRouter.each_engine)
+        self.databases = application_database
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.manual: Optional[asyncio.Task] = None
+        self.last_run_at: Optional[datetime] = None
+        self.last_archived = 0
+        self.archived = 0
+
+    async def run(self) -> int:
+        # One pass over everything eligible, a transaction per batch
+        if self.lock.locked():
+            return 0
+        async with self.lock:
+            cutoff = datetime.utcnow() - timedelta(days=config.ARCHIVE_AFTER_DAYS)
+            moved = 0
+            async for bind in self.databases():
+                while True:
+                    async with bind.begin() as connection:
+                        batch = await connection.run_sync(archive_batch, cutoff, config.ARCHIVE_BATCH_SIZE)
+                    moved += batch
+                    if batch < config.ARCHIVE_BATCH_SIZE:
+                        break
+                    # Let waiting requests in between batches
+                    await asyncio.sleep(0)
+            self.last_run_at = datetime.utcnow()
+            self.last_archived = moved
+            self.archived += moved
+            if moved:
+                logger.info("Archived %d prayer requests", moved)
+            return moved
+
+    async def loop(self):
+        while True:
+            try:
+                await self.run()
+            except Exception:
+                logger.exception("Archive run failed")
+            await asyncio.sleep(config.ARCHIVE_INTERVAL)
+
+    def start(self):
+        if config.ARCHIVE_INTERVAL > 0 and self.task is None:
+            self.task = asyncio.create_task(self.loop())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+archiver = Archiver()
+
+router = APIRouter()
+
+@router.post("/archive/run", status_code=202)
+async def run_archive():
+    # Starts a pass in the background unless one is already running
+    started = not archiver.lock.locked()
+    if started:
+        archiver.manual = asyncio.create_task(archiver.run())
+    return {"started": started, **await archive_status()}
+
+@router.get("/archive/status")
+async def archive_status():
+    return {
+        "running": archiver.lock.locked(),
+        "lastRunAt": archiver.last_run_at.isoformat() if archiver.last_run_at else None,
+        "lastArchived": archiver.last_archived,
+        "archived": archiver.archived,
+        "afterDays": config.ARCHIVE_AFTER_DAYS,
+        "batchSize": config.ARCHIVE_BATCH_SIZE,
+    }
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["run"]:
+        sys.exit("usage: python archive.py run")
+    create_archive_schema()
+    cutoff = datetime.utcnow() - timedelta(days=config.ARCHIVE_AFTER_DAYS)
+    total = 0
+    while True:
+        with engine.begin() as connection:
+            moved = archive_batch(connection, cutoff, config.ARCHIVE_BATCH_SIZE)
+        total += moved
+        if moved < config.ARCHIVE_BATCH_SIZE:
+            break
+    print(f"Archived {total} prayer requests")
@@ -0,0 +1,375 @@
+import json
+from datetime import datetime
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload
+
+import archive
+import models
+import verses
+import writer
+from database import AsyncSessionLocal
+
+# backup.py streams the whole database out as NDJSON (/export) and loads such a
+# file back in (/import). Each line is one record with a "type" field. Records are
+# written in dependency order (tags, persons, prayer requests with their updates,
+# journal entries) and refer to each other by their ids in the exporting database,
+# so an import can remap every reference to the ids it assigns. Archived prayer
+# requests (see archive.py) follow the hot ones with "archived": true and go back
+# into the archive on import, journal links included.
+
+EXPORT_VERSION = 1
+# Rows fetched per round trip on export and rows inserted per transaction on import
+BATCH_SIZE = 500
+
+# Fields an imported record must carry, by record type
+REQUIRED_FIELDS = {
+    "tag": ("id", "name"),
+    "person": ("id", "firstName", "lastName"),
+    "prayer_request": ("id", "title"),
+    "journal_entry": ("id",),
+}
+
+# Type of each field a record may carry, checked before the record is queued so a
+# bad value is reported against its line instead of failing a whole batch. Every
+# field may be null; "ids" is a list of ids, "updates" a list of update records.
+FIELD_TYPES = {
+    "tag": {"id": "int", "name": "str"},
+    "person": {"id": "int", "firstName": "str", "lastName": "str"},
+    "prayer_request": {
+        "id": "int", "title": "str", "description": "str", "checked": "bool", "assignedToId": "int",
+        "createdAt": "datetime", "updatedAt": "datetime", "tags": "ids", "updates": "updates",
+        "archived": "bool", "archivedAt": "datetime",
+    },
+    "prayer_request_update": {"id": "int", "title": "str", "content": "str", "date": "datetime"},
+    "journal_entry": {
+        "id": "int", "title": "str", "content": "str", "bibleVerses": "strs",
+        "createdAt": "datetime", "updatedAt": "datetime", "tags": "ids", "prayerRequests": "ids",
+    },
+}
+
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+def parse_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+def valid_value(kind: str, value) -> bool:
+    if value is None:
+        return True
+    if kind == "int":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if kind == "str":
+        return isinstance(value, str)
+    if kind == "bool":
+        return isinstance(value, (bool, int))
+    if kind == "datetime":
+        try:
+            parse_datetime(value)
+        except (TypeError, ValueError):
+            return False
+        return True
+    if kind == "ids":
+        return isinstance(value, list) and all(item is not None and valid_value("int", item) for item in value)
+    if kind == "strs":
+        return isinstance(value, list) and all(isinstance(item, str) for item in value)
+    if kind == "updates":
+        return isinstance(value, list) and all(
+            isinstance(item, dict) and not invalid_fields("prayer_request_update", item) for item in value
+        )
+    return False
+
+def invalid_fields(record_type: str, record: dict) -> List[str]:
+    return [
+        field for field, kind in FIELD_TYPES[record_type].items() if not valid_value(kind, record.get(field))
+    ]
+
+async def stream_scalars(db, stmt) -> AsyncIterator:
+    # yield_per fetches BATCH_SIZE rows at a time. The session's identity map only
+    # holds weak references to unmodified objects, so each batch is released once
+    # its records have been written.
+    result = await db.stream_scalars(stmt.execution_options(yield_per=BATCH_SIZE))
+    async for partition in result.partitions():
+        for row in partition:
+            yield row
+
+def prayer_request_record(pr) -> dict:
+    record = {
+        "type": "prayer_request",
+        "id": pr.id,
+        "title": pr.title,
+        "description": pr.description,
+        "checked": pr.checked,
+        "assignedToId": pr.assignedToId,
+        "createdAt": isoformat(pr.createdAt),
+        "updatedAt": isoformat(pr.updatedAt),
+        "tags": [tag.id for tag in pr.tags],
+        "updates": [
+            {"id": u.id, "title": u.title, "content": u.content, "date": isoformat(u.date)}
+            for u in pr.updates
+        ],
+    }
+    if isinstance(pr, models.ArchivedPrayerRequest):
+        record.update(archived=True, archivedAt=isoformat(pr.archivedAt))
+    return record
+
+async def export_records() -> AsyncIterator[dict]:
+    async with AsyncSessionLocal() as db:
+        yield {"type": "header", "version": EXPORT_VERSION, "exportedAt": datetime.utcnow().isoformat()}
+
+        async for tag in stream_scalars(db, select(models.Tag).order_by(models.Tag.id)):
+            yield {"type": "tag", "id": tag.id, "name": tag.name}
+
+        async for person in stream_scalars(db, select(models.Person).order_by(models.Person.id)):
+            yield {"type": "person", "id": person.id, "firstName": person.firstName, "lastName": person.lastName}
+
+        for model in (models.PrayerRequest, models.ArchivedPrayerRequest):
+            stmt = select(model).options(selectinload(model.tags), selectinload(model.updates)).order_by(model.id)
+            async for pr in stream_scalars(db, stmt):
+                yield prayer_request_record(pr)
+
+        stmt = (
+            select(models.JournalEntry)
+            .options(
+                selectinload(models.JournalEntry.tags),
+                selectinload(models.JournalEntry.prayerRequests),
+                selectinload(models.JournalEntry.archivedPrayerRequests),
+            )
+            .order_by(models.JournalEntry.id)
+        )
+        async for entry in stream_scalars(db, stmt):
+            yield {
+                "type": "journal_entry",
+                "id": entry.id,
+                "title": entry.title,
+                "content": entry.content,
+                "bibleVerses": entry.bibleVersesList,
+                "createdAt": isoformat(entry.createdAt),
+                "updatedAt": isoformat(entry.updatedAt),
+                "tags": [tag.id for tag in entry.tags],
+                "prayerRequests": [pr.id for pr in entry.prayerRequestsWithArchived],
+            }
+
+async def export_lines() -> AsyncIterator[bytes]:
+    async for record in export_records():
+        yield (json.dumps(record) + "\n").encode()
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+class Importer:
+    # Buffers records of one type and inserts them in batches, one transaction per
+    # batch, each handed to writer.run like the writes of the other routes. id_map[type][old id] is the id the record got in this database.
+    def __init__(self, db):
+        self.db = db
+        self.id_map: Dict[str, Dict[int, int]] = {"tag": {}, "person": {}, "prayer_request": {}, "prayer_request_update": {}, "journal_entry": {}}
+        self.errors: List[dict] = []
+        self.pending: List[dict] = []
+        self.pending_lines: List[int] = []
+        self.pending_type = None
+        self.batch_map: Dict[str, Dict[int, int]] = {}
+        # New ids of the prayer requests imported into the archive
+        self.archived: Set[int] = set()
+        self.batch_archived: Set[int] = set()
+
+    def report(self, line: int, detail: str, last_line: Optional[int] = None):
+        # Every error names the lines it covers, lastLine being line for a single record
+        self.errors.append({"line": line, "lastLine": last_line or line, "detail": detail})
+
+    async def add(self, line_number: int, record: dict):
+        if record["type"] != self.pending_type or len(self.pending) >= BATCH_SIZE:
+            await self.flush()
+            self.pending_type = record["type"]
+        self.pending.append(record)
+        self.pending_lines.append(line_number)
+
+    async def flush(self):
+        if not self.pending:
+            return
+        records, lines = self.pending, self.pending_lines
+        self.pending, self.pending_lines = [], []
+        # New ids go into batch_map and only reach id_map once the batch commits.
+        self.batch_map = {record_type: {} for record_type in self.id_map}
+        self.batch_archived = set()
+        try:
+            await writer.run(self.db, partial(getattr(self, f"insert_{self.pending_type}"), records))
+        except (SQLAlchemyError, TypeError, ValueError) as exc:
+            # Records are validated before they are queued; this is the backstop
+            await self.db.rollback()
+            self.report(lines[0], str(getattr(exc, "orig", None) or exc), lines[-1])
+            return
+        for record_type, mapping in self.batch_map.items():
+            self.id_map[record_type].update(mapping)
+        self.archived |= self.batch_archived
+
+    async def insert_rows(self, db, model, rows: List[dict]) -> List[int]:
+        result = await db.execute(insert(model).values(rows).returning(model.id))
+        # SQLite hands out rowids in VALUES order within one statement
+        return sorted(result.scalars())
+
+    def remap(self, record_type: str, ids) -> List[int]:
+        mapping = self.id_map[record_type]
+        # Several old tags can map to one existing tag; link it once
+        return list(dict.fromkeys(mapping[old_id] for old_id in ids if old_id in mapping))
+
+    async def insert_tag(self, records, db):
+        # Tag names are unique; reuse tags that already exist under the same name.
+        existing = dict((await db.execute(
+            select(models.Tag.name, models.Tag.id).where(models.Tag.name.in_([r["name"] for r in records]))
+        )).all())
+        new = [r for r in records if r["name"] not in existing]
+        for record in records:
+            if record["name"] in existing:
+                self.batch_map["tag"][record["id"]] = existing[record["name"]]
+        if new:
+            new_ids = await self.insert_rows(db, models.Tag, [{"name": r["name"]} for r in new])
+            self.batch_map["tag"].update({r["id"]: new_id for r, new_id in zip(new, new_ids)})
+
+    async def insert_person(self, records, db):
+        new_ids = await self.insert_rows(
+            db, models.Person, [{"firstName": r["firstName"], "lastName": r["lastName"]} for r in records]
+        )
+        self.batch_map["person"].update({r["id"]: new_id for r, new_id in zip(records, new_ids)})
+
+    async def insert_prayer_request(self, records, db):
+        people = self.id_map["person"]
+        new_ids = await self.insert_rows(db, models.PrayerRequest, [
+            {
+                "title": r["title"],
+                "description": r.get("description"),
+                "checked": bool(r.get("checked")),
+                "assignedToId": people.get(r.get("assignedToId")),
+                "createdAt": parse_datetime(r.get("createdAt")) or datetime.utcnow(),
+                "updatedAt": parse_datetime(r.get("updatedAt")),
+            }
+            for r in records
+        ])
+        self.batch_map["prayer_request"].update({r["id"]: new_id for r, new_id in zip(records, new_ids)})
+
+        tag_rows = [
+            {"prayerRequestId": new_id, "tagId": tag_id}
+            for r, new_id in zip(records, new_ids)
+            for tag_id in self.remap("tag", r.get("tags", []))
+        ]
+        if tag_rows:
+            await db.execute(insert(models.prayerRequestTag), tag_rows)
+
+        updates = [(u, new_id) for r, new_id in zip(records, new_ids) for u in r.get("updates", [])]
+        for start in range(0, len(updates), BATCH_SIZE):
+            batch = updates[start:start + BATCH_SIZE]
+            update_ids = await self.insert_rows(db, models.PrayerRequestUpdate, [
+                {
+                    "title": u.get("title"),
+                    "content": u.get("content"),
+                    "date": parse_datetime(u.get("date")) or datetime.utcnow(),
+                    "prayerRequestId": request_id,
+                }
+                for u, request_id in batch
+            ])
+            self.batch_map["prayer_request_update"].update({u["id"]: new_id for (u, _), new_id in zip(batch, update_ids) if "id" in u})
+
+        # Archived requests are inserted like the others, then moved as archive.py would
+        archived = [(r, new_id) for r, new_id in zip(records, new_ids) if r.get("archived")]
+        if archived:
+            ids = [new_id for _, new_id in archived]
+            await db.run_sync(lambda session: archive.move_to_archive(session.connection(), ids))
+            archived_at = [
+                {"id": new_id, "archivedAt": parse_datetime(r["archivedAt"])} for r, new_id in archived if r.get("archivedAt")
+            ]
+            if archived_at:
+                await db.execute(update(models.ArchivedPrayerRequest), archived_at)
+            self.batch_archived.update(ids)
+
+    async def insert_journal_entry(self, records, db):
+        new_ids = await self.insert_rows(db, models.JournalEntry, [
+            {
+                "title": r.get("title"),
+                "content": r.get("content"),
+                "bibleVerses": json.dumps(r.get("bibleVerses") or []),
+                "createdAt": parse_datetime(r.get("createdAt")) or datetime.utcnow(),
+                "updatedAt": parse_datetime(r.get("updatedAt")),
+            }
+            for r in records
+        ])
+        self.batch_map["journal_entry"].update({r["id"]: new_id for r, new_id in zip(records, new_ids)})
+        await verses.replace_verses(db, [(new_id, r.get("bibleVerses") or []) for r, new_id in zip(records, new_ids)])
+
+        tag_rows = [
+            {"journalId": new_id, "tagId": tag_id}
+            for r, new_id in zip(records, new_ids)
+            for tag_id in self.remap("tag", r.get("tags", []))
+        ]
+        if tag_rows:
+            await db.execute(insert(models.journalTag), tag_rows)
+        link_rows = [
+            {"journalId": new_id, "prayerRequestId": request_id}
+            for r, new_id in zip(records, new_ids)
+            for request_id in self.remap("prayer_request", r.get("prayerRequests", []))
+        ]
+        for table, rows in (
+            (models.journal_prayer_request, [row for row in link_rows if row["prayerRequestId"] not in self.archived]),
+            (models.archivedJournalPrayerRequest, [row for row in link_rows if row["prayerRequestId"] in self.archived]),
+        ):
+            if rows:
+                await db.execute(insert(table), rows)
+
+router = APIRouter()
+
+@router.get("/export")
+async def export_database():
+    return StreamingResponse(
+        export_lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=ebenezer-export.ndjson"},
+    )
+
+@router.post("/import")
+async def import_database(request: Request):
+    async with AsyncSessionLocal() as db:
+        importer = Importer(db)
+        line_number = 0
+        async for line in iter_lines(request.stream()):
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                importer.report(line_number, "Invalid JSON")
+                continue
+            record_type = record.get("type") if isinstance(record, dict) else None
+            if record_type == "header":
+                if record.get("version") != EXPORT_VERSION:
+                    importer.report(line_number, f"Unsupported export version {record.get('version')}")
+                continue
+            if record_type not in REQUIRED_FIELDS:
+                importer.report(line_number, "Unknown record type")
+                continue
+            missing = [field for field in REQUIRED_FIELDS[record_type] if record.get(field) is None]
+            if missing:
+                importer.report(line_number, f"Missing fields: {', '.join(missing)}")
+                continue
+            invalid = invalid_fields(record_type, record)
+            if invalid:
+                importer.report(line_number, f"Invalid fields: {', '.join(invalid)}")
+                continue
+            await importer.add(line_number, record)
+        await importer.flush()
+
+    return {
+        "imported": {record_type: len(mapping) for record_type, mapping in importer.id_map.items()},
+        "idMap": importer.id_map,
+        "errors": importer.errors,
+    }
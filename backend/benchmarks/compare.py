@@ -0,0 +1,48 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Compares two result files written by benchmarks.load and flags routes that got
+# slower (p95 up by more than --threshold percent) or run more SQL statements.
+# Exits with status 1 when anything regressed, so it can gate a CI job.
+#
+#   cd backend && python -m benchmarks.compare before.json after.json
+
+def change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+def compare(before: dict, after: dict, threshold: float) -> int:
+    print(f"{'route':<40}{'p50 ms':>17}{'p95 ms':>17}{'p95 %':>8}{'queries':>11}")
+    regressions = 0
+    for name, new in after["routes"].items():
+        old = before["routes"].get(name)
+        if old is None:
+            print(f"{name:<40}{'(new)':>17}")
+            continue
+        p95_change = change(old["p95Ms"], new["p95Ms"])
+        slower = p95_change > threshold
+        more_queries = (new["queriesPerRequest"] or 0) > (old["queriesPerRequest"] or 0)
+        flag = "  <-- regression" if slower or more_queries else ""
+        regressions += bool(flag)
+        print(
+            f"{name:<40}{old['p50Ms']:>8.2f}->{new['p50Ms']:<7.2f}{old['p95Ms']:>8.2f}->{new['p95Ms']:<7.2f}"
+            f"{p95_change:>+7.1f}%{old['queriesPerRequest'] or 0:>5}->{new['queriesPerRequest'] or 0:<5}{flag}"
+        )
+    for name in sorted(before["routes"].keys() - after["routes"].keys()):
+        print(f"{name:<40}{'(missing)':>17}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmarks.load result files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed p95 increase in percent")
+    args = parser.parse_args()
+    before, after = (json.loads(Path(path).read_text()) for path in (args.before, args.after))
+    for label, report in (("before", before), ("after", after)):
+        meta = report["meta"]
+        print(f"{label}: {meta['commit']} {meta['mode']} {meta['scale']['entries']} entries, {meta['timestamp']}")
+    if before["meta"]["scale"] != after["meta"]["scale"]:
+        print("warning: the runs used databases of different sizes")
+    sys.exit(1 if compare(before, after, args.threshold) else 0)
@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+# Load benchmark for the API. Runs every route in ROUTES against a copy of a seeded
+# database (see benchmarks/seed.py) and reports latency percentiles, throughput and
+# SQL statements per request, read from the X-Query-Count header (see
+# querycount.py). By default the app runs in-process behind httpx's ASGI transport;
+# --uvicorn starts a real server in a subprocess and goes over HTTP instead.
+#
+#   cd backend && python -m benchmarks.seed --entries 100k --db /tmp/bench.db
+#   python -m benchmarks.load --db /tmp/bench.db --output before.json
+#   python -m benchmarks.compare before.json after.json
+#
+# Requests are made with a fixed random seed, so two runs against the same database
+# issue the same requests. The page cache (cache.py) is off unless --page-cache is
+# given, so repeated list requests measure the database rather than the cache.
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+
+class Scale(NamedTuple):
+    entries: int
+    requests: int
+    updates: int
+    tags: int
+
+class Route(NamedTuple):
+    name: str
+    method: str
+    # (rng, scale) -> (path, query params, JSON body)
+    build: Callable
+    write: bool = False
+
+def pick(rng: random.Random, count: int) -> int:
+    return rng.randint(1, max(count, 1))
+
+ROUTES = [
+    Route("GET /tags/", "GET", lambda rng, s: ("/tags/", {"limit": 100}, None)),
+    Route("GET /tags/facets", "GET", lambda rng, s: ("/tags/facets", {}, None)),
+    Route("GET /journal-entries/", "GET", lambda rng, s: ("/journal-entries/", {"limit": 20, "skip": rng.randint(0, 200)}, None)),
+    Route("GET /journal-entries/ by tag", "GET",
+          lambda rng, s: ("/journal-entries/", {"limit": 20, "tags": [pick(rng, min(s.tags, 10)), pick(rng, s.tags)], "tag_match": "any"}, None)),
+    Route("GET /journal-entries/{id}", "GET", lambda rng, s: (f"/journal-entries/{pick(rng, s.entries)}", {}, None)),
+    Route("GET /prayer-requests/", "GET", lambda rng, s: ("/prayer-requests/", {"limit": 20, "skip": rng.randint(0, 200)}, None)),
+    Route("GET /prayer-requests/{id}", "GET", lambda rng, s: (f"/prayer-requests/{pick(rng, s.requests)}", {}, None)),
+    Route("GET /prayer-requests/{id}/updates/", "GET",
+          lambda rng, s: (f"/prayer-requests/{pick(rng, s.requests)}/updates/", {}, None)),
+    Route("GET /search", "GET", lambda rng, s: ("/search", {"q": rng.choice(["grace", "peace hope", "heal", "family work"])}, None)),
+    Route("GET /verses/{ref}/journal-entries", "GET",
+          lambda rng, s: (f"/verses/{rng.choice(['John 3', 'Psalm 23:1', 'Romans 8:28'])}/journal-entries", {"limit": 20}, None)),
+    Route("GET /stats", "GET", lambda rng, s: ("/stats", {}, None)),
+    Route("GET /sync", "GET", lambda rng, s: ("/sync", {"since": 0, "limit": 100}, None)),
+    Route("POST /journal-entries/", "POST", lambda rng, s: ("/journal-entries/", {}, {
+        "title": "Benchmark entry", "content": "Lorem ipsum " * 40, "bibleVerses": ["John 3:16"],
+        "tags": [pick(rng, s.tags), pick(rng, s.tags)],
+        "prayerRequests": [{"title": "Benchmark request", "description": "Pray", "tags": [pick(rng, s.tags)]}],
+    }), write=True),
+    Route("PUT /prayer-requests/{id}", "PUT", lambda rng, s: (f"/prayer-requests/{pick(rng, s.requests)}", {}, {
+        "title": "Benchmark request", "description": "Pray", "checked": rng.random() < 0.5,
+    }), write=True),
+    Route("POST /prayer-requests/{id}/updates/", "POST", lambda rng, s: (
+        f"/prayer-requests/{pick(rng, s.requests)}/updates/", {}, {"title": "Update", "content": "Answered"},
+    ), write=True),
+]
+
+def read_scale(db_path: str) -> Scale:
+    with sqlite3.connect(db_path) as connection:
+        count = lambda table: connection.execute(f'SELECT coalesce(max(id), 0) FROM "{table}"').fetchone()[0]
+        return Scale(count("JournalEntries"), count("PrayerRequests"), count("PrayerRequestUpdates"), count("tags"))
+
+def percentile(values: List[float], p: float) -> float:
+    # Nearest-rank percentile of sorted values
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+def summarize(latencies: List[float], queries: List[int], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50Ms": round(percentile(latencies, 50), 3),
+        "p95Ms": round(percentile(latencies, 95), 3),
+        "p99Ms": round(percentile(latencies, 99), 3),
+        "meanMs": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "throughputRps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "queriesPerRequest": round(sum(queries) / len(queries), 2) if queries else None,
+        "maxQueries": max(queries) if queries else None,
+    }
+
+async def run_route(client, route: Route, scale: Scale, requests: int, concurrency: int, warmup: int, seed: int) -> dict:
+    rng = random.Random(f"{seed}:{route.name}")
+    calls = [route.build(rng, scale) for _ in range(warmup + requests)]
+    latencies: List[float] = []
+    queries: List[int] = []
+    errors = 0
+
+    async def call(path, params, body):
+        started = time.perf_counter()
+        response = await client.request(route.method, path, params=params, json=body)
+        return (time.perf_counter() - started) * 1000, response
+
+    for call_args in calls[:warmup]:
+        await call(*call_args)
+
+    pending = iter(calls[warmup:])
+
+    async def worker():
+        nonlocal errors
+        for call_args in pending:
+            elapsed, response = await call(*call_args)
+            latencies.append(elapsed)
+            if response.status_code >= 400:
+                errors += 1
+            if "x-query-count" in response.headers:
+                queries.append(int(response.headers["x-query-count"]))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, queries, errors, time.perf_counter() - started)
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def benchmark_env(db_path: str, page_cache: bool) -> Dict[str, str]:
+    return {
+        "DATABASE_PATH": db_path,
+        "QUERY_COUNT_HEADER": "1",
+        "QUERY_BUDGET_MODE": "warn",
+        "ACCESS_LOG_SAMPLE_RATE": "0",
+        "ACCESS_LOG_SLOW_MS": "1000000",
+        "LOG_LEVEL": "ERROR",
+        "ARCHIVE_INTERVAL": "0",
+        "PAGE_CACHE_SIZE": os.environ.get("PAGE_CACHE_SIZE", "256") if page_cache else "0",
+    }
+
+async def wait_until_up(client, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await client.get("/tags/", params={"limit": 1})
+            return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+async def run(args) -> dict:
+    try:
+        import httpx
+    except ImportError:
+        sys.exit("benchmarks.load needs httpx: pip install httpx")
+
+    work_dir = tempfile.mkdtemp(prefix="ebenezer-bench-")
+    db_path = os.path.join(work_dir, "bench.db")
+    shutil.copy(args.db, db_path)
+    scale = read_scale(db_path)
+    env = benchmark_env(db_path, args.page_cache)
+    routes = [route for route in ROUTES if args.writes or not route.write]
+    if args.routes:
+        routes = [route for route in routes if any(name in route.name for name in args.routes)]
+
+    server = None
+    try:
+        if args.uvicorn:
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning",
+                 "--no-access-log"],
+                cwd=BACKEND, env={**os.environ, **env},
+            )
+            client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=60)
+        else:
+            os.environ.update(env)
+            import main
+            import migrations
+            # No lifespan events through ASGITransport, so migrate as startup would
+            migrations.upgrade()
+            # Unhandled exceptions come back as 500s and count as errors, like under uvicorn
+            transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+            client = httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60)
+
+        results = {}
+        async with client:
+            if server is not None:
+                await wait_until_up(client)
+            for route in routes:
+                results[route.name] = await run_route(
+                    client, route, scale, args.requests, args.concurrency, args.warmup, args.seed
+                )
+                row = results[route.name]
+                print(
+                    f"{route.name:<40}{row['p50Ms']:>9.2f}{row['p95Ms']:>9.2f}{row['p99Ms']:>9.2f}"
+                    f"{row['throughputRps']:>10.1f}{row['queriesPerRequest'] if row['queriesPerRequest'] is not None else '-':>9}"
+                    f"{row['errors']:>7}"
+                )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "mode": "uvicorn" if args.uvicorn else "asgi",
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "database": os.path.basename(args.db),
+            "scale": scale._asdict(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "pageCache": args.page_cache,
+            "writes": args.writes,
+        },
+        "routes": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the API against a seeded database")
+    parser.add_argument("--db", required=True, help="database seeded by benchmarks.seed (copied, never modified)")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per route")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per route")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--writes", action="store_true", help="also run the write routes")
+    parser.add_argument("--page-cache", action="store_true", help="leave the list page cache on")
+    parser.add_argument("--route", dest="routes", action="append", help="only routes whose name contains this")
+    parser.add_argument("--uvicorn", action="store_true", help="run the app under uvicorn instead of in-process")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    print(f"{'route':<40}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>10}{'queries':>9}{'errors':>7}")
+    report = asyncio.run(run(args))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Results written to {args.output}")
@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Seeds a fresh SQLite database with synthetic journal data for the load benchmark
+# (benchmarks/load.py). The same --seed and scale always produce the same rows.
+#
+#   cd backend && python -m benchmarks.seed --entries 100k --db /tmp/bench.db
+#
+# Fan-out per journal entry is roughly that of a real journal: 0-4 tags out of a
+# pool where a few tags are very common, 0-3 Bible references and about one prayer
+# request, which has 0-2 tags, 0-4 updates and is assigned to a person 60% of the
+# time and checked 40% of the time. Rows go through the app's schema and triggers
+# (search, sync log, tag counts, stats), so the database looks like one the app
+# built itself.
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+WORDS = (
+    "grace peace mercy hope faith love joy patience kindness family work health church "
+    "travel healing wisdom guidance provision strength rest gratitude friends school "
+    "marriage children parents neighbours mission study prayer worship trust"
+).split()
+
+VERSES = [
+    "John 3:16", "Psalm 23", "Romans 8:28", "Philippians 4:6-7", "Isaiah 40:31", "Proverbs 3:5-6",
+    "Matthew 6:25-34", "Jeremiah 29:11", "Genesis 1-3", "1 John 1:9", "Romans 8:28-9:5", "Psalm 46:1",
+    "Hebrews 11:1", "James 1:2-4", "Lamentations 3:22-23", "2 Corinthians 12:9", "Joshua 1:9",
+    "Matthew 11:28-30", "Ephesians 2:8-9", "Galatians 5:22-23",
+]
+
+FIRST_NAMES = ["Ada", "Ben", "Chloe", "David", "Esther", "Femi", "Grace", "Hiro", "Ines", "Jon", "Kemi", "Luis"]
+LAST_NAMES = ["Adams", "Brown", "Chen", "Diaz", "Evans", "Fischer", "Garcia", "Hughes", "Ito", "Jones", "Khan"]
+
+def parse_count(value: str) -> int:
+    # "10k", "100k", "1m" or a plain number
+    value = value.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * multiplier)
+
+def words(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+class Generator:
+    def __init__(self, entries: int, seed: int):
+        self.rng = random.Random(seed)
+        self.entries = entries
+        self.tag_count = min(500, max(20, entries // 200))
+        self.person_count = max(5, entries // 1000)
+        # A few tags are used far more than the rest
+        self.tag_weights = [1 / (rank + 1) for rank in range(self.tag_count)]
+        self.start = datetime(2021, 1, 1)
+        self.step = timedelta(days=3 * 365) / entries
+        self.next_request_id = 1
+        self.next_update_id = 1
+
+    def tags(self):
+        return [{"id": i, "name": f"{WORDS[i % len(WORDS)]} {i}"} for i in range(1, self.tag_count + 1)]
+
+    def people(self):
+        return [
+            {"id": i, "firstName": self.rng.choice(FIRST_NAMES), "lastName": self.rng.choice(LAST_NAMES)}
+            for i in range(1, self.person_count + 1)
+        ]
+
+    def pick_tags(self, low: int, high: int):
+        count = self.rng.randint(low, high)
+        return set(self.rng.choices(range(1, self.tag_count + 1), weights=self.tag_weights, k=count))
+
+    def entry(self, entry_id: int, rows):
+        rng = self.rng
+        created = self.start + self.step * entry_id + timedelta(seconds=rng.randint(0, 3600))
+        references = rng.sample(VERSES, rng.choice((0, 1, 1, 2, 3)))
+        rows["entries"].append({
+            "id": entry_id, "title": words(rng, 3, 6), "content": words(rng, 40, 120),
+            "bibleVerses": json.dumps(references), "createdAt": created, "updatedAt": None,
+        })
+        rows["verses"].append((entry_id, references))
+        rows["entry_tags"] += [{"journalId": entry_id, "tagId": tag_id} for tag_id in self.pick_tags(0, 4)]
+        for _ in range(rng.choices((0, 1, 2, 3), weights=(40, 35, 15, 10))[0]):
+            request_id = self.next_request_id
+            self.next_request_id += 1
+            checked = rng.random() < 0.4
+            rows["requests"].append({
+                "id": request_id, "title": words(rng, 2, 5), "description": words(rng, 10, 40),
+                "checked": checked, "createdAt": created,
+                "updatedAt": created + timedelta(days=rng.randint(1, 60)) if checked else None,
+                "assignedToId": rng.randint(1, self.person_count) if rng.random() < 0.6 else None,
+            })
+            rows["request_tags"] += [{"prayerRequestId": request_id, "tagId": tag_id} for tag_id in self.pick_tags(0, 2)]
+            rows["links"].append({"prayerRequestId": request_id, "journalId": entry_id})
+            for day in sorted(rng.sample(range(1, 90), rng.choices((0, 1, 2, 3, 4), weights=(30, 30, 20, 12, 8))[0])):
+                rows["updates"].append({
+                    "id": self.next_update_id, "title": words(rng, 2, 4), "content": words(rng, 10, 60),
+                    "date": created + timedelta(days=day), "prayerRequestId": request_id,
+                })
+                self.next_update_id += 1
+
+def seed(db_path: str, entries: int, seed_value: int, batch_size: int):
+    if os.path.exists(db_path):
+        sys.exit(f"{db_path} already exists; seed into a new file")
+    os.environ["DATABASE_PATH"] = db_path
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from sqlalchemy import insert, text
+
+    import migrations
+    import models
+    import verses
+    from database import engine
+
+    migrations.upgrade(engine)
+
+    generator = Generator(entries, seed_value)
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute(insert(models.Tag), generator.tags())
+        connection.execute(insert(models.Person), generator.people())
+
+    tables = (
+        ("entries", models.JournalEntry.__table__),
+        ("requests", models.PrayerRequest.__table__),
+        ("updates", models.PrayerRequestUpdate.__table__),
+        ("entry_tags", models.journalTag),
+        ("request_tags", models.prayerRequestTag),
+        ("links", models.journal_prayer_request),
+    )
+    for start in range(1, entries + 1, batch_size):
+        rows = {name: [] for name, _ in tables}
+        rows["verses"] = []
+        for entry_id in range(start, min(start + batch_size, entries + 1)):
+            generator.entry(entry_id, rows)
+        with engine.begin() as connection:
+            for name, table in tables:
+                if rows[name]:
+                    connection.execute(insert(table), rows[name])
+            verse_rows = [row for entry_id, references in rows["verses"] for row in verses.verse_rows(entry_id, references)]
+            if verse_rows:
+                connection.execute(insert(models.JournalVerse), verse_rows)
+        done = min(start + batch_size - 1, entries)
+        print(f"\r{done}/{entries} journal entries", end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+
+    with engine.connect() as connection:
+        connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    print(
+        f"Seeded {db_path}: {entries} journal entries, {generator.next_request_id - 1} prayer requests, "
+        f"{generator.next_update_id - 1} updates, {generator.tag_count} tags, {generator.person_count} people "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed a benchmark database")
+    parser.add_argument("--db", required=True, help="path of the new SQLite file")
+    parser.add_argument("--entries", default="10k", type=parse_count, help="journal entries, e.g. 10k, 100k, 1m")
+    parser.add_argument("--seed", default=1, type=int)
+    parser.add_argument("--batch-size", default=5000, type=int)
+    args = parser.parse_args()
+    seed(args.db, args.entries, args.seed, args.batch_size)
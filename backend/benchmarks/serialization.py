@@ -0,0 +1,91 @@
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+# Compares the serialization path used by the routes (serialization.to_json, compiled
+# converters + orjson) with FastAPI's response_model path and with a cached
+# TypeAdapter (validate + dump_json) on 100-item pages of ORM objects.
+#
+#   cd backend && python -m benchmarks.serialization [rounds]
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+import models  # noqa: E402
+import serialization  # noqa: E402
+from schemas import JournalEntry, PrayerRequest, Tag  # noqa: E402
+
+PAGE_SIZE = 100
+
+def build_page():
+    now = datetime(2024, 1, 1)
+    tags = [models.Tag(id=i, name=f"tag {i}") for i in range(1, 11)]
+    person = models.Person(id=1, firstName="Ada", lastName="Lovelace")
+    entries = []
+    for i in range(PAGE_SIZE):
+        requests = []
+        for j in range(3):
+            request_id = i * 3 + j
+            requests.append(models.PrayerRequest(
+                id=request_id, title=f"Request {request_id}", description="Pray for " * 10, checked=j == 0,
+                assignedToId=1, assignedTo=person, createdAt=now, updatedAt=now + timedelta(days=1),
+                tags=tags[j:j + 2],
+                updates=[
+                    models.PrayerRequestUpdate(id=request_id * 2 + k, title="Update", content="Answered " * 20,
+                                               date=now, prayerRequestId=request_id)
+                    for k in range(2)
+                ],
+            ))
+        entries.append(models.JournalEntry(
+            id=i, title=f"Entry {i}", content="Lorem ipsum " * 50, bibleVerses=json.dumps(["John 3:16", "Psalm 23"]),
+            createdAt=now, updatedAt=None, tags=tags[:3], prayerRequests=requests,
+        ))
+    return {
+        "tags": (List[Tag], tags * 10),
+        "prayer_requests": (List[PrayerRequest], [pr for entry in entries for pr in entry.prayerRequests][:PAGE_SIZE]),
+        "journal_entries": (List[JournalEntry], entries),
+    }
+
+async def fastapi_path(field, items) -> bytes:
+    # What FastAPI 0.104 does for a route with response_model and the default JSONResponse
+    content = await serialize_response(field=field, response_content=items, is_coroutine=True)
+    return JSONResponse(content).body
+
+def adapter_path(response_type, items) -> bytes:
+    adapter = serialization.adapter(response_type)
+    return adapter.dump_json(adapter.validate_python(items, from_attributes=True), by_alias=True)
+
+def compiled_path(response_type, items) -> bytes:
+    return serialization.to_json(response_type, items)
+
+def timed(function, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - start) / rounds * 1000
+
+async def main(rounds: int):
+    print(f"{'page':<18}{'response_model ms':>18}{'TypeAdapter ms':>16}{'compiled ms':>13}{'speedup':>9}")
+    for name, (response_type, items) in build_page().items():
+        field = create_response_field(name="Response", type_=response_type)
+        expected = json.loads(await fastapi_path(field, items))
+        assert json.loads(adapter_path(response_type, items)) == expected
+        assert json.loads(compiled_path(response_type, items)) == expected
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await fastapi_path(field, items)
+        baseline = (time.perf_counter() - start) / rounds * 1000
+        adapter = timed(lambda: adapter_path(response_type, items), rounds)
+        compiled = timed(lambda: compiled_path(response_type, items), rounds)
+        print(f"{name:<18}{baseline:>18.2f}{adapter:>16.2f}{compiled:>13.2f}{baseline / compiled:>8.1f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -0,0 +1,315 @@
+from functools import partial
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import reconcile
+import writer
+from database import get_async_db
+from schemas import (
+    BulkItemResult, BulkMode, BulkResult, PrayerRequestBulk, PrayerRequestUpdateBulk, TagBulk,
+)
+
+# bulk.py implements the /bulk endpoints, which create, update and delete many
+# rows in one call. Items are validated up front with one query per table, then
+# each operation is written with multi-row INSERTs and executemany UPDATE/DELETE
+# statements instead of one transaction per object.
+#
+# mode=atomic (the default) applies everything in one transaction and rejects the
+# whole call if any item fails. mode=partial commits each operation separately and
+# skips the items that fail, reporting them in the results. The writes go through
+# writer.run like those of the other write routes, as one operation in atomic mode
+# and one per operation (or per item, when finding the failing ones) otherwise.
+
+Write = Callable[[list, AsyncSession], Awaitable[List[int]]]
+
+def item_id(item) -> Optional[int]:
+    return item if isinstance(item, int) else getattr(item, "id", None)
+
+class BulkOperation:
+    def __init__(self, db: AsyncSession, mode: BulkMode):
+        self.db = db
+        self.mode = mode
+        self.results: List[BulkItemResult] = []
+        self.failed = False
+
+    def ok(self, op: str, index: int, id: Optional[int]):
+        self.results.append(BulkItemResult(op=op, index=index, id=id, status="ok"))
+
+    def error(self, op: str, index: int, detail: str, id: Optional[int] = None):
+        self.failed = True
+        self.results.append(BulkItemResult(op=op, index=index, id=id, status="error", detail=detail))
+
+    def check_validation(self, pending: Sequence[Tuple[str, List[Tuple[int, object]]]]):
+        # In atomic mode one invalid item rejects the call before anything is written.
+        if self.mode == "atomic" and self.failed:
+            for op, items in pending:
+                for index, item in items:
+                    self.results.append(BulkItemResult(op=op, index=index, id=item_id(item), status="skipped"))
+            raise HTTPException(status_code=400, detail=self.report(committed=False).model_dump())
+
+    async def apply(self, steps: Sequence[Tuple[str, List[Tuple[int, object]], Write]]) -> BulkResult:
+        # Each step is (op, items, write); write(items, session) applies a batch of
+        # items and returns their ids in order. Writes go through writer.run, so with
+        # WRITE_QUEUE they share the writer's transactions like the other routes.
+        if self.mode == "atomic":
+            await writer.run(self.db, partial(self.write_all, steps))
+        else:
+            for op, items, write in steps:
+                await self.write_partial(op, items, write)
+        return self.report(committed=True)
+
+    async def write_all(self, steps, session: AsyncSession):
+        for op, items, write in steps:
+            if not items:
+                continue
+            try:
+                ids = await write([item for _, item in items], session)
+            except SQLAlchemyError as exc:
+                for index, item in items:
+                    self.error(op, index, str(getattr(exc, "orig", None) or exc), item_id(item))
+                raise HTTPException(status_code=409, detail=self.report(committed=False).model_dump())
+            for (index, _), id in zip(items, ids):
+                self.ok(op, index, id)
+
+    async def write_partial(self, op: str, items: List[Tuple[int, object]], write: Write):
+        # One commit per operation; if it fails, one per item to find out which fail
+        if not items:
+            return
+        try:
+            ids = await writer.run(self.db, partial(write, [item for _, item in items]))
+        except SQLAlchemyError:
+            await self.db.rollback()
+            for index, item in items:
+                try:
+                    ids = await writer.run(self.db, partial(write, [item]))
+                    self.ok(op, index, ids[0])
+                except SQLAlchemyError as item_exc:
+                    await self.db.rollback()
+                    self.error(op, index, str(getattr(item_exc, "orig", None) or item_exc), item_id(item))
+            return
+        for (index, _), id in zip(items, ids):
+            self.ok(op, index, id)
+
+    def report(self, committed: bool) -> BulkResult:
+        order = {"create": 0, "update": 1, "delete": 2}
+        results = sorted(self.results, key=lambda result: (order[result.op], result.index))
+        return BulkResult(committed=committed, results=results)
+
+async def existing_ids(db: AsyncSession, column, ids, *criteria) -> set:
+    ids = set(ids)
+    if not ids:
+        return set()
+    result = await db.scalars(select(column).where(column.in_(ids), *criteria))
+    return set(result)
+
+router = APIRouter()
+
+# Tags
+@router.post("/tags/bulk", response_model=BulkResult)
+async def bulk_tags(payload: TagBulk, mode: BulkMode = "atomic", db: AsyncSession = Depends(get_async_db)):
+    bulk = BulkOperation(db, mode)
+
+    taken = set(await db.scalars(
+        select(models.Tag.name).where(
+            models.Tag.name.in_([tag.name for tag in payload.create] + [tag.name for tag in payload.update])
+        )
+    ))
+    known_ids = await existing_ids(db, models.Tag.id, [tag.id for tag in payload.update] + payload.delete)
+    updated_ids = {tag.id for tag in payload.update}
+    renamed = {tag.name for tag in payload.update}
+
+    creates, seen = [], set()
+    for index, tag in enumerate(payload.create):
+        if tag.name in taken or tag.name in seen or tag.name in renamed:
+            bulk.error("create", index, f"Tag name {tag.name!r} already exists")
+        else:
+            seen.add(tag.name)
+            creates.append((index, tag))
+
+    updates = []
+    for index, tag in enumerate(payload.update):
+        if tag.id not in known_ids:
+            bulk.error("update", index, "Tag not found", tag.id)
+        elif tag.name in seen:
+            bulk.error("update", index, f"Tag name {tag.name!r} already exists", tag.id)
+        else:
+            seen.add(tag.name)
+            updates.append((index, tag))
+    # A rename may take a name that another item in this batch gives up; only
+    # names held by tags outside the batch are rejected.
+    current_names = dict((await db.execute(
+        select(models.Tag.name, models.Tag.id).where(models.Tag.name.in_([tag.name for _, tag in updates]))
+    )).all())
+    for index, tag in list(updates):
+        owner = current_names.get(tag.name)
+        if owner is not None and owner != tag.id and owner not in updated_ids:
+            updates.remove((index, tag))
+            bulk.error("update", index, f"Tag name {tag.name!r} already exists", tag.id)
+
+    deletes = []
+    for index, tag_id in enumerate(payload.delete):
+        if tag_id not in known_ids:
+            bulk.error("delete", index, "Tag not found", tag_id)
+        else:
+            deletes.append((index, tag_id))
+
+    bulk.check_validation([("create", creates), ("update", updates), ("delete", deletes)])
+
+    async def create_tags(items, session):
+        ids_by_name = {}
+        for start in range(0, len(items), reconcile.INSERT_BATCH_SIZE):
+            batch = items[start:start + reconcile.INSERT_BATCH_SIZE]
+            result = await session.execute(
+                insert(models.Tag).values([{"name": tag.name} for tag in batch]).returning(models.Tag.id, models.Tag.name)
+            )
+            ids_by_name.update({name: id for id, name in result})
+        return [ids_by_name[tag.name] for tag in items]
+
+    async def update_tags(items, session):
+        await session.execute(update(models.Tag), [{"id": tag.id, "name": tag.name} for tag in items])
+        return [tag.id for tag in items]
+
+    async def delete_tags(tag_ids, session):
+        await session.execute(delete(models.journalTag).where(models.journalTag.c.tagId.in_(tag_ids)))
+        await session.execute(delete(models.prayerRequestTag).where(models.prayerRequestTag.c.tagId.in_(tag_ids)))
+        await session.execute(delete(models.Tag).where(models.Tag.id.in_(tag_ids)))
+        return tag_ids
+
+    return await bulk.apply([
+        ("create", creates, create_tags), ("update", updates, update_tags), ("delete", deletes, delete_tags),
+    ])
+
+# Prayer Requests
+@router.post("/prayer-requests/bulk", response_model=BulkResult)
+async def bulk_prayer_requests(payload: PrayerRequestBulk, mode: BulkMode = "atomic", db: AsyncSession = Depends(get_async_db)):
+    bulk = BulkOperation(db, mode)
+
+    items = payload.create + payload.update
+    tags_by_id = await reconcile.load_tags(db, {tag_id for item in items for tag_id in item.tags})
+    known_people = await existing_ids(
+        db, models.Person.id, {item.assignedToId for item in items if item.assignedToId is not None}
+    )
+    known_ids = await existing_ids(db, models.PrayerRequest.id, [item.id for item in payload.update] + payload.delete)
+
+    def validate(item) -> Optional[str]:
+        missing_tags = set(item.tags) - set(tags_by_id)
+        if missing_tags:
+            return f"Unknown tag ids: {sorted(missing_tags)}"
+        if item.assignedToId is not None and item.assignedToId not in known_people:
+            return "Assigned person not found"
+        return None
+
+    creates = []
+    for index, item in enumerate(payload.create):
+        problem = validate(item)
+        if problem:
+            bulk.error("create", index, problem)
+        else:
+            creates.append((index, item))
+
+    updates = []
+    for index, item in enumerate(payload.update):
+        problem = "Prayer request not found" if item.id not in known_ids else validate(item)
+        if problem:
+            bulk.error("update", index, problem, item.id)
+        else:
+            updates.append((index, item))
+
+    deletes = []
+    for index, request_id in enumerate(payload.delete):
+        if request_id not in known_ids:
+            bulk.error("delete", index, "Prayer request not found", request_id)
+        else:
+            deletes.append((index, request_id))
+
+    bulk.check_validation([("create", creates), ("update", updates), ("delete", deletes)])
+
+    async def create_requests(items, session):
+        return await reconcile.insert_prayer_requests(session, items, tags_by_id)
+
+    async def update_requests(items, session):
+        # Same semantics as PUT /prayer-requests/{id}: only fields present in the
+        # item are written, and tags are replaced when given.
+        rows = [item.model_dump(include=item.model_fields_set - {"tags"}) | {"id": item.id} for item in items]
+        await session.execute(update(models.PrayerRequest), rows)
+        retagged = [item for item in items if "tags" in item.model_fields_set]
+        if retagged:
+            await session.execute(
+                delete(models.prayerRequestTag)
+                .where(models.prayerRequestTag.c.prayerRequestId.in_([item.id for item in retagged]))
+            )
+            tag_rows = [
+                {"prayerRequestId": item.id, "tagId": tag_id}
+                for item in retagged
+                for tag_id in dict.fromkeys(item.tags)
+            ]
+            if tag_rows:
+                await session.execute(insert(models.prayerRequestTag), tag_rows)
+        return [item.id for item in items]
+
+    async def delete_requests(request_ids, session):
+        await reconcile.delete_prayer_requests(session, request_ids)
+        return request_ids
+
+    return await bulk.apply([
+        ("create", creates, create_requests), ("update", updates, update_requests), ("delete", deletes, delete_requests),
+    ])
+
+# Prayer Request Updates
+@router.post("/prayer-requests/{request_id}/updates/bulk", response_model=BulkResult)
+async def bulk_prayer_request_updates(request_id: int, payload: PrayerRequestUpdateBulk, mode: BulkMode = "atomic", db: AsyncSession = Depends(get_async_db)):
+    if await db.get(models.PrayerRequest, request_id) is None:
+        raise HTTPException(status_code=404, detail="Prayer request not found")
+    bulk = BulkOperation(db, mode)
+
+    known_ids = await existing_ids(
+        db, models.PrayerRequestUpdate.id, [item.id for item in payload.update] + payload.delete,
+        models.PrayerRequestUpdate.prayerRequestId == request_id,
+    )
+    creates = list(enumerate(payload.create))
+    updates, deletes = [], []
+    for index, item in enumerate(payload.update):
+        if item.id not in known_ids:
+            bulk.error("update", index, "Prayer request update not found", item.id)
+        else:
+            updates.append((index, item))
+    for index, update_id in enumerate(payload.delete):
+        if update_id not in known_ids:
+            bulk.error("delete", index, "Prayer request update not found", update_id)
+        else:
+            deletes.append((index, update_id))
+
+    bulk.check_validation([("create", creates), ("update", updates), ("delete", deletes)])
+
+    async def create_updates(items, session):
+        ids = []
+        for start in range(0, len(items), reconcile.INSERT_BATCH_SIZE):
+            batch = items[start:start + reconcile.INSERT_BATCH_SIZE]
+            result = await session.execute(
+                insert(models.PrayerRequestUpdate)
+                .values([{"title": item.title, "content": item.content, "prayerRequestId": request_id} for item in batch])
+                .returning(models.PrayerRequestUpdate.id)
+            )
+            # rowids are assigned in VALUES order (see reconcile.insert_prayer_requests)
+            ids += sorted(result.scalars())
+        return ids
+
+    async def update_updates(items, session):
+        await session.execute(
+            update(models.PrayerRequestUpdate),
+            [{"id": item.id, "title": item.title, "content": item.content} for item in items],
+        )
+        return [item.id for item in items]
+
+    async def delete_updates(update_ids, session):
+        await session.execute(delete(models.PrayerRequestUpdate).where(models.PrayerRequestUpdate.id.in_(update_ids)))
+        return update_ids
+
+    return await bulk.apply([
+        ("create", creates, create_updates), ("update", updates, update_updates), ("delete", deletes, delete_updates),
+    ])
@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+from fastapi import APIRouter, Request, Response
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+import config
+import models
+import serialization
+from database import current_tenant
+
+# cache.py holds in-process read caches:
+#
+# - tag_cache maps tag ids to (id, name) for the tag lookups done by nearly every
+#   write path. It is cleared when a transaction that wrote to the tags table
+#   commits (engine after_cursor_execute/commit and pool checkin events). Writes
+#   made by other processes are only picked up once entries expire, after
+#   TAG_CACHE_TTL.
+# - page_cache holds serialized list pages keyed by their ETag (see etags.py). The
+#   ETag already changes whenever a table the page is built from changes, so
+#   entries never need invalidating and are correct across processes.
+#
+# Both are bounded LRUs with a TTL and are safe to share between threads. With
+# SHARDING on (see shards.py) entries are keyed by tenant as well, and
+# forget_tenant() drops a tenant's entries when its database is moved or vacuumed.
+
+MISSING = object()
+
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        # Bumped by clear(); set() drops values read before the latest clear()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default=None):
+        with self.lock:
+            entry = self.entries.get(key, MISSING)
+            if entry is not MISSING and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not MISSING:
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        # Pass the generation read before loading value from the database, so a
+        # value loaded before a concurrent clear() isn't cached after it.
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def discard(self, predicate: Callable[[Hashable], bool]):
+        # Drops the entries whose key matches; like clear(), also values in flight
+        with self.lock:
+            for key in [key for key in self.entries if predicate(key)]:
+                del self.entries[key]
+            self.generation += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+tag_cache = LRUCache(config.TAG_CACHE_SIZE, config.TAG_CACHE_TTL)
+page_cache = LRUCache(config.PAGE_CACHE_SIZE, config.PAGE_CACHE_TTL)
+
+def forget_tenant(tenant: str):
+    for lru in (tag_cache, page_cache):
+        lru.discard(lambda key: key[0] == tenant)
+
+# Tags
+
+async def load_tags(db: AsyncSession, tag_ids: Iterable[int]) -> Dict[int, models.Tag]:
+    # Cached tags are attached to the session with merge(load=False), which emits no
+    # SQL; only ids missing from the cache are queried.
+    tenant = current_tenant()
+    tags_by_id = {}
+    missing = []
+    for tag_id in set(tag_ids):
+        row = tag_cache.get((tenant, tag_id))
+        if row is None:
+            missing.append(tag_id)
+            continue
+        tag = models.Tag(id=row[0], name=row[1])
+        make_transient_to_detached(tag)
+        tags_by_id[tag_id] = await db.merge(tag, load=False)
+
+    if missing:
+        generation = tag_cache.generation
+        result = await db.scalars(select(models.Tag).where(models.Tag.id.in_(missing)))
+        for tag in result:
+            tags_by_id[tag.id] = tag
+            tag_cache.set((tenant, tag.id), (tag.id, tag.name), generation)
+    return tags_by_id
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Flags the connection when a statement writes to the tags table. This sees ORM
+    # flushes and bulk INSERT/UPDATE/DELETE statements alike.
+    if context is None or not (context.isinsert or context.isupdate or context.isdelete):
+        return
+    table = getattr(getattr(context.compiled, "statement", None), "table", None)
+    if getattr(table, "name", None) == models.Tag.__tablename__:
+        conn.info["tags_written"] = True
+
+def _commit(conn):
+    # Runs just before the DBAPI commit; clear now and again once the connection
+    # is checked in, after the commit, so a lookup racing the commit can't leave
+    # a stale row behind.
+    if conn.info.pop("tags_written", False):
+        conn.info["tags_committed"] = True
+        tag_cache.clear()
+
+def _rollback(conn):
+    conn.info.pop("tags_written", None)
+
+def _checkin(dbapi_connection, connection_record):
+    if connection_record is not None and connection_record.info.pop("tags_committed", False):
+        tag_cache.clear()
+
+def install(sync_engine):
+    # Connection.info is the pool record's info, so the flags set on a connection
+    # are still there when it is checked back in.
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "commit", _commit)
+    event.listen(sync_engine, "rollback", _rollback)
+    event.listen(sync_engine, "checkin", _checkin)
+
+# List pages
+
+def cached_page(request: Request) -> Optional[Response]:
+    # Returns the cached body for this request's ETag, set by etags.conditional_get
+    etag = getattr(request.state, "etag", None)
+    if etag is None:
+        return None
+    cached = page_cache.get((current_tenant(), etag))
+    if cached is None:
+        return None
+    body, headers = cached
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def store_page(request: Request, response: Response, response_type, items) -> Response:
+    # Serializes items for response_model=response_type (see serialization.py) and
+    # keeps the result under the request's ETag.
+    page = serialization.json_response(response_type, items, response)
+    etag = getattr(request.state, "etag", None)
+    if etag is not None:
+        page_cache.set((current_tenant(), etag), (page.body, {name: value for name, value in page.headers.items() if name != "content-length"}))
+    return page
+
+router = APIRouter()
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return {"tags": tag_cache.stats(), "pages": page_cache.stats()}
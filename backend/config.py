@@ -0,0 +1,102 @@
+import os
+from dotenv import load_dotenv
+
+# config.py reads application settings from the environment (or a .env file in the
+# backend directory). Every setting has a default suitable for local development.
+
+load_dotenv()
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+def env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Database
+DATABASE_PATH = os.getenv("DATABASE_PATH", "./sql_app.db")
+
+# Apply pending schema migrations when the server starts (see migrations.py). With
+# it off, run python migrations.py upgrade before starting the server.
+MIGRATE_ON_STARTUP = env_bool("MIGRATE_ON_STARTUP", True)
+
+# "performance" enables WAL mode, connection pragmas and a pooled engine.
+# "default" keeps SQLite's stock settings (rollback journal, no pooling for async).
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "performance")
+SQLITE_PROFILES = ("default", "performance")
+if SQLITE_PROFILE not in SQLITE_PROFILES:
+    raise ValueError(f"SQLITE_PROFILE must be one of {SQLITE_PROFILES}, got {SQLITE_PROFILE!r}")
+
+SQLITE_MMAP_SIZE = env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)  # bytes
+SQLITE_CACHE_SIZE = env_int("SQLITE_CACHE_SIZE", -64 * 1024)  # negative means KiB
+SQLITE_BUSY_TIMEOUT_MS = env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+
+DB_POOL_SIZE = env_int("DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = env_int("DB_MAX_OVERFLOW", 20)
+DB_POOL_TIMEOUT = env_float("DB_POOL_TIMEOUT", 30.0)  # seconds
+
+# Query budgets (see querycount.py): "off", "warn" or "raise"
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "warn")
+# Report each request's statement count in an X-Query-Count header (benchmarks)
+QUERY_COUNT_HEADER = env_bool("QUERY_COUNT_HEADER", False)
+
+# Request profiling and GET /metrics (see metrics.py). Statements slower than
+# SLOW_QUERY_MS are kept in a slow-query log of SLOW_QUERY_LOG_SIZE statements,
+# with their EXPLAIN QUERY PLAN unless SLOW_QUERY_EXPLAIN is off.
+METRICS_ENABLED = env_bool("METRICS_ENABLED", True)
+SLOW_QUERY_MS = env_float("SLOW_QUERY_MS", 100.0)
+SLOW_QUERY_LOG_SIZE = env_int("SLOW_QUERY_LOG_SIZE", 100)
+SLOW_QUERY_EXPLAIN = env_bool("SLOW_QUERY_EXPLAIN", True)
+
+# Logging (see logconfig.py). LOG_FORMAT is "json" or "text".
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+if LOG_FORMAT not in ("json", "text"):
+    raise ValueError(f"LOG_FORMAT must be 'json' or 'text', got {LOG_FORMAT!r}")
+# Fraction of requests written to the access log; errors and requests slower than
+# ACCESS_LOG_SLOW_MS are always logged.
+ACCESS_LOG_SAMPLE_RATE = env_float("ACCESS_LOG_SAMPLE_RATE", 0.1)
+ACCESS_LOG_SLOW_MS = env_float("ACCESS_LOG_SLOW_MS", 500.0)
+
+# Server-Sent Events (see events.py)
+EVENTS_QUEUE_SIZE = env_int("EVENTS_QUEUE_SIZE", 256)  # events buffered per subscriber
+EVENTS_POLL_INTERVAL = env_float("EVENTS_POLL_INTERVAL", 2.0)  # seconds
+EVENTS_HEARTBEAT = env_float("EVENTS_HEARTBEAT", 15.0)  # seconds
+
+# In-process caches (see cache.py); a size of 0 disables a cache
+TAG_CACHE_SIZE = env_int("TAG_CACHE_SIZE", 1024)
+TAG_CACHE_TTL = env_float("TAG_CACHE_TTL", 60.0)  # seconds
+PAGE_CACHE_SIZE = env_int("PAGE_CACHE_SIZE", 256)
+PAGE_CACHE_TTL = env_float("PAGE_CACHE_TTL", 300.0)  # seconds
+
+# Group commit (see writer.py). With WRITE_QUEUE on, the write routes queue their
+# changes for a single writer task, which commits up to WRITE_BATCH_SIZE of them per
+# transaction and waits at most WRITE_BATCH_WAIT_MS for a batch to fill. Callers
+# wait for room once WRITE_QUEUE_SIZE operations are queued.
+WRITE_QUEUE = env_bool("WRITE_QUEUE", False)
+WRITE_BATCH_SIZE = env_int("WRITE_BATCH_SIZE", 64)
+WRITE_BATCH_WAIT_MS = env_float("WRITE_BATCH_WAIT_MS", 2.0)
+WRITE_QUEUE_SIZE = env_int("WRITE_QUEUE_SIZE", 1024)
+
+# Per-tenant databases (see shards.py). With SHARDING on, each request's
+# SHARD_HEADER picks its own SQLite file in SHARD_DIR. At most SHARD_MAX_OPEN
+# engines stay open; idle ones are closed after SHARD_IDLE_TIMEOUT seconds.
+SHARDING = env_bool("SHARDING", False)
+SHARD_DIR = os.getenv("SHARD_DIR", "./shards")
+SHARD_HEADER = os.getenv("SHARD_HEADER", "X-Tenant-ID")
+SHARD_MAX_OPEN = env_int("SHARD_MAX_OPEN", 64)
+SHARD_IDLE_TIMEOUT = env_float("SHARD_IDLE_TIMEOUT", 300.0)
+
+# Archive tier (see archive.py). Checked prayer requests untouched for
+# ARCHIVE_AFTER_DAYS are moved out of the hot tables every ARCHIVE_INTERVAL
+# seconds (0 disables the background job), ARCHIVE_BATCH_SIZE per transaction.
+ARCHIVE_AFTER_DAYS = env_int("ARCHIVE_AFTER_DAYS", 180)
+ARCHIVE_INTERVAL = env_float("ARCHIVE_INTERVAL", 3600.0)
+ARCHIVE_BATCH_SIZE = env_int("ARCHIVE_BATCH_SIZE", 200)
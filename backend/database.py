@@ -1,14 +1,111 @@
-from sqlalchemy import create_engine
+import time
+from contextvars import ContextVar
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+import config
+import metrics
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{config.DATABASE_PATH}"
+ASYNC_SQLALCHEMY_DATABASE_URL = f"sqlite+aiosqlite:///{config.DATABASE_PATH}"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Pragmas applied to every new connection by the "performance" profile. WAL lets
+# readers run while a writer commits, and busy_timeout makes a second writer wait
+# for the lock instead of failing straight away with "database is locked".
+PERFORMANCE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": config.SQLITE_MMAP_SIZE,
+    "cache_size": config.SQLITE_CACHE_SIZE,
+    "busy_timeout": config.SQLITE_BUSY_TIMEOUT_MS,
+    "temp_store": "MEMORY",
+}
+
+def apply_performance_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in PERFORMANCE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+class TimedPool:
+    # Reports the time each checkout waited for a connection to the request profile
+    # (see metrics.py); mixed into the pool classes below.
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            metrics.record_pool_wait(time.perf_counter() - started)
+
+class TimedQueuePool(TimedPool, QueuePool):
+    pass
+
+class TimedAsyncAdaptedQueuePool(TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+def pool_options(poolclass):
+    if config.SQLITE_PROFILE != "performance":
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+    }
+
+def create_sqlite_engine(url: str):
+    sqlite_engine = create_engine(
+        url, connect_args={"check_same_thread": False}, **pool_options(TimedQueuePool)
+    )
+    if config.SQLITE_PROFILE == "performance":
+        event.listen(sqlite_engine, "connect", apply_performance_pragmas)
+    return sqlite_engine
+
+def create_async_sqlite_engine(url: str):
+    # aiosqlite defaults to NullPool, which opens a new connection (and thread)
+    # for every session; the performance profile keeps a pool of them instead.
+    sqlite_engine = create_async_engine(
+        url, connect_args={"check_same_thread": False}, **pool_options(TimedAsyncAdaptedQueuePool)
+    )
+    if config.SQLITE_PROFILE == "performance":
+        event.listen(sqlite_engine.sync_engine, "connect", apply_performance_pragmas)
+    return sqlite_engine
+
+engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine used by the API routes. aiosqlite runs each connection on its own
+# thread, so route handlers await the database instead of holding a threadpool worker.
+async_engine = create_async_sqlite_engine(ASYNC_SQLALCHEMY_DATABASE_URL)
+
+# The tenant database (see shards.py) the current request or job works on, if any
+current_shard: ContextVar = ContextVar("current_shard", default=None)
+
+def current_tenant():
+    shard = current_shard.get()
+    return shard.key if shard is not None else None
+
+class RoutingSession(Session):
+    # Sends sessions to the current tenant's database. With SHARDING on there is no
+    # shared database to fall back to, so a request without a tenant can't query.
+    def get_bind(self, mapper=None, **kw):
+        shard = current_shard.get()
+        if shard is not None:
+            return shard.engine.sync_engine
+        if config.SHARDING:
+            raise HTTPException(status_code=400, detail=f"Missing {config.SHARD_HEADER} header")
+        return super().get_bind(mapper, **kw)
+
+# expire_on_commit=False keeps loaded attributes usable after commit; lazy loads
+# are not allowed outside of the session's greenlet.
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
 # Dependency
@@ -17,4 +114,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+# Async dependency
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
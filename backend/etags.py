@@ -0,0 +1,111 @@
+from email.utils import formatdate, parsedate_to_datetime
+from hashlib import blake2b
+from typing import Optional, Sequence
+
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import current_tenant, engine, get_async_db
+
+# etags.py adds conditional GET support. Every table carries a version counter in
+# TableVersions that triggers bump on each insert, update and delete, so writes made
+# through the ORM, Core bulk statements and imports are all counted. A GET route
+# reads the counters of the tables its response is built from (one indexed query),
+# derives a strong ETag and Last-Modified from them, and answers 304 Not Modified
+# before loading or serializing anything when the client's copy is current.
+
+# Tables each response is built from. The archive tables (see archive.py) only
+# change when requests are moved out of PrayerRequests, so they need no counter.
+TAG_TABLES = ("tags",)
+PRAYER_REQUEST_UPDATE_TABLES = ("PrayerRequestUpdates",)
+PRAYER_REQUEST_TABLES = ("PrayerRequests", "PrayerRequestTag", "PrayerRequestUpdates", "Person", "tags")
+JOURNAL_ENTRY_TABLES = ("JournalEntries", "JournalTag", "journal_prayer_request") + PRAYER_REQUEST_TABLES
+TAG_FACET_TABLES = ("tags", "JournalTag", "PrayerRequestTag")
+
+VERSIONED_TABLES = tuple(dict.fromkeys(
+    TAG_TABLES + PRAYER_REQUEST_UPDATE_TABLES + PRAYER_REQUEST_TABLES + JOURNAL_ENTRY_TABLES
+))
+
+# A TableVersions row that isn't a table: a random number drawn when the database
+# is created (and again when shards.py moves it), read along with the counters for
+# every ETag. A database recreated under the same name starts its counters from
+# zero again, and this keeps it from reproducing the old database's ETags.
+DATABASE_ROW = "database"
+
+def version_schema_statements():
+    statements = [
+        f'INSERT OR IGNORE INTO "TableVersions" ("tableName", version, "modifiedAt") '
+        f"VALUES ('{DATABASE_ROW}', abs(random()), CAST(strftime('%s', 'now') AS INTEGER))"
+    ]
+    for table in VERSIONED_TABLES:
+        statements.append(
+            f'INSERT OR IGNORE INTO "TableVersions" ("tableName", version, "modifiedAt") '
+            f"VALUES ('{table}', 0, CAST(strftime('%s', 'now') AS INTEGER))"
+        )
+        for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE")):
+            statements.append(
+                f'CREATE TRIGGER IF NOT EXISTS "{table}_version_{suffix}" AFTER {event} ON "{table}" BEGIN '
+                f'UPDATE "TableVersions" SET version = version + 1, '
+                f"\"modifiedAt\" = CAST(strftime('%s', 'now') AS INTEGER) "
+                f"WHERE \"tableName\" = '{table}'; END"
+            )
+    return statements
+
+def create_version_schema(bind=engine):
+    models.TableVersion.__table__.create(bind=bind, checkfirst=True)
+    with bind.begin() as connection:
+        for statement in version_schema_statements():
+            connection.execute(text(statement))
+
+def make_etag(request: Request, versions) -> str:
+    # The same URL (path and query string) over the same table versions always
+    # renders the same body, so the ETag can be strong. Tenants (see shards.py) can
+    # have the same versions, so their key is part of it too, as is DATABASE_ROW.
+    key = f"{request.url.path}?{request.url.query}|" + ",".join(f"{name}:{version}" for name, version in versions)
+    tenant = current_tenant()
+    if tenant is not None:
+        key = f"{tenant}|{key}"
+    return '"' + blake2b(key.encode(), digest_size=12).hexdigest() + '"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses weak comparison, so a W/ prefix is ignored.
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
+
+def not_modified_since(if_modified_since: str, modified_at: int) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return since.timestamp() >= modified_at
+
+def conditional_get(tables: Sequence[str]):
+    # Route dependency: sets ETag, Last-Modified and Cache-Control on the response,
+    # or raises a 304 before the route body runs when the client's copy is current.
+    async def check(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+        rows = (await db.execute(
+            select(models.TableVersion.tableName, models.TableVersion.version, models.TableVersion.modifiedAt)
+            .where(models.TableVersion.tableName.in_((*tables, DATABASE_ROW)))
+            .order_by(models.TableVersion.tableName)
+        )).all()
+        etag = make_etag(request, [(name, version) for name, version, _ in rows])
+        modified_at: Optional[int] = max((row.modifiedAt for row in rows), default=None)
+
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if modified_at:
+            headers["Last-Modified"] = formatdate(modified_at, usegmt=True)
+
+        if_none_match = request.headers.get("if-none-match")
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_none_match is not None:
+            not_modified = etag_matches(if_none_match, etag)
+        else:
+            not_modified = bool(if_modified_since and modified_at and not_modified_since(if_modified_since, modified_at))
+        if not_modified:
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+        request.state.etag = etag
+
+    return Depends(check)
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional, Set
+
+from fastapi import APIRouter, Header, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import event, func, select
+
+import config
+import models
+from database import AsyncSessionLocal, current_tenant
+
+# events.py serves GET /events, a Server-Sent Events feed of create, update and
+# delete events for journal entries, prayer requests, updates and tags.
+#
+# Events come from the SyncChanges log (see sync.py). A commit hook on the engine
+# wakes the hub, which reads the new log rows once and fans them out to every
+# subscriber, so the cost per commit doesn't grow with the number of connections.
+# The hub also polls every EVENTS_POLL_INTERVAL seconds to pick up commits made by
+# other processes.
+#
+# Each event's id is the seq of its log row, which is also a /sync token: a client
+# that reconnects with Last-Event-ID gets the events it missed. When it missed too
+# many, it gets a "resync" event instead and should call /sync?since=<its last
+# event id>; live events keep coming on the same connection. A subscriber whose
+# queue fills up is disconnected and replays on reconnect. Several changes to one
+# entity between two reads collapse into the latest one, so clients should treat
+# "create" and "update" alike as "this entity changed".
+#
+# With SHARDING on (see shards.py) each tenant has a hub of its own, reading that
+# tenant's log; the hub's task keeps the tenant of the request that started it.
+
+logger = logging.getLogger(__name__)
+
+# Most events replayed to a reconnecting client before it is told to resync instead
+MAX_REPLAY = 1000
+
+def format_event(seq: int, entity_type: str, entity_id: int, op: str) -> str:
+    data = json.dumps({"type": entity_type, "id": entity_id, "op": op})
+    return f"id: {seq}\nevent: {op}\ndata: {data}\n\n"
+
+class Subscriber:
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+class Hub:
+    def __init__(self, queue_size: int, poll_interval: float):
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.subscribers: Set[Subscriber] = set()
+        self.last_seq: Optional[int] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.starting = asyncio.Lock()
+        self.dropped = 0
+
+    async def subscribe(self) -> Subscriber:
+        async with self.starting:
+            if self.task is None or self.task.done():
+                await self.start()
+        subscriber = Subscriber(self.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        async with AsyncSessionLocal() as db:
+            self.last_seq = await db.scalar(select(func.coalesce(func.max(models.SyncChange.seq), 0)))
+        self.task = asyncio.create_task(self.run())
+
+    def notify(self):
+        # Called from the commit hook, possibly on another thread
+        if self.loop is not None and self.wakeup is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def run(self):
+        while self.subscribers:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.publish_new_changes()
+            except Exception:
+                logger.exception("Failed to read the change log")
+        self.task = None
+
+    async def publish_new_changes(self):
+        while True:
+            async with AsyncSessionLocal() as db:
+                changes = await read_changes(db, self.last_seq, 500)
+            if not changes:
+                return
+            # No awaits between here and the end of the loop body, so last_seq and
+            # what subscribers have received always agree (see stream()).
+            self.last_seq = changes[-1].seq
+            for subscriber in list(self.subscribers):
+                self.deliver(subscriber, changes)
+            if len(changes) < 500:
+                return
+
+    def deliver(self, subscriber: Subscriber, changes):
+        for change in changes:
+            try:
+                subscriber.queue.put_nowait(format_event(change.seq, change.entityType, change.entityId, change.op))
+            except asyncio.QueueFull:
+                # A consumer that can't keep up is dropped rather than buffered
+                # without bound; it can reconnect with Last-Event-ID.
+                subscriber.dropped = True
+                self.dropped += 1
+                self.unsubscribe(subscriber)
+                return
+
+async def read_changes(db, after_seq: int, limit: int) -> List:
+    return (await db.execute(
+        select(models.SyncChange.seq, models.SyncChange.entityType, models.SyncChange.entityId, models.SyncChange.op)
+        .where(models.SyncChange.seq > after_seq)
+        .order_by(models.SyncChange.seq)
+        .limit(limit)
+    )).all()
+
+# Tenant key (None without sharding) -> its hub
+hubs: Dict[Optional[str], Hub] = {}
+
+def hub_for(key: Optional[str]) -> Hub:
+    hub = hubs.get(key)
+    if hub is None:
+        hub = hubs[key] = Hub(config.EVENTS_QUEUE_SIZE, config.EVENTS_POLL_INTERVAL)
+    return hub
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+        conn.info["events_pending"] = True
+
+def _commit(conn):
+    if conn.info.pop("events_pending", False):
+        conn.info["events_committed"] = True
+
+def _rollback(conn):
+    conn.info.pop("events_pending", None)
+
+def install(sync_engine, key: Optional[str] = None):
+    # key is the tenant whose hub commits on this engine wake
+    def checkin(dbapi_connection, connection_record):
+        # After the commit, once the connection is back in the pool
+        if connection_record is not None and connection_record.info.pop("events_committed", False):
+            hub = hubs.get(key)
+            if hub is not None:
+                hub.notify()
+
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "commit", _commit)
+    event.listen(sync_engine, "rollback", _rollback)
+    event.listen(sync_engine, "checkin", checkin)
+
+async def stream(request: Request, last_event_id: Optional[int]):
+    hub = hub_for(current_tenant())
+    subscriber = await hub.subscribe()
+    # Everything up to joined_at was published before this subscriber joined, and
+    # everything after it will reach its queue; replay the gap from the log.
+    joined_at = hub.last_seq
+    try:
+        if last_event_id is not None and last_event_id < joined_at:
+            async with AsyncSessionLocal() as db:
+                missed = await read_changes(db, last_event_id, MAX_REPLAY + 1)
+            missed = [change for change in missed if change.seq <= joined_at]
+            if len(missed) > MAX_REPLAY:
+                yield f"event: resync\ndata: {json.dumps({'since': last_event_id})}\n\n"
+            else:
+                for change in missed:
+                    yield format_event(change.seq, change.entityType, change.entityId, change.op)
+
+        yield ": connected\n\n"
+        while not subscriber.dropped:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), timeout=config.EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": ping\n\n"
+                continue
+            yield message
+    finally:
+        hub.unsubscribe(subscriber)
+
+router = APIRouter()
+
+@router.get("/events")
+async def events(request: Request, last_event_id: Optional[str] = Header(None)):
+    try:
+        since = int(last_event_id) if last_event_id else None
+    except ValueError:
+        since = None
+    return StreamingResponse(
+        stream(request, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/events/stats")
+async def event_stats():
+    hub = hub_for(current_tenant())
+    return {"subscribers": len(hub.subscribers), "lastSeq": hub.last_seq, "dropped": hub.dropped}
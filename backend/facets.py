@@ -0,0 +1,147 @@
+import sys
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, Response
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.schema import CreateTable
+
+import etags
+import models
+import serialization
+from database import engine, get_async_db
+from schemas import TagFacet
+
+# facets.py adds server-side tag filtering to the journal entry and prayer request
+# lists (?tags=1&tags=2&tag_match=all|any) and serves GET /tags/facets, the number of
+# entries and requests using each tag.
+#
+# Filters read the association tables through their (tagId, owner id) reverse
+# indexes. Counts live in TagUsage, which triggers on the association tables adjust
+# by one on every link and unlink, so /tags/facets reads one row per tag however
+# many rows are tagged.
+
+TagMatch = Literal["all", "any"]
+
+# association table -> (owner id column, TagUsage counter)
+TAG_LINKS = {
+    "JournalTag": ("journalId", "journalEntries"),
+    "PrayerRequestTag": ("prayerRequestId", "prayerRequests"),
+}
+
+def filter_by_tags(stmt, owner_id, association, tag_ids: Optional[List[int]], match: TagMatch = "all"):
+    # Narrows stmt to the owners linked to all (or any) of tag_ids
+    if not tag_ids:
+        return stmt
+    tag_ids = list(dict.fromkeys(tag_ids))
+    owner_column = next(column for column in association.c if column.name != "tagId")
+    linked = select(owner_column).where(association.c.tagId.in_(tag_ids))
+    if match == "all" and len(tag_ids) > 1:
+        # Links are unique per (owner, tag), so an owner with every tag has one
+        # link row per requested tag
+        linked = linked.group_by(owner_column).having(func.count() == len(tag_ids))
+    return stmt.where(owner_id.in_(linked))
+
+def adjust(table: str, tag_sql: str, delta: int) -> str:
+    counter = TAG_LINKS[table][1]
+    initial = max(delta, 0)
+    return (
+        f'INSERT INTO "TagUsage" ("tagId", "journalEntries", "prayerRequests") '
+        f"VALUES ({tag_sql}, {initial if counter == 'journalEntries' else 0}, "
+        f"{initial if counter == 'prayerRequests' else 0}) "
+        f'ON CONFLICT ("tagId") DO UPDATE SET "{counter}" = "{counter}" + ({delta});'
+    )
+
+def facet_schema_statements():
+    statements = [
+        'CREATE TRIGGER IF NOT EXISTS "tags_usage_ai" AFTER INSERT ON "tags" BEGIN '
+        'INSERT OR IGNORE INTO "TagUsage" ("tagId", "journalEntries", "prayerRequests") VALUES (new.id, 0, 0); END',
+        'CREATE TRIGGER IF NOT EXISTS "tags_usage_ad" AFTER DELETE ON "tags" BEGIN '
+        'DELETE FROM "TagUsage" WHERE "tagId" = old.id; END',
+    ]
+    for table in TAG_LINKS:
+        added, removed = adjust(table, 'new."tagId"', 1), adjust(table, 'old."tagId"', -1)
+        statements += [
+            f'CREATE TRIGGER IF NOT EXISTS "{table}_usage_ai" AFTER INSERT ON "{table}" BEGIN {added} END',
+            f'CREATE TRIGGER IF NOT EXISTS "{table}_usage_ad" AFTER DELETE ON "{table}" BEGIN {removed} END',
+            f'CREATE TRIGGER IF NOT EXISTS "{table}_usage_au" AFTER UPDATE OF "tagId" ON "{table}" BEGIN '
+            f'{removed} {added} END',
+        ]
+    return statements
+
+def add_primary_key(connection, table):
+    # Association tables created before they had a primary key are rebuilt with
+    # one. SQLite can't add a key to an existing table, so the links are copied
+    # (without duplicates) into a new table that then takes the old one's name.
+    columns = list(connection.execute(text(f'PRAGMA table_info("{table.name}")')))
+    if any(column.pk for column in columns):
+        return
+    names = ", ".join(f'"{column.name}"' for column in table.columns)
+    not_null = " AND ".join(f'"{column.name}" IS NOT NULL' for column in table.columns)
+    rebuilt = f"{table.name}_rebuilt"
+    create = str(CreateTable(table).compile(dialect=connection.dialect))
+    # Other tables' triggers name the table while it is briefly missing; the legacy
+    # rename skips checking them
+    connection.execute(text("PRAGMA legacy_alter_table = ON"))
+    connection.execute(text(create.replace(f'"{table.name}"', f'"{rebuilt}"', 1)))
+    connection.execute(text(
+        f'INSERT OR IGNORE INTO "{rebuilt}" ({names}) SELECT {names} FROM "{table.name}" WHERE {not_null}'
+    ))
+    connection.execute(text(f'DROP TABLE "{table.name}"'))
+    connection.execute(text(f'ALTER TABLE "{rebuilt}" RENAME TO "{table.name}"'))
+    connection.execute(text("PRAGMA legacy_alter_table = OFF"))
+    for index in table.indexes:
+        index.create(bind=connection, checkfirst=True)
+
+def create_facet_schema(bind=engine):
+    # Runs before the etags and sync schemas, which recreate their triggers on a
+    # rebuilt association table
+    with bind.begin() as connection:
+        for table in (models.journalTag, models.prayerRequestTag):
+            add_primary_key(connection, table)
+        models.TagUsage.__table__.create(bind=connection, checkfirst=True)
+        for statement in facet_schema_statements():
+            connection.execute(text(statement))
+        # Triggers give every new tag a row, so a tag without one predates them
+        uncounted = connection.execute(text(
+            'SELECT EXISTS (SELECT 1 FROM tags WHERE id NOT IN (SELECT "tagId" FROM "TagUsage"))'
+        )).scalar()
+    if uncounted:
+        rebuild_tag_usage(bind)
+
+def rebuild_tag_usage(bind=engine):
+    # Recounts every tag from the association tables
+    with bind.begin() as connection:
+        connection.execute(text('DELETE FROM "TagUsage"'))
+        connection.execute(text(
+            'INSERT INTO "TagUsage" ("tagId", "journalEntries", "prayerRequests") SELECT id, '
+            '(SELECT count(*) FROM "JournalTag" WHERE "tagId" = tags.id), '
+            '(SELECT count(*) FROM "PrayerRequestTag" WHERE "tagId" = tags.id) FROM tags'
+        ))
+
+router = APIRouter()
+
+@router.get(
+    "/tags/facets",
+    response_model=List[TagFacet],
+    dependencies=[etags.conditional_get(etags.TAG_FACET_TABLES)],
+)
+async def read_tag_facets(response: Response, db: AsyncSession = Depends(get_async_db)):
+    rows = (await db.execute(
+        select(
+            models.Tag.id,
+            models.Tag.name,
+            func.coalesce(models.TagUsage.journalEntries, 0).label("journalEntries"),
+            func.coalesce(models.TagUsage.prayerRequests, 0).label("prayerRequests"),
+        )
+        .outerjoin(models.TagUsage, models.TagUsage.tagId == models.Tag.id)
+        .order_by(models.Tag.id)
+    )).all()
+    return serialization.json_response(List[TagFacet], rows, response)
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python facets.py rebuild")
+    create_facet_schema()
+    rebuild_tag_usage()
+    print("Tag usage counts rebuilt")
@@ -0,0 +1,68 @@
+from functools import lru_cache
+from typing import Literal, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import ConfigDict, create_model
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, load_only, raiseload, selectinload
+
+from loaders import PLANS
+
+# fieldsets.py lets the list routes send part of each row. ?view=summary answers
+# with the route's summary model (schemas.*Summary: ids, titles and dates), and
+# ?fields=title,createdAt with just the named fields of the full model (plus id).
+# Either way the query selects only the columns behind those fields (load_only),
+# so long journal entries and prayer requests no longer make list pages bigger or
+# slower to load, and loads only the relationships among them, with the plan from
+# loaders.py for the related rows. Everything else raises if touched instead of
+# loading lazily, so a field missing from a plan fails loudly rather than costing
+# a query per row. Without either parameter a route answers as before.
+
+View = Literal["full", "summary"]
+
+# Model properties computed from mapped attributes rather than mapped themselves,
+# with the columns or relationships they read
+DERIVED_FIELDS = {
+    "bibleVersesList": ("bibleVerses",),
+    "prayerRequestsWithArchived": ("prayerRequests", "archivedPrayerRequests"),
+}
+
+def field_key(name: str, field) -> str:
+    return field.alias or name
+
+@lru_cache(maxsize=None)
+def subset_model(model, keys: Tuple[str, ...]) -> type:
+    fields = {
+        name: (field.annotation, field)
+        for name, field in model.model_fields.items() if field_key(name, field) in keys
+    }
+    return create_model(
+        f"{model.__name__}Fields", __config__=ConfigDict(from_attributes=True, populate_by_name=True), **fields
+    )
+
+def response_type(model, summary, view: View, fields: Optional[str]) -> type:
+    if fields is None:
+        return summary if view == "summary" else model
+    if view != "full":
+        raise HTTPException(status_code=400, detail="Pass either fields or view, not both")
+    keys = {key.strip() for key in fields.split(",") if key.strip()}
+    unknown = sorted(keys - {field_key(name, field) for name, field in model.model_fields.items()})
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return subset_model(model, tuple(sorted(keys | {"id"})))
+
+def plan(entity, response_type) -> tuple:
+    # Loader options for rows of entity sent as response_type. The full response
+    # model gets the same relationships as its plan in loaders.py.
+    mapper = inspect(entity)
+    columns, options = [], []
+    for name, field in response_type.model_fields.items():
+        source = field.validation_alias if isinstance(field.validation_alias, str) else field_key(name, field)
+        for attribute in DERIVED_FIELDS.get(source, (source,)):
+            if attribute in mapper.relationships:
+                relationship = mapper.relationships[attribute]
+                loader = selectinload if relationship.uselist else joinedload
+                options.append(loader(getattr(entity, attribute)).options(*PLANS.get(relationship.mapper.class_, ())))
+            else:
+                columns.append(getattr(entity, attribute))
+    return (load_only(*columns, raiseload=True), *options, raiseload("*"))
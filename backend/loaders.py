@@ -0,0 +1,46 @@
+from sqlalchemy.orm import joinedload, selectinload
+
+import models
+
+# loaders.py holds the eager-loading plan for each response model in main.py.
+# A plan loads every relationship the response model serializes, so rendering a
+# page of N rows costs a fixed number of queries instead of one per row and
+# relationship. Collections use selectinload (one extra IN query per
+# relationship); many-to-one relationships are joined into the main query.
+# Nested plans reuse the plan of the nested response model.
+
+TAG_PLAN = ()
+
+PRAYER_REQUEST_UPDATE_PLAN = ()
+
+PRAYER_REQUEST_PLAN = (
+    selectinload(models.PrayerRequest.tags).options(*TAG_PLAN),
+    selectinload(models.PrayerRequest.updates).options(*PRAYER_REQUEST_UPDATE_PLAN),
+    joinedload(models.PrayerRequest.assignedTo),
+)
+
+ARCHIVED_PRAYER_REQUEST_PLAN = (
+    selectinload(models.ArchivedPrayerRequest.tags).options(*TAG_PLAN),
+    selectinload(models.ArchivedPrayerRequest.updates).options(*PRAYER_REQUEST_UPDATE_PLAN),
+    joinedload(models.ArchivedPrayerRequest.assignedTo),
+)
+
+JOURNAL_ENTRY_PLAN = (
+    selectinload(models.JournalEntry.tags).options(*TAG_PLAN),
+    selectinload(models.JournalEntry.prayerRequests).options(*PRAYER_REQUEST_PLAN),
+)
+
+JOURNAL_ENTRY_WITH_ARCHIVED_PLAN = JOURNAL_ENTRY_PLAN + (
+    selectinload(models.JournalEntry.archivedPrayerRequests).options(*ARCHIVED_PRAYER_REQUEST_PLAN),
+)
+
+# The plan for each model's rows wherever they are loaded, e.g. as a relationship
+# picked with ?fields= (see fieldsets.py). Models missing here need no plan.
+PLANS = {
+    models.Tag: TAG_PLAN,
+    models.PrayerRequestUpdate: PRAYER_REQUEST_UPDATE_PLAN,
+    models.ArchivedPrayerRequestUpdate: PRAYER_REQUEST_UPDATE_PLAN,
+    models.PrayerRequest: PRAYER_REQUEST_PLAN,
+    models.ArchivedPrayerRequest: ARCHIVED_PRAYER_REQUEST_PLAN,
+    models.JournalEntry: JOURNAL_ENTRY_PLAN,
+}
@@ -0,0 +1,80 @@
+import json
+import logging
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+from fastapi import Request
+
+import config
+
+# logconfig.py sets up application logging: the level and format come from config,
+# records are written one JSON object per line (or as plain text for local
+# development), and access_log_middleware logs a sample of requests with timing.
+
+access_logger = logging.getLogger("access")
+
+# Attributes every LogRecord has; anything else was passed through extra= and is
+# written as a field of its own.
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def configure_logging():
+    handler = logging.StreamHandler(sys.stdout)
+    if config.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    # Replace rather than add, so importing the app twice doesn't double every line
+    root.handlers = [handler]
+    root.setLevel(config.LOG_LEVEL)
+
+def should_log(status_code: int, duration_ms: float) -> bool:
+    # Errors and slow requests are always logged; the rest are sampled.
+    if status_code >= 500 or duration_ms >= config.ACCESS_LOG_SLOW_MS:
+        return True
+    return random.random() < config.ACCESS_LOG_SAMPLE_RATE
+
+async def access_log_middleware(request: Request, call_next):
+    if not access_logger.isEnabledFor(logging.INFO):
+        return await call_next(request)
+
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        if should_log(status_code, duration_ms):
+            route = request.scope.get("route")
+            # Where the time went, from metrics.metrics_middleware
+            profile = getattr(request.state, "profile", None)
+            access_logger.info(
+                "%s %s %d %.1fms", request.method, request.url.path, status_code, duration_ms,
+                extra={
+                    "method": request.method,
+                    "path": request.url.path,
+                    "route": getattr(route, "path", None),
+                    "status": status_code,
+                    "durationMs": round(duration_ms, 2),
+                    **(profile.as_dict() if profile is not None else {}),
+                },
+            )
@@ -1,30 +1,48 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session, joinedload
-from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Union
+import archive
+import backup
+import bulk
+import cache
+import config
+import etags
+import events
+import facets
+import fieldsets
 import models
-from database import SessionLocal, engine
-from pydantic import BaseModel, Field
-from datetime import datetime
+import querycount
+import reconcile
+import search
+import serialization
+import shards
+import stats
+import sync
+import verses
+import writer
+from database import async_engine, get_async_db
+from loaders import ARCHIVED_PRAYER_REQUEST_PLAN, JOURNAL_ENTRY_PLAN, JOURNAL_ENTRY_WITH_ARCHIVED_PLAN, PRAYER_REQUEST_PLAN, PRAYER_REQUEST_UPDATE_PLAN, TAG_PLAN
+from pagination import (
+    ARCHIVED_PRAYER_REQUEST_KEY, JOURNAL_ENTRY_KEY, PRAYER_REQUEST_KEY, TAG_KEY,
+    fetch_merged_page, fetch_page, set_next_cursor,
+)
+from schemas import (
+    JournalEntry, JournalEntryCreate, JournalEntrySummary, JournalEntryWithArchived, PrayerRequest, PrayerRequestCreate, PrayerRequestSummary,
+    PrayerRequestUpdate, PrayerRequestUpdateCreate, PrayerRequestUpdateSummary, Tag, TagCreate,
+)
 import json
 import logging
+import logconfig
+import metrics
+import migrations
 import uvicorn
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging (level and format from config.py)
+logconfig.configure_logging()
 logger = logging.getLogger(__name__)
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
-
-# Dependency to get database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-app = FastAPI()
+app = FastAPI(default_response_class=serialization.DefaultResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -36,366 +54,350 @@ app.add_middleware(
     max_age=3600,  # Cache preflight requests for 1 hour
 )
 
-# Pydantic models for request/response
-class TagBase(BaseModel):
-    name: str
-
-class TagCreate(TagBase):
-    pass
-
-class Tag(TagBase):
-    id: int
-    class Config:
-        from_attributes = True
-
-class PrayerRequestUpdateBase(BaseModel):
-    title: str
-    content: str
-
-class PrayerRequestUpdateCreate(PrayerRequestUpdateBase):
-    pass
-
-class PrayerRequestUpdate(PrayerRequestUpdateBase):
-    id: int
-    date: datetime
-    prayerRequestId: int = Field(alias="prayer_request_id")
-    class Config:
-        from_attributes = True
-        populate_by_name = True
-        json_encoders = {
-            datetime: lambda v: v.isoformat()
-        }
-
-class PrayerRequestBase(BaseModel):
-    title: str
-    description: str
-    assignedTo: Optional["Person"] = None
-    tags: List[int] = []
-
-class PrayerRequestCreate(PrayerRequestBase):
-    pass
-
-class PrayerRequest(PrayerRequestBase):
-    id: int
-    created_at: datetime
-    updated_at: Optional[datetime]
-    updates: List[PrayerRequestUpdate] = []
-    tags: List[Tag] = []
-    model_config = {
-        "from_attributes": True,
-        "populate_by_name": True,
-        "alias_generator": lambda x: x.split('_')[0] + ''.join(word.capitalize() for word in x.split('_')[1:]),
-        "json_encoders": {
-            datetime: lambda v: v.isoformat()
-        }
-    }
-
-class PrayerRequestInJournalEntry(BaseModel):
-    title: str
-    description: Optional[str] = None
-    checked: bool = False
-    assignedToId: Optional[int] = None
-    tags: List[int] = []
-    id: Optional[int] = None
-
-class JournalEntryBase(BaseModel):
-    title: Optional[str] = None
-    content: str
-    bibleVerses: List[str] = []
-    tags: List[int] = []
-    prayerRequests: List[PrayerRequestInJournalEntry] = []
-
-class JournalEntryCreate(JournalEntryBase):
-    pass
-
-class JournalEntry(JournalEntryBase):
-    id: int
-    createdAt: datetime = Field(alias="created_at")
-    updatedAt: Optional[datetime] = Field(alias="updated_at")
-    tags: List[Tag] = []
-    prayerRequests: List[PrayerRequestInJournalEntry] = Field(alias="prayer_requests")
-    model_config = {
-        "from_attributes": True,
-        "populate_by_name": True,
-        "json_encoders": {
-            datetime: lambda v: v.isoformat()
-        },
-        "alias_generator": lambda x: x.split('_')[0] + ''.join(word.capitalize() for word in x.split('_')[1:])
-    }
+# Send each request to its tenant's database (SHARDING); added first so it runs
+# innermost, right around the routes
+app.middleware("http")(shards.shard_middleware)
+# Count SQL statements per request and check them against querycount.QUERY_BUDGETS
+querycount.install(async_engine.sync_engine)
+app.middleware("http")(querycount.query_budget_middleware)
+# Per-route SQL, pool and serialization timings for GET /metrics (the writer's
+# statements only reach the slow-query log: they run outside any request)
+metrics.install(async_engine.sync_engine)
+metrics.install(writer.engine.sync_engine)
+app.middleware("http")(metrics.metrics_middleware)
+# Added last so it runs outermost and times the whole request
+app.middleware("http")(logconfig.access_log_middleware)
+
+for sync_engine in (async_engine.sync_engine, writer.engine.sync_engine):
+    # Clear cached tags whenever a transaction that wrote to the tags table commits
+    cache.install(sync_engine)
+    # Wake the /events hub after every commit that wrote something
+    events.install(sync_engine)
+
+app.include_router(search.router)
+app.include_router(bulk.router)
+app.include_router(backup.router)
+app.include_router(cache.router)
+app.include_router(sync.router)
+app.include_router(events.router)
+app.include_router(verses.router)
+app.include_router(facets.router)
+app.include_router(stats.router)
+app.include_router(archive.router)
+app.include_router(metrics.router)
+app.include_router(writer.router)
+app.include_router(shards.admin_router)
+
+# Bring the database schema up to date (or check it is, MIGRATE_ON_STARTUP=0)
+# before anything else starts
+app.add_event_handler("startup", migrations.migrate_on_startup)
+# Background archiving of answered prayer requests (ARCHIVE_INTERVAL, 0 disables it)
+if config.SHARDING:
+    archive.archiver.databases = shards.router.each_engine
+app.add_event_handler("startup", archive.archiver.start)
+app.add_event_handler("shutdown", archive.archiver.stop)
+# Commit whatever the group-commit writer still holds (WRITE_QUEUE)
+app.add_event_handler("shutdown", writer.writer.stop)
+# Close idle tenant databases, and all of them on shutdown (SHARDING)
+app.add_event_handler("startup", shards.router.start)
+app.add_event_handler("shutdown", shards.router.stop)
+
+async def get_tags_by_ids(db: AsyncSession, tag_ids: List[int]):
+    return reconcile.pick_tags(await reconcile.load_tags(db, tag_ids), tag_ids)
+
+async def get_journal_entry(db: AsyncSession, entry_id: int, include_archived: bool = False):
+    return await db.scalar(
+        select(models.JournalEntry)
+        .options(*(JOURNAL_ENTRY_WITH_ARCHIVED_PLAN if include_archived else JOURNAL_ENTRY_PLAN))
+        .where(models.JournalEntry.id == entry_id)
+        .execution_options(populate_existing=True)
+    )
+
+async def get_prayer_request(db: AsyncSession, request_id: int):
+    return await db.scalar(
+        select(models.PrayerRequest)
+        .options(*PRAYER_REQUEST_PLAN)
+        .where(models.PrayerRequest.id == request_id)
+        .execution_options(populate_existing=True)
+    )
+
+async def get_archived_prayer_request(db: AsyncSession, request_id: int):
+    return await db.scalar(
+        select(models.ArchivedPrayerRequest)
+        .options(*ARCHIVED_PRAYER_REQUEST_PLAN)
+        .where(models.ArchivedPrayerRequest.id == request_id)
+    )
+
+async def get_prayer_request_update(db: AsyncSession, request_id: int, update_id: int):
+    return await db.scalar(
+        select(models.PrayerRequestUpdate)
+        .options(*PRAYER_REQUEST_UPDATE_PLAN)
+        .where(
+            models.PrayerRequestUpdate.id == update_id,
+            models.PrayerRequestUpdate.prayerRequestId == request_id
+        )
+        .execution_options(populate_existing=True)
+    )
 
 # CRUD operations for Tags
 @app.post("/tags/", response_model=Tag)
-def create_tag(tag: TagCreate, db: Session = Depends(get_db)):
-    db_tag = models.Tag(name=tag.name)
-    db.add(db_tag)
-    db.commit()
-    db.refresh(db_tag)
-    return db_tag
-
-@app.get("/tags/", response_model=List[Tag])
-def read_tags(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    tags = db.query(models.Tag).offset(skip).limit(limit).all()
-    return tags
+async def create_tag(tag: TagCreate, db: AsyncSession = Depends(get_async_db)):
+    async def write(session: AsyncSession):
+        db_tag = models.Tag(name=tag.name)
+        session.add(db_tag)
+        await session.flush()
+        return db_tag.id
+
+    tag_id = await writer.run(db, write)
+    return serialization.json_response(Tag, await db.get(models.Tag, tag_id, populate_existing=True))
+
+@app.get("/tags/", response_model=List[Tag], dependencies=[etags.conditional_get(etags.TAG_TABLES)])
+async def read_tags(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    cached = cache.cached_page(request)
+    if cached is not None:
+        return cached
+    tags, next_cursor = await fetch_page(
+        db, select(models.Tag).options(*TAG_PLAN), TAG_KEY, cursor, skip, limit, descending=False
+    )
+    set_next_cursor(response, next_cursor)
+    return cache.store_page(request, response, List[Tag], tags)
 
 # CRUD operations for Journal Entries
 @app.post("/journal-entries/", response_model=JournalEntry)
-def create_journal_entry(entry: JournalEntryCreate, db: Session = Depends(get_db)):
-    logger.debug(f"Creating journal entry with title: {entry.title}")
-    db_entry = models.JournalEntry(
-        title=entry.title,
-        content=entry.content,
-        bibleVerses=json.dumps(entry.bibleVerses) if entry.bibleVerses else "[]"
-    )
-    
-    if entry.tags:
-        logger.debug(f"Processing tags: {entry.tags}")
-        db_entry.tags = db.query(models.Tag).filter(models.Tag.id.in_(entry.tags)).all()
-    
-    logger.debug(f"Processing {len(entry.prayerRequests)} prayer requests")
-    for pr in entry.prayerRequests:
-        logger.debug(f"Creating prayer request: {pr.title}")
-        db_prayer_request = models.PrayerRequest(
-            title=pr.title,
-            description=pr.description,
-            checked=pr.checked,
-            journalEntryId=db_entry.id,
-            assignedToId=pr.assignedToId
+async def create_journal_entry(entry: JournalEntryCreate, db: AsyncSession = Depends(get_async_db)):
+    logger.debug("Creating journal entry with title: %s", entry.title)
+
+    async def write(session: AsyncSession):
+        db_entry = models.JournalEntry(
+            title=entry.title,
+            content=entry.content,
+            bibleVerses=json.dumps(entry.bibleVerses) if entry.bibleVerses else "[]"
         )
-        if pr.tags:
-            logger.debug(f"Processing tags for prayer request: {pr.tags}")
-            db_prayer_request.tags = db.query(models.Tag).filter(models.Tag.id.in_(pr.tags)).all()
-        db_entry.prayerRequests.append(db_prayer_request)
-    
+
+        # One query for every tag referenced by the entry and its prayer requests
+        tags_by_id = await reconcile.load_tags(session, reconcile.referenced_tag_ids(entry))
+        db_entry.tags = reconcile.pick_tags(tags_by_id, entry.tags)
+
+        session.add(db_entry)
+        await session.flush()
+        await verses.replace_verses(session, [(db_entry.id, entry.bibleVerses)])
+
+        logger.debug("Processing %d prayer requests", len(entry.prayerRequests))
+        await reconcile.insert_prayer_requests(session, entry.prayerRequests, tags_by_id, journal_id=db_entry.id)
+        return db_entry.id
+
     logger.debug("Committing journal entry to database")
-    db.add(db_entry)
-    db.commit()
-    db.refresh(db_entry)
-    logger.debug(f"Journal entry created successfully with ID: {db_entry.id}")
-    return db_entry
-
-@app.get("/journal-entries/", response_model=List[JournalEntry])
-def read_journal_entries(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    db_entry = await get_journal_entry(db, await writer.run(db, write))
+    logger.debug("Journal entry created successfully with ID: %s", db_entry.id)
+    return serialization.json_response(JournalEntry, db_entry)
+
+@app.get("/journal-entries/", response_model=List[Union[JournalEntry, JournalEntrySummary]], dependencies=[etags.conditional_get(etags.JOURNAL_ENTRY_TABLES)])
+async def read_journal_entries(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, tags: Optional[List[int]] = Query(None), tag_match: facets.TagMatch = "all", include_archived: bool = False, view: fieldsets.View = "full", fields: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
     logger.debug("Reading all journal entries")
-    entries = db.query(models.JournalEntry).options(
-        joinedload(models.JournalEntry.prayer_requests).joinedload(models.PrayerRequest.tags)
-    ).offset(skip).limit(limit).all()
-    
-    # Log the response data structure
-    response_data = [
-        {
-            "id": entry.id,
-            "title": entry.title,
-            "prayerRequests": [
-                {
-                    "id": pr.id,
-                    "title": pr.title,
-                    "description": pr.description,
-                    "tags": [tag.id for tag in pr.tags],
-                    "assignedToId": pr.assignedToId
-                }
-                for pr in entry.prayer_requests
-            ]
-        }
-        for entry in entries
-    ]
-    logger.debug(f"Response data structure: {json.dumps(response_data, indent=2)}")
-    
-    return entries
-
-@app.get("/journal-entries/{entry_id}", response_model=JournalEntry)
-def read_journal_entry(entry_id: int, db: Session = Depends(get_db)):
-    logger.debug(f"Reading journal entry with ID: {entry_id}")
-    entry = db.query(models.JournalEntry).options(
-        joinedload(models.JournalEntry.prayer_requests).joinedload(models.PrayerRequest.tags)
-    ).filter(models.JournalEntry.id == entry_id).first()
-    
+    cached = cache.cached_page(request)
+    if cached is not None:
+        return cached
+    model = JournalEntryWithArchived if include_archived else JournalEntry
+    response_type = fieldsets.response_type(model, JournalEntrySummary, view, fields)
+    stmt = facets.filter_by_tags(
+        select(models.JournalEntry).options(*fieldsets.plan(models.JournalEntry, response_type)),
+        models.JournalEntry.id, models.journalTag, tags, tag_match,
+    )
+    entries, next_cursor = await fetch_page(db, stmt, JOURNAL_ENTRY_KEY, cursor, skip, limit)
+    set_next_cursor(response, next_cursor)
+    logger.debug("Read %d journal entries", len(entries))
+    return cache.store_page(request, response, List[response_type], entries)
+
+@app.get("/journal-entries/{entry_id}", response_model=JournalEntry, dependencies=[etags.conditional_get(etags.JOURNAL_ENTRY_TABLES)])
+async def read_journal_entry(response: Response, entry_id: int, include_archived: bool = False, db: AsyncSession = Depends(get_async_db)):
+    logger.debug("Reading journal entry with ID: %s", entry_id)
+    entry = await get_journal_entry(db, entry_id, include_archived)
+
     if entry is None:
-        logger.warning(f"Journal entry with ID {entry_id} not found")
+        logger.warning("Journal entry with ID %s not found", entry_id)
         raise HTTPException(status_code=404, detail="Journal entry not found")
-    
-    return entry
+
+    return serialization.json_response(JournalEntryWithArchived if include_archived else JournalEntry, entry, response)
 
 @app.put("/journal-entries/{entry_id}", response_model=JournalEntry)
-def update_journal_entry(entry_id: int, entry: JournalEntryCreate, db: Session = Depends(get_db)):
-    db_entry = db.query(models.JournalEntry).filter(models.JournalEntry.id == entry_id).first()
-    if db_entry is None:
-        raise HTTPException(status_code=404, detail="Journal entry not found")
-    
-    # Update basic fields
-    db_entry.title = entry.title
-    db_entry.content = entry.content
-    db_entry.bibleVerses = json.dumps(entry.bibleVerses) if entry.bibleVerses else "[]"
-    
-    # Update tags
-    if entry.tags:
-        db_entry.tags = db.query(models.Tag).filter(models.Tag.id.in_(entry.tags)).all()
-    else:
-        db_entry.tags = []
-    
-    # Update prayer requests
-    existing_pr_ids = {pr.id for pr in db_entry.prayerRequests}
-    new_pr_ids = {pr.id for pr in entry.prayerRequests if pr.id is not None}
-    
-    # Delete prayer requests that are no longer present
-    for pr in db_entry.prayerRequests[:]:
-        if pr.id not in new_pr_ids:
-            db.delete(pr)
-    
-    # Update existing and create new prayer requests
-    for pr_data in entry.prayerRequests:
-        if pr_data.id is not None:
-            # Update existing prayer request
-            db_pr = db.query(models.PrayerRequest).filter(models.PrayerRequest.id == pr_data.id).first()
-            if db_pr:
-                db_pr.title = pr_data.title
-                db_pr.description = pr_data.description
-                db_pr.assignedToId = pr_data.assignedToId
-                db_pr.checked = pr_data.checked
-                db_pr.journalEntryId = entry_id
-                if pr_data.tags:
-                    db_pr.tags = db.query(models.Tag).filter(models.Tag.id.in_(pr_data.tags)).all()
-        else:
-            # Create new prayer request
-            db_pr = models.PrayerRequest(
-                title=pr_data.title,
-                description=pr_data.description,
-                assignedToId=pr_data.assignedToid,
-                checked=pr_data.checked,
-                journalEntryId=entry_id
-            )
-            if pr_data.tags:
-                db_pr.tags = db.query(models.Tag).filter(models.Tag.id.in_(pr_data.tags)).all()
-            db_entry.prayerRequests.append(db_pr)
-    
-    db.commit()
-    db.refresh(db_entry)
-    return db_entry
+async def update_journal_entry(entry_id: int, entry: JournalEntryCreate, db: AsyncSession = Depends(get_async_db)):
+    async def write(session: AsyncSession):
+        db_entry = await get_journal_entry(session, entry_id)
+        if db_entry is None:
+            raise HTTPException(status_code=404, detail="Journal entry not found")
+
+        # Update basic fields
+        db_entry.title = entry.title
+        db_entry.content = entry.content
+        db_entry.bibleVerses = json.dumps(entry.bibleVerses) if entry.bibleVerses else "[]"
+        await verses.replace_verses(session, [(entry_id, entry.bibleVerses)])
+
+        # Update tags, loading every tag the payload references in one query
+        tags_by_id = await reconcile.load_tags(session, reconcile.referenced_tag_ids(entry))
+        db_entry.tags = reconcile.pick_tags(tags_by_id, entry.tags)
+
+        # Create, update and delete prayer requests as one batched diff
+        await reconcile.reconcile_prayer_requests(session, db_entry, entry.prayerRequests, tags_by_id)
+
+    await writer.run(db, write)
+    return serialization.json_response(JournalEntry, await get_journal_entry(db, entry_id))
 
 @app.delete("/journal-entries/{entry_id}")
-def delete_journal_entry(entry_id: int, db: Session = Depends(get_db)):
-    db_entry = db.query(models.JournalEntry).filter(models.JournalEntry.id == entry_id).first()
-    if db_entry is None:
-        raise HTTPException(status_code=404, detail="Journal entry not found")
-    
-    db.delete(db_entry)
-    db.commit()
+async def delete_journal_entry(entry_id: int, db: AsyncSession = Depends(get_async_db)):
+    async def write(session: AsyncSession):
+        db_entry = await session.get(models.JournalEntry, entry_id)
+        if db_entry is None:
+            raise HTTPException(status_code=404, detail="Journal entry not found")
+        await session.delete(db_entry)
+
+    await writer.run(db, write)
     return {"message": "Journal entry deleted successfully"}
 
 # CRUD operations for Prayer Requests
 @app.post("/prayer-requests/", response_model=PrayerRequest)
-def create_prayer_request(request: PrayerRequestCreate, db: Session = Depends(get_db)):
-    db_request = models.PrayerRequest(
-        title=request.title,
-        description=request.description,
-        assignedToId=request.assignedToId
+async def create_prayer_request(request: PrayerRequestCreate, db: AsyncSession = Depends(get_async_db)):
+    async def write(session: AsyncSession):
+        db_request = models.PrayerRequest(
+            title=request.title,
+            description=request.description,
+            checked=request.checked,
+            assignedToId=request.assignedToId
+        )
+        if request.tags:
+            db_request.tags = await get_tags_by_ids(session, request.tags)
+        session.add(db_request)
+        await session.flush()
+        return db_request.id
+
+    return serialization.json_response(PrayerRequest, await get_prayer_request(db, await writer.run(db, write)))
+
+@app.get("/prayer-requests/", response_model=List[Union[PrayerRequest, PrayerRequestSummary]], dependencies=[etags.conditional_get(etags.PRAYER_REQUEST_TABLES)])
+async def read_prayer_requests(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, tags: Optional[List[int]] = Query(None), tag_match: facets.TagMatch = "all", include_archived: bool = False, view: fieldsets.View = "full", fields: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    cached = cache.cached_page(request)
+    if cached is not None:
+        return cached
+    response_type = fieldsets.response_type(PrayerRequest, PrayerRequestSummary, view, fields)
+    stmt = facets.filter_by_tags(
+        select(models.PrayerRequest).options(*fieldsets.plan(models.PrayerRequest, response_type)),
+        models.PrayerRequest.id, models.prayerRequestTag, tags, tag_match,
     )
-    if request.tags:
-        db_request.tags = db.query(models.Tag).filter(models.Tag.id.in_(request.tags)).all()
-    db.add(db_request)
-    db.commit()
-    db.refresh(db_request)
-    return db_request
-
-@app.get("/prayer-requests/", response_model=List[PrayerRequest])
-def read_prayer_requests(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    requests = db.query(models.PrayerRequest).offset(skip).limit(limit).all()
-    return requests
-
-@app.get("/prayer-requests/{request_id}", response_model=PrayerRequest)
-def read_prayer_request(request_id: int, db: Session = Depends(get_db)):
-    request = db.query(models.PrayerRequest).filter(models.PrayerRequest.id == request_id).first()
+    if include_archived:
+        archived = facets.filter_by_tags(
+            select(models.ArchivedPrayerRequest).options(
+                *fieldsets.plan(models.ArchivedPrayerRequest, response_type)
+            ),
+            models.ArchivedPrayerRequest.id, models.archivedPrayerRequestTag, tags, tag_match,
+        )
+        requests, next_cursor = await fetch_merged_page(
+            db, [(stmt, PRAYER_REQUEST_KEY), (archived, ARCHIVED_PRAYER_REQUEST_KEY)], cursor, skip, limit
+        )
+    else:
+        requests, next_cursor = await fetch_page(db, stmt, PRAYER_REQUEST_KEY, cursor, skip, limit)
+    set_next_cursor(response, next_cursor)
+    return cache.store_page(request, response, List[response_type], requests)
+
+@app.get("/prayer-requests/{request_id}", response_model=PrayerRequest, dependencies=[etags.conditional_get(etags.PRAYER_REQUEST_TABLES)])
+async def read_prayer_request(response: Response, request_id: int, include_archived: bool = False, db: AsyncSession = Depends(get_async_db)):
+    request = await get_prayer_request(db, request_id)
+    if request is None and include_archived:
+        request = await get_archived_prayer_request(db, request_id)
     if request is None:
         raise HTTPException(status_code=404, detail="Prayer request not found")
-    return request
+    return serialization.json_response(PrayerRequest, request, response)
 
 @app.put("/prayer-requests/{request_id}", response_model=PrayerRequest)
-def update_prayer_request(request_id: int, request: PrayerRequestCreate, db: Session = Depends(get_db)):
-    db_request = db.query(models.PrayerRequest).filter(models.PrayerRequest.id == request_id).first()
-    if db_request is None:
-        raise HTTPException(status_code=404, detail="Prayer request not found")
-    
-    for key, value in request.dict(exclude_unset=True).items():
-        if key == 'tags':
-            db_request.tags = db.query(models.Tag).filter(models.Tag.id.in_(value)).all()
-        else:
-            setattr(db_request, key, value)
-    
-    db.commit()
-    db.refresh(db_request)
-    return db_request
+async def update_prayer_request(request_id: int, request: PrayerRequestCreate, db: AsyncSession = Depends(get_async_db)):
+    async def write(session: AsyncSession):
+        db_request = await get_prayer_request(session, request_id)
+        if db_request is None:
+            raise HTTPException(status_code=404, detail="Prayer request not found")
+
+        for key, value in request.model_dump(exclude_unset=True).items():
+            if key == 'tags':
+                db_request.tags = await get_tags_by_ids(session, value)
+            else:
+                setattr(db_request, key, value)
+
+    await writer.run(db, write)
+    return serialization.json_response(PrayerRequest, await get_prayer_request(db, request_id))
 
 @app.delete("/prayer-requests/{request_id}")
-def delete_prayer_request(request_id: int, db: Session = Depends(get_db)):
-    db_request = db.query(models.PrayerRequest).filter(models.PrayerRequest.id == request_id).first()
-    if db_request is None:
-        raise HTTPException(status_code=404, detail="Prayer request not found")
-    
-    db.delete(db_request)
-    db.commit()
+async def delete_prayer_request(request_id: int, db: AsyncSession = Depends(get_async_db)):
+    async def write(session: AsyncSession):
+        db_request = await session.get(models.PrayerRequest, request_id)
+        if db_request is None:
+            raise HTTPException(status_code=404, detail="Prayer request not found")
+        await session.delete(db_request)
+
+    await writer.run(db, write)
     return {"message": "Prayer request deleted successfully"}
 
 # CRUD operations for Prayer Request Updates
 @app.post("/prayer-requests/{request_id}/updates/", response_model=PrayerRequestUpdate)
-def create_prayer_request_update(request_id: int, update: PrayerRequestUpdateCreate, db: Session = Depends(get_db)):
-    db_request = db.query(models.PrayerRequest).filter(models.PrayerRequest.id == request_id).first()
-    if db_request is None:
-        raise HTTPException(status_code=404, detail="Prayer request not found")
-    
-    db_update = models.PrayerRequestUpdate(
-        title=update.title,
-        content=update.content,
-        prayer_request_id=request_id
-    )
-    db.add(db_update)
-    db.commit()
-    db.refresh(db_update)
-    return db_update
-
-@app.get("/prayer-requests/{request_id}/updates/", response_model=List[PrayerRequestUpdate])
-def read_prayer_request_updates(request_id: int, db: Session = Depends(get_db)):
-    updates = db.query(models.PrayerRequestUpdate).filter(
-        models.PrayerRequestUpdate.prayer_request_id == request_id
-    ).all()
-    return updates
-
-@app.get("/prayer-requests/{request_id}/updates/{update_id}", response_model=PrayerRequestUpdate)
-def read_prayer_request_update(request_id: int, update_id: int, db: Session = Depends(get_db)):
-    update = db.query(models.PrayerRequestUpdate).filter(
-        models.PrayerRequestUpdate.id == update_id,
-        models.PrayerRequestUpdate.prayer_request_id == request_id
-    ).first()
+async def create_prayer_request_update(request_id: int, update: PrayerRequestUpdateCreate, db: AsyncSession = Depends(get_async_db)):
+    async def write(session: AsyncSession):
+        db_request = await session.get(models.PrayerRequest, request_id)
+        if db_request is None:
+            raise HTTPException(status_code=404, detail="Prayer request not found")
+
+        db_update = models.PrayerRequestUpdate(
+            title=update.title,
+            content=update.content,
+            prayerRequestId=request_id
+        )
+        session.add(db_update)
+        await session.flush()
+        return db_update.id
+
+    update_id = await writer.run(db, write)
+    return serialization.json_response(PrayerRequestUpdate, await get_prayer_request_update(db, request_id, update_id))
+
+@app.get("/prayer-requests/{request_id}/updates/", response_model=List[Union[PrayerRequestUpdate, PrayerRequestUpdateSummary]], dependencies=[etags.conditional_get(etags.PRAYER_REQUEST_UPDATE_TABLES)])
+async def read_prayer_request_updates(response: Response, request_id: int, include_archived: bool = False, view: fieldsets.View = "full", fields: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    response_type = fieldsets.response_type(PrayerRequestUpdate, PrayerRequestUpdateSummary, view, fields)
+    updates = (await db.scalars(
+        select(models.PrayerRequestUpdate).options(
+            *fieldsets.plan(models.PrayerRequestUpdate, response_type)
+        ).where(models.PrayerRequestUpdate.prayerRequestId == request_id)
+    )).all()
+    if not updates and include_archived:
+        updates = (await db.scalars(
+            select(models.ArchivedPrayerRequestUpdate).options(
+                *fieldsets.plan(models.ArchivedPrayerRequestUpdate, response_type)
+            ).where(models.ArchivedPrayerRequestUpdate.prayerRequestId == request_id)
+        )).all()
+    return serialization.json_response(List[response_type], updates, response)
+
+@app.get("/prayer-requests/{request_id}/updates/{update_id}", response_model=PrayerRequestUpdate, dependencies=[etags.conditional_get(etags.PRAYER_REQUEST_UPDATE_TABLES)])
+async def read_prayer_request_update(response: Response, request_id: int, update_id: int, db: AsyncSession = Depends(get_async_db)):
+    update = await get_prayer_request_update(db, request_id, update_id)
     if update is None:
         raise HTTPException(status_code=404, detail="Prayer request update not found")
-    return update
+    return serialization.json_response(PrayerRequestUpdate, update, response)
 
 @app.put("/prayer-requests/{request_id}/updates/{update_id}", response_model=PrayerRequestUpdate)
-def update_prayer_request_update(request_id: int, update_id: int, update: PrayerRequestUpdateCreate, db: Session = Depends(get_db)):
-    db_update = db.query(models.PrayerRequestUpdate).filter(
-        models.PrayerRequestUpdate.id == update_id,
-        models.PrayerRequestUpdate.prayer_request_id == request_id
-    ).first()
-    if db_update is None:
-        raise HTTPException(status_code=404, detail="Prayer request update not found")
-    
-    for key, value in update.dict(exclude_unset=True).items():
-        setattr(db_update, key, value)
-    
-    db.commit()
-    db.refresh(db_update)
-    return db_update
+async def update_prayer_request_update(request_id: int, update_id: int, update: PrayerRequestUpdateCreate, db: AsyncSession = Depends(get_async_db)):
+    async def write(session: AsyncSession):
+        db_update = await get_prayer_request_update(session, request_id, update_id)
+        if db_update is None:
+            raise HTTPException(status_code=404, detail="Prayer request update not found")
+
+        for key, value in update.model_dump(exclude_unset=True).items():
+            setattr(db_update, key, value)
+
+    await writer.run(db, write)
+    return serialization.json_response(PrayerRequestUpdate, await get_prayer_request_update(db, request_id, update_id))
 
 @app.delete("/prayer-requests/{request_id}/updates/{update_id}")
-def delete_prayer_request_update(request_id: int, update_id: int, db: Session = Depends(get_db)):
-    db_update = db.query(models.PrayerRequestUpdate).filter(
-        models.PrayerRequestUpdate.id == update_id,
-        models.PrayerRequestUpdate.prayer_request_id == request_id
-    ).first()
-    if db_update is None:
-        raise HTTPException(status_code=404, detail="Prayer request update not found")
-    
-    db.delete(db_update)
-    db.commit()
-    return {"message": "Prayer request update deleted successfully"} 
+async def delete_prayer_request_update(request_id: int, update_id: int, db: AsyncSession = Depends(get_async_db)):
+    async def write(session: AsyncSession):
+        db_update = await get_prayer_request_update(session, request_id, update_id)
+        if db_update is None:
+            raise HTTPException(status_code=404, detail="Prayer request update not found")
+        await session.delete(db_update)
+
+    await writer.run(db, write)
+    return {"message": "Prayer request update deleted successfully"}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
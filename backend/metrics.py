@@ -0,0 +1,314 @@
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Request, Response
+from sqlalchemy import event
+
+import config
+
+# metrics.py profiles requests and serves the numbers on GET /metrics in
+# Prometheus' text format. For every request it records, per route:
+#
+# - how many SQL statements ran and how long SQLite took over them (engine
+#   before/after_cursor_execute events),
+# - how long the request waited for a pooled connection (see database.TimedPool),
+# - how long serialization.py took to convert the result and to encode it,
+# - everything else ("app" time): ORM hydration, request validation and route code.
+#
+# Statements slower than SLOW_QUERY_MS also go to a slow-query log, kept per
+# normalized statement (literals and IN lists collapsed) together with SQLite's
+# EXPLAIN QUERY PLAN for it, on GET /metrics/slow-queries.
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...], labels: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        # label values -> [count per bucket (+Inf last), sum]
+        self.series: Dict[Tuple[str, ...], list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self.series.items())
+        for label_values, (counts, total) in series:
+            labels = ",".join(f'{name}="{escape(value)}"' for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total!r}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+ROUTE_LABELS = ("method", "route")
+
+REQUEST_SECONDS = Histogram("ebenezer_request_duration_seconds", "Time to produce a response.", TIME_BUCKETS, ROUTE_LABELS)
+QUERIES = Histogram("ebenezer_request_queries", "SQL statements executed per request.", QUERY_BUCKETS, ROUTE_LABELS)
+SQL_SECONDS = Histogram("ebenezer_request_sql_seconds", "Time spent executing SQL per request.", TIME_BUCKETS, ROUTE_LABELS)
+POOL_WAIT_SECONDS = Histogram(
+    "ebenezer_request_pool_wait_seconds", "Time spent waiting for a pooled connection per request.", TIME_BUCKETS, ROUTE_LABELS
+)
+SERIALIZE_SECONDS = Histogram(
+    "ebenezer_request_serialize_seconds", "Time spent converting results for the response model per request.",
+    TIME_BUCKETS, ROUTE_LABELS,
+)
+ENCODE_SECONDS = Histogram("ebenezer_request_encode_seconds", "Time spent encoding JSON per request.", TIME_BUCKETS, ROUTE_LABELS)
+APP_SECONDS = Histogram(
+    "ebenezer_request_app_seconds",
+    "Time outside SQL, the pool and serialization per request (ORM hydration, validation, route code).",
+    TIME_BUCKETS, ROUTE_LABELS,
+)
+HISTOGRAMS = (REQUEST_SECONDS, QUERIES, SQL_SECONDS, POOL_WAIT_SECONDS, SERIALIZE_SECONDS, ENCODE_SECONDS, APP_SECONDS)
+
+# Responses by status, next to the histograms
+responses_total: Dict[Tuple[str, str, str], int] = {}
+responses_lock = threading.Lock()
+
+# Per-request profile
+
+class Profile:
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope
+        self.queries = 0
+        self.sql = 0.0
+        self.pool_wait = 0.0
+        self.serialize = 0.0
+        self.encode = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "queries": self.queries,
+            "sqlMs": round(self.sql * 1000, 2),
+            "poolWaitMs": round(self.pool_wait * 1000, 2),
+            "serializeMs": round(self.serialize * 1000, 2),
+            "encodeMs": round(self.encode * 1000, 2),
+        }
+
+    def labels(self) -> Tuple[str, str]:
+        # The router sets scope["route"] once the path matched; unmatched paths
+        # share one label so 404s can't grow the series without bound
+        route = (self.scope or {}).get("route")
+        return (self.scope or {}).get("method", ""), getattr(route, "path", "unmatched")
+
+_current_profile: ContextVar[Optional[Profile]] = ContextVar("request_profile", default=None)
+
+def record_pool_wait(seconds: float):
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.pool_wait += seconds
+
+def record_serialization(serialize: float, encode: float):
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.serialize += serialize
+        profile.encode += encode
+
+# Slow-query log
+
+LITERALS = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"(?<![\w\"])\d+(?:\.\d+)?\b"), "?"),
+    # IN lists and multi-row VALUES of any length
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(?, ...)"),
+    (re.compile(r"(\(\?, \.\.\.\)|\(\?\))(?:\s*,\s*\1)+"), r"\1, ..."),
+    (re.compile(r"\s+"), " "),
+)
+
+def normalize(statement: str) -> str:
+    for pattern, replacement in LITERALS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+class SlowQueryLog:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def record(self, statement: str, seconds: float, route: Optional[str]) -> bool:
+        # Returns True the first time a normalized statement is seen, when the caller
+        # should add its query plan
+        key = normalize(statement)
+        duration_ms = round(seconds * 1000, 2)
+        with self.lock:
+            entry = self.entries.get(key)
+            new = entry is None
+            if new:
+                entry = self.entries[key] = {
+                    "statement": key, "count": 0, "totalMs": 0.0, "maxMs": 0.0, "plan": None, "routes": [],
+                }
+            entry["count"] += 1
+            entry["totalMs"] = round(entry["totalMs"] + duration_ms, 2)
+            entry["maxMs"] = max(entry["maxMs"], duration_ms)
+            entry["lastMs"] = duration_ms
+            entry["lastAt"] = datetime.utcnow().isoformat()
+            if route is not None and route not in entry["routes"]:
+                entry["routes"].append(route)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return new
+
+    def set_plan(self, statement: str, plan: List[str]):
+        with self.lock:
+            entry = self.entries.get(normalize(statement))
+            if entry is not None:
+                entry["plan"] = plan
+
+    def items(self) -> List[dict]:
+        with self.lock:
+            return sorted((dict(entry, routes=list(entry["routes"])) for entry in self.entries.values()),
+                          key=lambda entry: entry["totalMs"], reverse=True)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+slow_queries = SlowQueryLog(config.SLOW_QUERY_LOG_SIZE)
+
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+def query_plan(conn, statement: str, parameters) -> Optional[List[str]]:
+    # EXPLAIN QUERY PLAN on the same DBAPI connection, outside SQLAlchemy so it
+    # neither fires these events again nor counts against the request
+    if not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    depth = {0: -1}
+    plan = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        plan.append("  " * depth[node] + detail)
+    return plan or None
+
+# Engine events
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.queries += 1
+        profile.sql += elapsed
+    if elapsed * 1000 < config.SLOW_QUERY_MS:
+        return
+    route = " ".join(profile.labels()) if profile is not None else None
+    logger.warning("Slow query (%.1fms) on %s: %s", elapsed * 1000, route or "no request", normalize(statement))
+    if slow_queries.record(statement, elapsed, route) and config.SLOW_QUERY_EXPLAIN and not executemany:
+        try:
+            plan = query_plan(conn, statement, parameters)
+        except Exception:
+            logger.debug("EXPLAIN QUERY PLAN failed for %s", statement, exc_info=True)
+            return
+        if plan is not None:
+            slow_queries.set_plan(statement, plan)
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+def install(sync_engine):
+    if not config.METRICS_ENABLED:
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+# Middleware
+
+async def metrics_middleware(request: Request, call_next):
+    if not config.METRICS_ENABLED:
+        return await call_next(request)
+
+    profile = Profile(request.scope)
+    token = _current_profile.set(profile)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_profile.reset(token)
+        labels = profile.labels()
+        REQUEST_SECONDS.observe(elapsed, *labels)
+        QUERIES.observe(profile.queries, *labels)
+        SQL_SECONDS.observe(profile.sql, *labels)
+        POOL_WAIT_SECONDS.observe(profile.pool_wait, *labels)
+        SERIALIZE_SECONDS.observe(profile.serialize, *labels)
+        ENCODE_SECONDS.observe(profile.encode, *labels)
+        APP_SECONDS.observe(
+            max(0.0, elapsed - profile.sql - profile.pool_wait - profile.serialize - profile.encode), *labels
+        )
+        with responses_lock:
+            key = labels + (str(status_code),)
+            responses_total[key] = responses_total.get(key, 0) + 1
+        # Read by logconfig.access_log_middleware
+        request.state.profile = profile
+
+def render() -> str:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    lines += ["# HELP ebenezer_responses_total Responses sent.", "# TYPE ebenezer_responses_total counter"]
+    with responses_lock:
+        counts = sorted(responses_total.items())
+    for (method, route, status), count in counts:
+        lines.append(f'ebenezer_responses_total{{method="{method}",route="{escape(route)}",status="{status}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    return Response(content=render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/metrics/slow-queries")
+async def read_slow_queries():
+    return {"thresholdMs": config.SLOW_QUERY_MS, "queries": slow_queries.items()}
+
+@router.delete("/metrics/slow-queries")
+async def clear_slow_queries():
+    slow_queries.clear()
+    return {"message": "Slow-query log cleared"}
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing, contextmanager
+from typing import List, Tuple
+
+from sqlalchemy import insert, text
+from sqlalchemy.schema import CreateTable
+
+import archive
+import config
+import etags
+import facets
+import logconfig
+import models
+import search
+import stats
+import sync
+import verses
+from database import create_sqlite_engine, engine
+
+# migrations.py brings a database up to the schema this code expects, through
+# numbered steps applied in order. The SchemaMigrations table records the steps a
+# database has had, so bringing an up-to-date database up to date is a single
+# query, and a schema change is a new step appended to MIGRATIONS.
+#
+# main.py runs upgrade() from a startup hook (MIGRATE_ON_STARTUP, on by default),
+# never at import time; with it off the server refuses to start on a database that
+# is behind and migrations run from the command line instead:
+#
+#   python migrations.py status [path.db]
+#   python migrations.py upgrade [path.db]
+#
+# Steps run under a lock file next to the database, so of several uvicorn workers
+# starting together one migrates while the others wait and then find nothing to
+# do. shards.py upgrades each tenant's database the first time it is opened.
+#
+# A step records itself only once it has finished, so a step interrupted halfway
+# runs again from the start: every step must be safe to repeat.
+
+logger = logging.getLogger(__name__)
+
+def baseline(bind):
+    # The schema as it stood before versioning, so a database from any earlier
+    # version of the app (or a new, empty one) ends up the same: the tables declared
+    # in models.py, then the triggers and derived tables each feature keeps,
+    # backfilled for rows written before they existed.
+    models.Base.metadata.create_all(bind=bind)
+    # Before the schemas below, which put triggers on tables it may rebuild
+    facets.create_facet_schema(bind)
+    search.create_search_schema(bind)
+    etags.create_version_schema(bind)
+    sync.create_sync_schema(bind)
+    verses.create_verse_schema(bind)
+    archive.create_archive_schema(bind)
+    stats.create_stats_schema(bind)
+
+def create_indexes(bind, indexes):
+    # One transaction per index: SQLite holds the write lock while it builds an
+    # index, so writers wait for one index at a time rather than for the whole
+    # step. In WAL mode readers carry on throughout.
+    with bind.connect() as connection:
+        existing = set(connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+    for index in indexes:
+        if index.name in existing:
+            continue
+        started = time.perf_counter()
+        with bind.begin() as connection:
+            index.create(bind=connection, checkfirst=True)
+        logger.info("Built index %s in %.0f ms", index.name, (time.perf_counter() - started) * 1000)
+
+def add_declared_indexes(bind):
+    # create_all skips tables that already exist, so tables created by older
+    # versions lack indexes declared since: the foreign keys (assignedToId,
+    # prayerRequestId, journal_prayer_request) and the createdAt pagination indexes
+    create_indexes(bind, [index for table in models.Base.metadata.sorted_tables for index in table.indexes])
+
+# AUTOINCREMENT hot tables and the archive tables their ids move to (archive.py)
+AUTOINCREMENT_TABLES = (
+    (models.PrayerRequest.__table__, models.ArchivedPrayerRequest.__table__),
+    (models.PrayerRequestUpdate.__table__, models.ArchivedPrayerRequestUpdate.__table__),
+)
+
+def rebuild_table(db, bind, table):
+    # SQLite can't add AUTOINCREMENT to an existing table, so the table is created
+    # anew under another name, filled, and renamed over the old one. Dropping the
+    # old table drops its indexes and triggers; they are recreated from the SQL
+    # stored for them. legacy_alter_table keeps the rename from rewriting (or
+    # checking) the triggers of other tables that mention this one.
+    name = table.name
+    schema = db.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (name,),
+    ).fetchall()
+    quoted = bind.dialect.identifier_preparer.format_table(table)
+    create = str(CreateTable(table).compile(dialect=bind.dialect))
+    db.execute(create.replace(f"CREATE TABLE {quoted}", f'CREATE TABLE "{name}_rebuild"', 1))
+    existing = {row[1] for row in db.execute(f'PRAGMA table_info("{name}")')}
+    columns = ", ".join(f'"{column.name}"' for column in table.columns if column.name in existing)
+    db.execute(f'INSERT INTO "{name}_rebuild" ({columns}) SELECT {columns} FROM "{name}"')
+    db.execute(f'DROP TABLE "{name}"')
+    db.execute("PRAGMA legacy_alter_table = ON")
+    db.execute(f'ALTER TABLE "{name}_rebuild" RENAME TO "{name}"')
+    db.execute("PRAGMA legacy_alter_table = OFF")
+    for (sql,) in schema:
+        db.execute(sql)
+
+def autoincrement_ids(bind):
+    # Tables from before AUTOINCREMENT handed the ids of deleted rows out again,
+    # archived ones included. Rebuilds them where needed, then starts each table's
+    # sequence past every id used in it or its archive.
+    with closing(sqlite3.connect(bind.url.database, isolation_level=None)) as db:
+        db.execute("PRAGMA foreign_keys = OFF")
+        for table, archived in AUTOINCREMENT_TABLES:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                sql = db.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)).fetchone()[0]
+                if "AUTOINCREMENT" not in sql.upper():
+                    rebuild_table(db, bind, table)
+                db.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table.name,))
+                db.execute(
+                    f'INSERT INTO sqlite_sequence (name, seq) SELECT ?, max('
+                    f'(SELECT coalesce(max(id), 0) FROM "{table.name}"), (SELECT coalesce(max(id), 0) FROM "{archived.name}"))',
+                    (table.name,),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+MIGRATIONS = (
+    (1, "baseline", baseline),
+    (2, "declared indexes", add_declared_indexes),
+    # Adds the random etags.DATABASE_ROW to databases created before it
+    (3, "database identity", etags.create_version_schema),
+    # Logs the rows that baseline left out of SyncChanges for /sync
+    (4, "sync backfill", sync.create_sync_schema),
+    # Stops archived prayer request and update ids from being handed out again
+    (5, "autoincrement ids", autoincrement_ids),
+)
+
+def current_version(connection) -> int:
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'SchemaMigrations'")
+    ).first()
+    if not exists:
+        return 0
+    return connection.execute(text('SELECT coalesce(max(version), 0) FROM "SchemaMigrations"')).scalar()
+
+def pending(bind) -> List[Tuple[int, str]]:
+    with bind.connect() as connection:
+        version = current_version(connection)
+    return [(number, name) for number, name, _ in MIGRATIONS if number > version]
+
+if os.name == "nt":
+    import msvcrt
+
+    def lock_file(handle, blocking: bool) -> bool:
+        handle.seek(0)
+        while True:
+            try:
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.1)
+
+    def unlock_file(handle):
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def lock_file(handle, blocking: bool) -> bool:
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            return False
+
+    def unlock_file(handle):
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+def lock_path(bind) -> str:
+    return f"{bind.url.database}-migrate.lock"
+
+@contextmanager
+def migration_lock(bind):
+    # Released by the operating system if the process dies, so it never goes stale
+    with open(lock_path(bind), "a+b") as handle:
+        if not lock_file(handle, blocking=False):
+            logger.info("Waiting for another process to finish migrating %s", bind.url.database)
+            lock_file(handle, blocking=True)
+        try:
+            yield
+        finally:
+            unlock_file(handle)
+
+def upgrade(bind=engine) -> List[Tuple[int, str]]:
+    # Applies the pending steps; returns the (version, name) of each one applied
+    if not pending(bind):
+        return []
+    applied = []
+    with migration_lock(bind):
+        models.SchemaMigration.__table__.create(bind=bind, checkfirst=True)
+        # Another process may have migrated while this one waited for the lock
+        with bind.connect() as connection:
+            version = current_version(connection)
+        for number, name, step in MIGRATIONS:
+            if number <= version:
+                continue
+            logger.info("Applying migration %d (%s) to %s", number, name, bind.url.database)
+            started = time.perf_counter()
+            step(bind)
+            duration_ms = round((time.perf_counter() - started) * 1000)
+            with bind.begin() as connection:
+                connection.execute(
+                    insert(models.SchemaMigration).values(version=number, name=name, durationMs=duration_ms)
+                )
+            logger.info("Applied migration %d (%s) in %d ms", number, name, duration_ms)
+            applied.append((number, name))
+    return applied
+
+def check(bind=engine):
+    # For MIGRATE_ON_STARTUP=0: fail fast on a database that is behind
+    missing = pending(bind)
+    if missing:
+        raise RuntimeError(
+            f"{bind.url.database} needs migrations {', '.join(str(number) for number, _ in missing)}; "
+            "run python migrations.py upgrade"
+        )
+
+async def migrate_on_startup():
+    # In a thread: waiting for the lock, or a long index build, mustn't block the loop
+    await asyncio.to_thread(upgrade if config.MIGRATE_ON_STARTUP else check)
+
+def status(bind) -> List[str]:
+    with bind.connect() as connection:
+        version = current_version(connection)
+        applied = {}
+        if version:
+            applied = {
+                row.version: row for row in connection.execute(text('SELECT * FROM "SchemaMigrations"'))
+            }
+    lines = []
+    for number, name, _ in MIGRATIONS:
+        row = applied.get(number)
+        state = f"applied {row.appliedAt} ({row.durationMs} ms)" if row else "pending"
+        lines.append(f"{number}\t{name}\t{state}")
+    return lines
+
+if __name__ == "__main__":
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else (None, [])
+    if command not in ("status", "upgrade") or len(args) > 1:
+        sys.exit("usage: python migrations.py status | upgrade [path.db]")
+    if args and not os.path.exists(args[0]):
+        sys.exit(f"No database at {args[0]}")
+    logconfig.configure_logging()
+    bind = create_sqlite_engine(f"sqlite:///{args[0]}") if args else engine
+    if command == "status":
+        print("\n".join(status(bind)))
+    else:
+        applied = upgrade(bind)
+        print(f"Applied {len(applied)} migrations" if applied else "Already up to date")
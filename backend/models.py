@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime, Table
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, Text, DateTime, Table
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -8,28 +8,35 @@ import json
 # that represent your database tables. 
 # These models are used to interact with the database directly.
 
-# Association table for many-to-many relationship between JournalEntry and Tag
+# Association table for many-to-many relationship between JournalEntry and Tag.
+# The primary key serves entry -> tags, the reverse index tag -> entries (see
+# facets.py for the migration of databases created without them).
 journalTag = Table(
     'JournalTag',
     Base.metadata,
-    Column('journalId', Integer, ForeignKey('JournalEntries.id')),
-    Column('tagId', Integer, ForeignKey('tags.id'))
+    Column('journalId', Integer, ForeignKey('JournalEntries.id'), primary_key=True),
+    Column('tagId', Integer, ForeignKey('tags.id'), primary_key=True),
+    Index('ix_JournalTag_tagId_journalId', 'tagId', 'journalId'),
 )
 
 # Association table for many-to-many relationship between PrayerRequest and Tag
 prayerRequestTag = Table(
     'PrayerRequestTag',
     Base.metadata,
-    Column('prayerRequestId', Integer, ForeignKey('PrayerRequests.id')),
-    Column('tagId', Integer, ForeignKey('tags.id'))
+    Column('prayerRequestId', Integer, ForeignKey('PrayerRequests.id'), primary_key=True),
+    Column('tagId', Integer, ForeignKey('tags.id'), primary_key=True),
+    Index('ix_PrayerRequestTag_tagId_prayerRequestId', 'tagId', 'prayerRequestId'),
 )
 
-# Association table for many-to-many relationship between PrayerRequest and JournalEntry
+# Association table for many-to-many relationship between PrayerRequest and JournalEntry,
+# indexed both ways (it has no primary key to serve either direction)
 journal_prayer_request = Table(
     'journal_prayer_request',
     Base.metadata,
     Column('prayerRequestId', Integer, ForeignKey('PrayerRequests.id')),
-    Column('journalId', Integer, ForeignKey('JournalEntries.id'))
+    Column('journalId', Integer, ForeignKey('JournalEntries.id')),
+    Index('ix_journal_prayer_request_prayerRequestId_journalId', 'prayerRequestId', 'journalId'),
+    Index('ix_journal_prayer_request_journalId_prayerRequestId', 'journalId', 'prayerRequestId'),
 )
 
 class JournalEntry(Base):
@@ -45,18 +52,60 @@ class JournalEntry(Base):
     # Relationships
     tags = relationship("Tag", secondary=journalTag, back_populates="journalEntries")
     prayerRequests = relationship("PrayerRequest", secondary=journal_prayer_request, back_populates="journalEntries")
+    # Linked prayer requests since moved to the archive (see archive.py)
+    archivedPrayerRequests = relationship("ArchivedPrayerRequest", secondary="ArchivedJournalPrayerRequest", viewonly=True)
+
+    # Keyset pagination walks this index newest-first
+    __table_args__ = (
+        Index("ix_JournalEntries_createdAt_id", "createdAt", "id"),
+    )
 
     @property
     def bibleVersesList(self):
+        # Parsed once per value of bibleVerses rather than on every access
+        cached = self.__dict__.get("_bibleVersesParsed")
+        if cached is not None and cached[0] is self.bibleVerses:
+            return cached[1]
         try:
-            return json.loads(self.bibleVerses)
+            parsed = json.loads(self.bibleVerses)
         except (json.JSONDecodeError, TypeError):
-            return []
+            parsed = []
+        self.__dict__["_bibleVersesParsed"] = (self.bibleVerses, parsed)
+        return parsed
 
     @bibleVersesList.setter
     def bibleVersesList(self, value):
         self.bibleVerses = json.dumps(value) if value else "[]"
 
+    @property
+    def prayerRequestsWithArchived(self):
+        # The prayer requests sent for ?include_archived, archived ones last
+        return [*self.prayerRequests, *self.archivedPrayerRequests]
+
+class JournalVerse(Base):
+    # One row per parsed Bible reference of a journal entry (see verses.py). The
+    # entry's bibleVerses JSON stays the display copy; this table is what verse
+    # lookups query. startKey/endKey are chapter * 1000 + verse, with a whole
+    # chapter spanning verses 0-999, so a range overlap is two comparisons.
+    __tablename__ = "JournalVerse"
+
+    id = Column(Integer, primary_key=True)
+    journalId = Column(Integer, ForeignKey('JournalEntries.id'), nullable=False)
+    position = Column(Integer, nullable=False)
+    reference = Column(String, nullable=False)
+    book = Column(String, nullable=False)
+    chapterStart = Column(Integer, nullable=False)
+    verseStart = Column(Integer)
+    chapterEnd = Column(Integer, nullable=False)
+    verseEnd = Column(Integer)
+    startKey = Column(Integer, nullable=False)
+    endKey = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_JournalVerse_book_startKey_endKey", "book", "startKey", "endKey", "journalId"),
+        Index("ix_JournalVerse_journalId", "journalId"),
+    )
+
 class PrayerRequest(Base):
     __tablename__ = "PrayerRequests"
 
@@ -68,7 +117,7 @@ class PrayerRequest(Base):
     updatedAt = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Foreign key to the Person table
-    assignedToId = Column(Integer, ForeignKey("Person.id"), nullable=True)  # Nullable for optional assignment
+    assignedToId = Column(Integer, ForeignKey("Person.id"), nullable=True, index=True)  # Nullable for optional assignment
 
     # Relationships
     journalEntries = relationship("JournalEntry", secondary=journal_prayer_request, back_populates="prayerRequests")
@@ -76,6 +125,13 @@ class PrayerRequest(Base):
     updates = relationship("PrayerRequestUpdate", back_populates="prayerRequest")
     assignedTo = relationship("Person", back_populates="prayerRequests")  # Relationship to Person
 
+    # Keyset pagination walks this index newest-first. AUTOINCREMENT: the id of
+    # an archived request (see archive.py) is never handed out again.
+    __table_args__ = (
+        Index("ix_PrayerRequests_createdAt_id", "createdAt", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
 class PrayerRequestUpdate(Base):
     __tablename__ = "PrayerRequestUpdates"
 
@@ -85,11 +141,64 @@ class PrayerRequestUpdate(Base):
     date = Column(DateTime(timezone=True), server_default=func.now())
     
     # Foreign Keys
-    prayerRequestId = Column(Integer, ForeignKey("PrayerRequests.id"))
+    prayerRequestId = Column(Integer, ForeignKey("PrayerRequests.id"), index=True)
     
     # Relationships
     prayerRequest = relationship("PrayerRequest", back_populates="updates")
 
+    # Ids of archived updates are never handed out again either
+    __table_args__ = {"sqlite_autoincrement": True}
+
+# Archive tier (see archive.py): checked prayer requests that have been inactive
+# for ARCHIVE_AFTER_DAYS move here with their updates and links, keeping their ids.
+# The archived classes mirror the hot ones closely enough for the same response
+# models and are read-only through the ORM.
+archivedPrayerRequestTag = Table(
+    'ArchivedPrayerRequestTag',
+    Base.metadata,
+    Column('prayerRequestId', Integer, ForeignKey('ArchivedPrayerRequests.id'), primary_key=True),
+    Column('tagId', Integer, ForeignKey('tags.id'), primary_key=True),
+    Index('ix_ArchivedPrayerRequestTag_tagId_prayerRequestId', 'tagId', 'prayerRequestId'),
+)
+
+archivedJournalPrayerRequest = Table(
+    'ArchivedJournalPrayerRequest',
+    Base.metadata,
+    Column('prayerRequestId', Integer, ForeignKey('ArchivedPrayerRequests.id'), primary_key=True),
+    Column('journalId', Integer, ForeignKey('JournalEntries.id'), primary_key=True),
+    Index('ix_ArchivedJournalPrayerRequest_journalId', 'journalId'),
+)
+
+class ArchivedPrayerRequest(Base):
+    __tablename__ = "ArchivedPrayerRequests"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    title = Column(String)
+    description = Column(Text)
+    checked = Column(Boolean, default=False)
+    createdAt = Column(DateTime(timezone=True))
+    updatedAt = Column(DateTime(timezone=True))
+    assignedToId = Column(Integer, ForeignKey("Person.id"), nullable=True)
+    archivedAt = Column(DateTime(timezone=True), server_default=func.now())
+
+    tags = relationship("Tag", secondary=archivedPrayerRequestTag, viewonly=True)
+    updates = relationship("ArchivedPrayerRequestUpdate", viewonly=True)
+    assignedTo = relationship("Person", viewonly=True)
+    journalEntries = relationship("JournalEntry", secondary=archivedJournalPrayerRequest, viewonly=True)
+
+    __table_args__ = (
+        Index("ix_ArchivedPrayerRequests_createdAt_id", "createdAt", "id"),
+    )
+
+class ArchivedPrayerRequestUpdate(Base):
+    __tablename__ = "ArchivedPrayerRequestUpdates"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    title = Column(String)
+    content = Column(Text)
+    date = Column(DateTime(timezone=True))
+    prayerRequestId = Column(Integer, ForeignKey("ArchivedPrayerRequests.id"), index=True)
+
 class Person(Base):
     __tablename__ = "Person"
 
@@ -108,4 +217,74 @@ class Tag(Base):
     
     # Relationships
     journalEntries = relationship("JournalEntry", secondary=journalTag, back_populates="tags")
-    prayerRequests = relationship("PrayerRequest", secondary=prayerRequestTag, back_populates="tags") 
\ No newline at end of file
+    prayerRequests = relationship("PrayerRequest", secondary=prayerRequestTag, back_populates="tags")
+
+class TagUsage(Base):
+    # Number of journal entries and prayer requests using each tag, kept current by
+    # triggers on the association tables (see facets.py)
+    __tablename__ = "TagUsage"
+
+    tagId = Column(Integer, ForeignKey("tags.id"), primary_key=True)
+    journalEntries = Column(Integer, nullable=False, default=0)
+    prayerRequests = Column(Integer, nullable=False, default=0)
+
+# Dashboard aggregates, kept current by triggers (see stats.py)
+class PrayerRequestStats(Base):
+    # Open and answered (checked) prayer requests per person; personId 0 counts
+    # the unassigned ones
+    __tablename__ = "PrayerRequestStats"
+
+    personId = Column(Integer, primary_key=True)
+    open = Column(Integer, nullable=False, default=0)
+    answered = Column(Integer, nullable=False, default=0)
+
+class UpdateWeekStats(Base):
+    # Prayer request updates per week; week is the date of its Monday (UTC)
+    __tablename__ = "UpdateWeekStats"
+
+    week = Column(String, primary_key=True)
+    updates = Column(Integer, nullable=False, default=0)
+
+class JournalDayStats(Base):
+    # Journal entries per day (UTC)
+    __tablename__ = "JournalDayStats"
+
+    day = Column(String, primary_key=True)
+    entries = Column(Integer, nullable=False, default=0)
+
+class SchemaMigration(Base):
+    # One row per migration applied to this database (see migrations.py)
+    __tablename__ = "SchemaMigrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String, nullable=False)
+    appliedAt = Column(DateTime(timezone=True), server_default=func.now())
+    durationMs = Column(Integer, nullable=False, default=0)
+
+class TableVersion(Base):
+    # One row per table, bumped by triggers on every insert, update and delete
+    # (see etags.py). Lets GET routes tell whether anything they read has changed.
+    __tablename__ = "TableVersions"
+
+    tableName = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    modifiedAt = Column(Integer, nullable=False, default=0)  # unix time in seconds
+
+class SyncChange(Base):
+    # Change log for /sync, written by triggers (see sync.py). Each entity has at
+    # most one row; every change replaces it with a new row, so seq (AUTOINCREMENT,
+    # never reused) orders entities by their last change. Deleted entities keep a
+    # row with deleted set as their tombstone. op is the last change: "create",
+    # "update" or "delete".
+    __tablename__ = "SyncChanges"
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    entityType = Column(String, nullable=False)
+    entityId = Column(Integer, nullable=False)
+    deleted = Column(Boolean, nullable=False, default=False)
+    op = Column(String, nullable=False, server_default="update")
+
+    __table_args__ = (
+        Index("ix_SyncChanges_entityType_entityId", "entityType", "entityId", unique=True),
+        {"sqlite_autoincrement": True},
+    )
@@ -0,0 +1,104 @@
+import base64
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import String, tuple_, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+import models
+
+# pagination.py implements keyset (cursor) pagination for the list endpoints.
+# A page is located by the sort key of the last row the client saw, so the database
+# seeks straight to it through an index instead of counting past OFFSET rows.
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Sort keys per listing. createdAt is compared as the text SQLite stores, so the
+# value round-tripped through a cursor matches the stored value exactly.
+JOURNAL_ENTRY_KEY = (type_coerce(models.JournalEntry.createdAt, String), models.JournalEntry.id)
+PRAYER_REQUEST_KEY = (type_coerce(models.PrayerRequest.createdAt, String), models.PrayerRequest.id)
+ARCHIVED_PRAYER_REQUEST_KEY = (
+    type_coerce(models.ArchivedPrayerRequest.createdAt, String), models.ArchivedPrayerRequest.id
+)
+# Tags have no createdAt; ids are assigned in creation order.
+TAG_KEY = (models.Tag.id,)
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def page_query(stmt: Select, key: Tuple, cursor: Optional[str], descending: bool) -> Select:
+    # Selects the sort key after the entity, ordered, starting after the cursor
+    stmt = stmt.add_columns(*(column.label(f"page_key_{i}") for i, column in enumerate(key)))
+    stmt = stmt.order_by(*(column.desc() if descending else column.asc() for column in key))
+    if cursor is not None:
+        values = decode_cursor(cursor, len(key))
+        if descending:
+            stmt = stmt.where(tuple_(*key) < tuple_(*values))
+        else:
+            stmt = stmt.where(tuple_(*key) > tuple_(*values))
+    return stmt
+
+def finish_page(rows, limit: int):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1:])
+    return [row[0] for row in rows], next_cursor
+
+async def fetch_page(
+    db: AsyncSession,
+    stmt: Select,
+    key: Tuple,
+    cursor: Optional[str],
+    skip: int,
+    limit: int,
+    descending: bool = True,
+):
+    # With a cursor the page starts right after the row it encodes; without one the
+    # legacy skip offset is used. Returns the entities and the cursor for the next
+    # page, or None when this was the last page.
+    stmt = page_query(stmt, key, cursor, descending)
+    if cursor is None and skip:
+        stmt = stmt.offset(skip)
+
+    # Fetch one extra row to find out whether another page exists.
+    rows = (await db.execute(stmt.limit(limit + 1))).all()
+    return finish_page(rows, limit)
+
+async def fetch_merged_page(
+    db: AsyncSession,
+    sources: Sequence[Tuple[Select, Tuple]],
+    cursor: Optional[str],
+    skip: int,
+    limit: int,
+    descending: bool = True,
+):
+    # Like fetch_page, over several (statement, key) listings whose keys compare
+    # alike and never collide, such as hot and archived prayer requests. Each
+    # source returns the rows the page could need and they are merged by key.
+    rows = []
+    for stmt, key in sources:
+        stmt = page_query(stmt, key, cursor, descending)
+        needed = limit + 1 if cursor is not None else skip + limit + 1
+        rows += (await db.execute(stmt.limit(needed))).all()
+    rows.sort(key=lambda row: tuple(row[1:]), reverse=descending)
+    if cursor is None:
+        rows = rows[skip:]
+    return finish_page(rows[:limit + 1], limit)
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,94 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+
+import config
+
+# querycount.py counts the SQL statements a request executes and checks them
+# against a per-route budget, which catches N+1 loading as soon as a route's
+# query count starts growing with the size of its result.
+
+logger = logging.getLogger(__name__)
+
+# Maximum statements per request for the list/detail routes, keyed by
+# (method, route path). These stay fixed no matter how many rows a page holds, and
+# include the table version lookup done for conditional GETs (see etags.py).
+QUERY_BUDGETS = {
+    ("GET", "/tags/"): 2,
+    ("GET", "/tags/facets"): 2,
+    # include_archived adds the archived prayer requests with their tags and updates
+    ("GET", "/journal-entries/"): 9,
+    ("GET", "/journal-entries/{entry_id}"): 9,
+    # include_archived adds the archive's page (or a lookup after a hot miss)
+    ("GET", "/prayer-requests/"): 7,
+    ("GET", "/prayer-requests/{request_id}"): 5,
+    ("GET", "/prayer-requests/{request_id}/updates/"): 3,
+    ("GET", "/verses/{ref}/journal-entries"): 6,
+    ("GET", "/stats"): 3,
+    # The change log, then each entity type with its journal/prayer request plan
+    ("GET", "/sync"): 11,
+}
+
+QUERY_COUNT_HEADER = "X-Query-Count"
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+_current_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.count += 1
+        counter.statements.append(statement)
+
+def install(sync_engine):
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+def check_budget(method: str, path: str, counter: QueryCounter):
+    budget = QUERY_BUDGETS.get((method, path))
+    if budget is not None and counter.count > budget:
+        raise QueryBudgetExceeded(
+            f"{method} {path} ran {counter.count} queries (budget {budget}):\n"
+            + "\n".join(counter.statements)
+        )
+
+async def query_budget_middleware(request: Request, call_next):
+    # QUERY_BUDGET_MODE: "off" skips counting, "warn" logs over-budget requests
+    # and "raise" turns them into a 500 response (for development and CI runs).
+    if config.QUERY_BUDGET_MODE == "off":
+        return await call_next(request)
+
+    with count_queries() as counter:
+        response = await call_next(request)
+    if config.QUERY_COUNT_HEADER:
+        response.headers[QUERY_COUNT_HEADER] = str(counter.count)
+    route = request.scope.get("route")
+    if route is not None:
+        try:
+            check_budget(request.method, route.path, counter)
+        except QueryBudgetExceeded as exc:
+            if config.QUERY_BUDGET_MODE == "raise":
+                logger.error("%s", exc)
+                return JSONResponse(status_code=500, content={"detail": str(exc)})
+            logger.warning("%s", exc)
+    return response
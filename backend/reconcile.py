@@ -0,0 +1,134 @@
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+import models
+from cache import load_tags
+
+# reconcile.py applies the nested prayer requests of a journal entry payload to the
+# database as one diff: everything the payload references is loaded up front with
+# one query per table, then new, changed and removed prayer requests are written in
+# batches instead of one round trip per prayer request.
+
+def pick_tags(tags_by_id: Dict[int, models.Tag], tag_ids: Iterable[int]) -> List[models.Tag]:
+    return [tags_by_id[tag_id] for tag_id in dict.fromkeys(tag_ids) if tag_id in tags_by_id]
+
+def referenced_tag_ids(entry) -> set:
+    tag_ids = set(entry.tags)
+    for pr in entry.prayerRequests:
+        tag_ids.update(pr.tags)
+    return tag_ids
+
+# Rows per multi-row INSERT, well below SQLite's bound parameter limit
+INSERT_BATCH_SIZE = 500
+
+async def insert_prayer_requests(
+    db: AsyncSession,
+    items: list,
+    tags_by_id: Dict[int, models.Tag],
+    journal_id: Optional[int] = None,
+) -> List[int]:
+    # Inserts the requests with multi-row INSERTs, then their tag (and journal entry)
+    # links with one executemany each. Returns the new ids in the order of items.
+    rows = [
+        {
+            "title": pr_data.title,
+            "description": pr_data.description,
+            "checked": pr_data.checked,
+            "assignedToId": pr_data.assignedToId,
+        }
+        for pr_data in items
+    ]
+    request_ids = []
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        result = await db.execute(
+            insert(models.PrayerRequest)
+            .values(rows[start:start + INSERT_BATCH_SIZE])
+            .returning(models.PrayerRequest.id)
+        )
+        # SQLite hands out rowids in VALUES order within one statement, so the
+        # sorted ids line up with the rows of the batch.
+        request_ids += sorted(result.scalars())
+
+    tag_rows = [
+        {"prayerRequestId": request_id, "tagId": tag.id}
+        for request_id, pr_data in zip(request_ids, items)
+        for tag in pick_tags(tags_by_id, pr_data.tags)
+    ]
+    if tag_rows:
+        await db.execute(insert(models.prayerRequestTag), tag_rows)
+    if journal_id is not None and request_ids:
+        await db.execute(
+            insert(models.journal_prayer_request),
+            [{"prayerRequestId": request_id, "journalId": journal_id} for request_id in request_ids],
+        )
+    return request_ids
+
+async def delete_prayer_requests(db: AsyncSession, request_ids: List[int]):
+    # Bulk equivalent of session.delete() for each request: drop its association
+    # rows and detach its updates, then delete the requests in one statement.
+    if not request_ids:
+        return
+    await db.execute(delete(models.prayerRequestTag).where(models.prayerRequestTag.c.prayerRequestId.in_(request_ids)))
+    await db.execute(delete(models.journal_prayer_request).where(models.journal_prayer_request.c.prayerRequestId.in_(request_ids)))
+    await db.execute(
+        update(models.PrayerRequestUpdate)
+        .where(models.PrayerRequestUpdate.prayerRequestId.in_(request_ids))
+        .values(prayerRequestId=None)
+    )
+    await db.execute(delete(models.PrayerRequest).where(models.PrayerRequest.id.in_(request_ids)))
+
+async def reconcile_prayer_requests(
+    db: AsyncSession,
+    db_entry: models.JournalEntry,
+    items: list,
+    tags_by_id: Dict[int, models.Tag],
+):
+    # db_entry.prayerRequests (and their tags) must already be loaded. Requests
+    # created here are not added to db_entry.prayerRequests; reload the entry to
+    # see them.
+    current = {pr.id: pr for pr in db_entry.prayerRequests}
+    wanted_ids = {pr.id for pr in items if pr.id is not None}
+
+    # Requests referenced by id that aren't linked to this entry yet
+    missing_ids = wanted_ids - set(current)
+    if missing_ids:
+        result = await db.scalars(
+            select(models.PrayerRequest)
+            .options(selectinload(models.PrayerRequest.tags))
+            .where(models.PrayerRequest.id.in_(missing_ids))
+        )
+        current.update({pr.id: pr for pr in result})
+
+    removed = [pr for pr in db_entry.prayerRequests if pr.id not in wanted_ids]
+    for pr in removed:
+        db_entry.prayerRequests.remove(pr)
+    linked_ids = {pr.id for pr in db_entry.prayerRequests}
+
+    new_items = []
+    for pr_data in items:
+        if pr_data.id is None:
+            new_items.append(pr_data)
+            continue
+        db_pr = current.get(pr_data.id)
+        if db_pr is None:
+            continue
+        db_pr.title = pr_data.title
+        db_pr.description = pr_data.description
+        db_pr.assignedToId = pr_data.assignedToId
+        db_pr.checked = pr_data.checked
+        if pr_data.tags:
+            db_pr.tags = pick_tags(tags_by_id, pr_data.tags)
+        if db_pr.id not in linked_ids:
+            db_entry.prayerRequests.append(db_pr)
+            linked_ids.add(db_pr.id)
+
+    # Flush the ORM changes (batched by the unit of work) before the bulk deletes so
+    # the entry's own association rows are already gone when the requests are deleted.
+    await db.flush()
+    await delete_prayer_requests(db, [pr.id for pr in removed])
+    for pr in removed:
+        db.expunge(pr)
+    await insert_prayer_requests(db, new_items, tags_by_id, journal_id=db_entry.id)
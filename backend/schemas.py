@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 from datetime import datetime
 
 # schemas.py defines Pydantic models that are used for data validation, serialization, 
@@ -18,6 +18,17 @@ class Tag(TagBase):
     class Config:
         from_attributes = True
 
+class TagFacet(Tag):
+    journalEntries: int
+    prayerRequests: int
+
+class Person(BaseModel):
+    id: int
+    firstName: str
+    lastName: str
+    class Config:
+        from_attributes = True
+
 class PrayerRequestUpdateBase(BaseModel):
     title: str
     content: str
@@ -31,12 +42,13 @@ class PrayerRequestUpdate(PrayerRequestUpdateBase):
     prayerRequestId: int
     class Config:
         from_attributes = True
+        populate_by_name = True
 
 class PrayerRequestBase(BaseModel):
     title: str
     description: str
-    isForMe: bool = False
     checked: bool = False
+    assignedToId: Optional[int] = None
     tags: List[int] = []
 
 class PrayerRequestCreate(PrayerRequestBase):
@@ -44,21 +56,32 @@ class PrayerRequestCreate(PrayerRequestBase):
 
 class PrayerRequest(PrayerRequestBase):
     id: int
-    createdAt: datetime
-    updatedAt: Optional[datetime] = None
-    journalEntryId: Optional[int] = None
+    description: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime]
+    assignedTo: Optional[Person] = None
     updates: List[PrayerRequestUpdate] = []
     tags: List[Tag] = []
+    model_config = {
+        "from_attributes": True,
+        "populate_by_name": True,
+        "alias_generator": lambda x: x.split('_')[0] + ''.join(word.capitalize() for word in x.split('_')[1:]),
+    }
 
-    class Config:
-        from_attributes = True
+class PrayerRequestInJournalEntry(BaseModel):
+    title: str
+    description: Optional[str] = None
+    checked: bool = False
+    assignedToId: Optional[int] = None
+    tags: List[int] = []
+    id: Optional[int] = None
 
 class JournalEntryBase(BaseModel):
     title: Optional[str] = None
     content: str
     bibleVerses: List[str] = []
     tags: List[int] = []
-    prayerRequests: List[PrayerRequestBase] = []
+    prayerRequests: List[PrayerRequestInJournalEntry] = []
 
 class JournalEntryCreate(JournalEntryBase):
     pass
@@ -66,9 +89,134 @@ class JournalEntryCreate(JournalEntryBase):
 class JournalEntry(JournalEntryBase):
     id: int
     createdAt: datetime
-    updatedAt: Optional[datetime] = None
+    updatedAt: Optional[datetime]
+    bibleVerses: List[str] = Field([], validation_alias="bibleVersesList")
     tags: List[Tag] = []
     prayerRequests: List[PrayerRequest] = []
+    model_config = {
+        "from_attributes": True,
+        "populate_by_name": True,
+    }
+
+# ?include_archived: also the linked prayer requests that were archived
+class JournalEntryWithArchived(JournalEntry):
+    prayerRequests: List[PrayerRequest] = Field([], validation_alias="prayerRequestsWithArchived")
 
+# List views without bodies or relationships (?view=summary, see fieldsets.py)
+class JournalEntrySummary(BaseModel):
+    id: int
+    title: Optional[str] = None
+    createdAt: datetime
+    updatedAt: Optional[datetime]
+    class Config:
+        from_attributes = True
+
+class PrayerRequestSummary(BaseModel):
+    id: int
+    title: str
+    checked: bool = False
+    assignedToId: Optional[int] = None
+    createdAt: datetime
+    updatedAt: Optional[datetime]
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class PrayerRequestUpdateSummary(BaseModel):
+    id: int
+    title: str
+    date: datetime
+    prayerRequestId: int
+    class Config:
+        from_attributes = True
+
+class SearchResult(BaseModel):
+    type: str
+    id: int
+    title: Optional[str] = None
+    snippet: str
+    rank: float
+    prayerRequestId: Optional[int] = None
+
+# Bulk operations. Each payload lists items to create, update and delete; the
+# response reports the outcome of every item by its operation and list index.
+BulkMode = Literal["atomic", "partial"]
+
+class TagBulkUpdate(TagBase):
+    id: int
+
+class TagBulk(BaseModel):
+    create: List[TagCreate] = []
+    update: List[TagBulkUpdate] = []
+    delete: List[int] = []
+
+class PrayerRequestBulkUpdate(PrayerRequestBase):
+    id: int
+
+class PrayerRequestBulk(BaseModel):
+    create: List[PrayerRequestCreate] = []
+    update: List[PrayerRequestBulkUpdate] = []
+    delete: List[int] = []
+
+class PrayerRequestUpdateBulkUpdate(PrayerRequestUpdateBase):
+    id: int
+
+class PrayerRequestUpdateBulk(BaseModel):
+    create: List[PrayerRequestUpdateCreate] = []
+    update: List[PrayerRequestUpdateBulkUpdate] = []
+    delete: List[int] = []
+
+class BulkItemResult(BaseModel):
+    op: Literal["create", "update", "delete"]
+    index: int
+    id: Optional[int] = None
+    status: Literal["ok", "error", "skipped"]
+    detail: Optional[str] = None
+
+class BulkResult(BaseModel):
+    committed: bool
+    results: List[BulkItemResult] = []
+
+# Dashboard statistics (GET /stats)
+class PrayerRequestCounts(BaseModel):
+    open: int
+    answered: int
+    total: int
+
+class PersonPrayerRequestCounts(BaseModel):
+    assignedToId: Optional[int] = None
+    firstName: Optional[str] = None
+    lastName: Optional[str] = None
+    open: int
+    answered: int
+
+class WeekCount(BaseModel):
+    week: str
+    updates: int
+
+class JournalStreaks(BaseModel):
+    currentStreak: int
+    longestStreak: int
+    daysWithEntries: int
+    lastEntryDate: Optional[str] = None
+
+class StatsResult(BaseModel):
+    prayerRequests: PrayerRequestCounts
+    byPerson: List[PersonPrayerRequestCounts]
+    updatesPerWeek: List[WeekCount]
+    journal: JournalStreaks
+
+# Incremental sync. token is passed back as ?since= to fetch the next changes.
+class SyncDeleted(BaseModel):
+    journalEntries: List[int] = []
+    prayerRequests: List[int] = []
+    prayerRequestUpdates: List[int] = []
+    tags: List[int] = []
+
+class SyncResult(BaseModel):
+    token: str
+    hasMore: bool
+    journalEntries: List[JournalEntry] = []
+    prayerRequests: List[PrayerRequest] = []
+    prayerRequestUpdates: List[PrayerRequestUpdate] = []
+    tags: List[Tag] = []
+    deleted: SyncDeleted
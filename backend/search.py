@@ -0,0 +1,119 @@
+import html
+import sys
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import engine, get_async_db
+from schemas import SearchResult
+
+# search.py provides full-text search over journal entries, prayer requests and
+# prayer request updates using SQLite FTS5. Each searchable table has an external
+# content FTS index that triggers keep in sync, so the index stores only the
+# tokens and reads titles/snippets back from the source table.
+
+# (fts table, source table, indexed columns, bm25 column weights)
+SEARCH_INDEXES = {
+    "journal_entry": ("JournalEntriesFts", "JournalEntries", ("title", "content"), (10.0, 1.0)),
+    "prayer_request": ("PrayerRequestsFts", "PrayerRequests", ("title", "description"), (10.0, 1.0)),
+    "prayer_request_update": ("PrayerRequestUpdatesFts", "PrayerRequestUpdates", ("content",), (1.0,)),
+}
+
+# Snippets are HTML: the matched text, escaped, with each match wrapped in <mark>.
+# snippet() marks matches with these private-use characters instead, so the text
+# can be escaped before the markers become tags and user content never reaches
+# the client as markup.
+MATCH_START, MATCH_END = "\ue000", "\ue001"
+
+def snippet_html(snippet: str) -> str:
+    return html.escape(snippet).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
+
+def search_schema_statements():
+    statements = []
+    for fts, source, columns, _ in SEARCH_INDEXES.values():
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"new.{column}" for column in columns)
+        old_values = ", ".join(f"old.{column}" for column in columns)
+        statements += [
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS "{fts}" USING fts5('
+            f"{column_list}, content='{source}', content_rowid='id', tokenize='porter unicode61')",
+            f'CREATE TRIGGER IF NOT EXISTS "{fts}_ai" AFTER INSERT ON "{source}" BEGIN '
+            f'INSERT INTO "{fts}"(rowid, {column_list}) VALUES (new.id, {new_values}); END',
+            f'CREATE TRIGGER IF NOT EXISTS "{fts}_ad" AFTER DELETE ON "{source}" BEGIN '
+            f'INSERT INTO "{fts}"("{fts}", rowid, {column_list}) VALUES (\'delete\', old.id, {old_values}); END',
+            f'CREATE TRIGGER IF NOT EXISTS "{fts}_au" AFTER UPDATE OF {column_list} ON "{source}" BEGIN '
+            f'INSERT INTO "{fts}"("{fts}", rowid, {column_list}) VALUES (\'delete\', old.id, {old_values}); '
+            f'INSERT INTO "{fts}"(rowid, {column_list}) VALUES (new.id, {new_values}); END',
+        ]
+    return statements
+
+def create_search_schema(bind=engine):
+    with bind.begin() as connection:
+        existing = set(connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars())
+        for statement in search_schema_statements():
+            connection.execute(text(statement))
+        # A freshly created index starts empty; fill it from rows that already exist.
+        for fts, _, _, _ in SEARCH_INDEXES.values():
+            if fts not in existing:
+                connection.execute(text(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')'))
+
+def rebuild_search_indexes(bind=engine):
+    # Re-reads every row of the source tables; used to backfill rows that existed
+    # before the triggers were installed.
+    create_search_schema(bind)
+    with bind.begin() as connection:
+        for fts, _, _, _ in SEARCH_INDEXES.values():
+            connection.execute(text(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')'))
+            connection.execute(text(f'INSERT INTO "{fts}"("{fts}") VALUES (\'optimize\')'))
+
+def to_match_query(q: str) -> str:
+    # Quote every term so user input can't inject FTS5 query syntax; the last term
+    # is matched as a prefix so results show up while the user is still typing.
+    terms = ['"' + term.replace('"', '""') + '"' for term in q.split()]
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search query is empty")
+    terms[-1] += "*"
+    return " ".join(terms)
+
+router = APIRouter()
+
+@router.get("/search", response_model=List[SearchResult])
+async def search(
+    q: str = Query(..., min_length=1),
+    types: List[str] = Query(list(SEARCH_INDEXES)),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+):
+    unknown = set(types) - set(SEARCH_INDEXES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown search types: {', '.join(sorted(unknown))}")
+
+    selects = []
+    for result_type in types:
+        fts, source, _, weights = SEARCH_INDEXES[result_type]
+        bm25_args = ", ".join(str(weight) for weight in weights)
+        title = "NULL" if result_type == "prayer_request_update" else f'"{fts}".title'
+        prayer_request_id = 'src."prayerRequestId"' if result_type == "prayer_request_update" else "NULL"
+        selects.append(
+            f"SELECT '{result_type}' AS type, \"{fts}\".rowid AS id, {title} AS title, "
+            f"snippet(\"{fts}\", -1, '{MATCH_START}', '{MATCH_END}', '…', 12) AS snippet, "
+            f"bm25(\"{fts}\", {bm25_args}) AS rank, {prayer_request_id} AS \"prayerRequestId\" "
+            f"FROM \"{fts}\" JOIN \"{source}\" AS src ON src.id = \"{fts}\".rowid "
+            f"WHERE \"{fts}\" MATCH :query"
+        )
+    statement = text(" UNION ALL ".join(selects) + " ORDER BY rank LIMIT :limit")
+
+    try:
+        rows = await db.execute(statement, {"query": to_match_query(q), "limit": limit})
+    except OperationalError:
+        raise HTTPException(status_code=400, detail="Invalid search query")
+    return [SearchResult(**{**row, "snippet": snippet_html(row["snippet"])}) for row in rows.mappings()]
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python search.py backfill")
+    rebuild_search_indexes()
+    print("Search indexes rebuilt")
@@ -0,0 +1,116 @@
+import time
+import typing
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+import orjson
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+import metrics
+
+# serialization.py turns ORM objects into response bodies without going through
+# FastAPI's response_model handling, which validates the objects, dumps them to
+# Python dicts, walks the result again with jsonable_encoder and finally encodes it
+# with the stdlib json module.
+#
+# For each response model a converter is compiled once from the model's fields: it
+# reads the ORM attributes the model would read (honouring aliases and
+# validation_alias) straight into a dict, and orjson encodes the result. Rows come
+# from our own database, so they are not validated again on the way out. Types the
+# compiler doesn't handle fall back to a cached TypeAdapter, which validates and
+# dumps with pydantic-core.
+#
+# Routes keep their response_model for the OpenAPI schema and return
+# json_response(...) instead of the ORM objects. Everything else (plain dicts,
+# error bodies) is encoded by ORJSONResponse, the app's default response class.
+
+DefaultResponse = ORJSONResponse
+
+Converter = Callable[[Any], Any]
+
+@lru_cache(maxsize=None)
+def adapter(response_type) -> TypeAdapter:
+    return TypeAdapter(response_type)
+
+def is_model(annotation) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+def unwrap_optional(annotation):
+    if typing.get_origin(annotation) is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0], True
+    return annotation, False
+
+def contains_model(annotation) -> bool:
+    return is_model(annotation) or any(contains_model(arg) for arg in typing.get_args(annotation))
+
+@lru_cache(maxsize=None)
+def compile_type(annotation) -> Optional[Converter]:
+    # Returns a converter for Model, Optional[Model] and List[Model], the identity
+    # for values orjson encodes as is, and None for anything else.
+    annotation, optional = unwrap_optional(annotation)
+    if is_model(annotation):
+        convert = compile_model(annotation)
+        if convert is None:
+            return None
+        return (lambda value: None if value is None else convert(value)) if optional else convert
+    if typing.get_origin(annotation) in (list, typing.List):
+        (item,) = typing.get_args(annotation) or (Any,)
+        convert_item = compile_type(item)
+        if convert_item is None:
+            return None
+        return lambda values: None if values is None else [convert_item(value) for value in values]
+    if contains_model(annotation):
+        return None
+    return lambda value: value
+
+@lru_cache(maxsize=None)
+def compile_model(model) -> Optional[Converter]:
+    fields = []
+    for name, field in model.model_fields.items():
+        key = field.alias or name
+        source = field.validation_alias if isinstance(field.validation_alias, str) else key
+        convert = compile_type(field.annotation)
+        if convert is None:
+            return None
+        default = None if field.is_required() else field.get_default(call_default_factory=True)
+        fields.append((key, source, convert, default))
+
+    def convert_model(obj):
+        # Loaded attributes are read from the instance dict, skipping SQLAlchemy's
+        # attribute instrumentation; anything else (properties) goes through getattr.
+        values = getattr(obj, "__dict__", {})
+        return {
+            key: convert(values[source] if source in values else getattr(obj, source, default))
+            for key, source, convert, default in fields
+        }
+    return convert_model
+
+def to_json(response_type, value: Any) -> bytes:
+    # Conversion and encoding are timed separately for the request profile (see
+    # metrics.py); the TypeAdapter fallback does both at once and counts as conversion.
+    started = time.perf_counter()
+    convert = compile_type(response_type)
+    if convert is None:
+        type_adapter = adapter(response_type)
+        body = type_adapter.dump_json(type_adapter.validate_python(value, from_attributes=True), by_alias=True)
+        metrics.record_serialization(time.perf_counter() - started, 0.0)
+        return body
+    converted = convert(value)
+    encode_started = time.perf_counter()
+    body = orjson.dumps(converted)
+    metrics.record_serialization(encode_started - started, time.perf_counter() - encode_started)
+    return body
+
+def body_response(body: bytes, response: Optional[Response] = None) -> Response:
+    # Carries over headers set on the route's injected Response (ETag, cursors)
+    headers = None
+    if response is not None:
+        headers = {name: value for name, value in response.headers.items() if name.lower() != "content-length"}
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def json_response(response_type, value: Any, response: Optional[Response] = None) -> Response:
+    return body_response(to_json(response_type, value), response)
@@ -0,0 +1,337 @@
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+import cache
+import config
+import events
+import etags
+import metrics
+import migrations
+import querycount
+from database import create_async_sqlite_engine, create_sqlite_engine, current_shard
+
+# shards.py gives every tenant its own SQLite database, so each has its own file
+# and write lock instead of sharing one. With SHARDING on, shard_middleware reads
+# the tenant key from the SHARD_HEADER request header and points the request's
+# sessions at SHARD_DIR/<tenant>.db (see database.RoutingSession); routes don't
+# change.
+#
+# The router keeps at most SHARD_MAX_OPEN engines open, closing the least recently
+# used idle one when another is needed and any that have been idle for
+# SHARD_IDLE_TIMEOUT. A shard's schema is created (or brought up to date) by
+# migrations.upgrade the first time this process opens it, so a new tenant's
+# database appears on its first request.
+#
+#   python shards.py list
+#   python shards.py vacuum <tenant>
+#   python shards.py move <from> <to>
+#
+# move takes tenant keys or paths of .db files, so it renames a tenant, imports an
+# existing database (e.g. the unsharded sql_app.db) as a tenant or exports one.
+# The same operations are on /admin/shards. Stop the server, or let it close the
+# shard first, before moving a shard from the command line.
+
+logger = logging.getLogger(__name__)
+
+TENANT_KEY = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]{0,63}")
+
+def shard_path(key: str) -> str:
+    return os.path.join(config.SHARD_DIR, f"{key}.db")
+
+def database_files(path: str) -> List[str]:
+    return [path + suffix for suffix in ("", "-wal", "-shm", "-migrate.lock")]
+
+def file_size(path: str) -> int:
+    return sum(os.path.getsize(name) for name in database_files(path) if os.path.exists(name))
+
+def create_shard_schema(path: str):
+    bind = create_sqlite_engine(f"sqlite:///{path}")
+    try:
+        migrations.upgrade(bind)
+    finally:
+        bind.dispose()
+
+class Shard:
+    def __init__(self, key: str):
+        self.key = key
+        self.path = shard_path(key)
+        self.engine = create_async_sqlite_engine(f"sqlite+aiosqlite:///{self.path}")
+        # Requests (and jobs) using the shard right now; only idle shards are closed
+        self.active = 0
+        self.last_used = time.monotonic()
+        sync_engine = self.engine.sync_engine
+        querycount.install(sync_engine)
+        metrics.install(sync_engine)
+        cache.install(sync_engine)
+        events.install(sync_engine, key)
+
+class ShardRouter:
+    def __init__(self, max_open: int, idle_timeout: float):
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self.open: "OrderedDict[str, Shard]" = OrderedDict()
+        # Shards whose schema this process has already brought up to date
+        self.ready: Set[str] = set()
+        # Shards held closed for an admin operation (see hold); requests wait for them
+        self.held: Dict[str, asyncio.Event] = {}
+        self.opening = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.opened = 0
+        self.closed = 0
+
+    async def acquire(self, key: str) -> Shard:
+        while True:
+            if key in self.held:
+                await self.held[key].wait()
+                continue
+            shard = self.open.get(key)
+            if shard is not None:
+                break
+            async with self.opening:
+                if key in self.held:
+                    continue
+                shard = self.open.get(key)
+                if shard is None:
+                    if key not in self.ready:
+                        os.makedirs(config.SHARD_DIR, exist_ok=True)
+                        await asyncio.to_thread(create_shard_schema, shard_path(key))
+                        self.ready.add(key)
+                    shard = self.open[key] = Shard(key)
+                    self.opened += 1
+            break
+        self.open.move_to_end(key)
+        shard.active += 1
+        shard.last_used = time.monotonic()
+        await self.close_over_limit()
+        return shard
+
+    def release(self, shard: Shard):
+        shard.active -= 1
+        shard.last_used = time.monotonic()
+
+    @asynccontextmanager
+    async def use(self, key: str) -> AsyncIterator[Shard]:
+        shard = await self.acquire(key)
+        token = current_shard.set(shard)
+        try:
+            yield shard
+        finally:
+            current_shard.reset(token)
+            self.release(shard)
+
+    async def close(self, key: str):
+        # Connections still checked out (a streaming response) close when returned
+        shard = self.open.pop(key, None)
+        if shard is not None:
+            await shard.engine.dispose()
+            self.closed += 1
+
+    @asynccontextmanager
+    async def hold(self, *keys: str) -> AsyncIterator[None]:
+        # Closes the shards of keys and keeps them closed until the block ends, so an
+        # admin operation has their files to itself: requests for them wait instead
+        # of reopening a file that is being copied or removed. Taken under the
+        # opening lock, so no request is halfway through opening one of them.
+        async with self.opening:
+            for key in keys:
+                shard = self.open.get(key)
+                if key in self.held or (shard is not None and shard.active):
+                    raise HTTPException(status_code=409, detail="Shard is in use")
+            released = {key: asyncio.Event() for key in keys}
+            self.held.update(released)
+        try:
+            for key in keys:
+                await self.close(key)
+                self.ready.discard(key)
+                # Cached tags and pages would outlive the file they describe
+                cache.forget_tenant(key)
+            yield
+        finally:
+            for key, event in released.items():
+                del self.held[key]
+                event.set()
+
+    async def close_over_limit(self):
+        idle = [key for key, shard in self.open.items() if shard.active == 0]
+        for key in idle[:max(0, len(self.open) - self.max_open)]:
+            await self.close(key)
+
+    async def close_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        for key, shard in list(self.open.items()):
+            if shard.active == 0 and shard.last_used < cutoff:
+                await self.close(key)
+
+    async def loop(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 4))
+            try:
+                await self.close_idle()
+            except Exception:
+                logger.exception("Closing idle shards failed")
+
+    def start(self):
+        if config.SHARDING and self.task is None:
+            self.task = asyncio.create_task(self.loop())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        for key in list(self.open):
+            await self.close(key)
+
+    async def each_engine(self):
+        # Every shard on disk in turn, for jobs that cover all tenants (archive.py)
+        for key in list_tenants():
+            async with self.use(key) as shard:
+                yield shard.engine
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "open": len(self.open),
+            "maxOpen": self.max_open,
+            "opened": self.opened,
+            "closed": self.closed,
+        }
+
+router = ShardRouter(config.SHARD_MAX_OPEN, config.SHARD_IDLE_TIMEOUT)
+
+async def shard_middleware(request: Request, call_next):
+    # Requests without a tenant still reach routes that don't touch the database
+    # (/metrics, /admin/shards); the others get a 400 from database.RoutingSession.
+    if not config.SHARDING:
+        return await call_next(request)
+    key = request.headers.get(config.SHARD_HEADER)
+    if key is None:
+        return await call_next(request)
+    if not TENANT_KEY.fullmatch(key):
+        return JSONResponse(status_code=400, content={"detail": f"Invalid {config.SHARD_HEADER} header"})
+    async with router.use(key):
+        return await call_next(request)
+
+# Admin operations
+
+def list_tenants() -> List[str]:
+    if not os.path.isdir(config.SHARD_DIR):
+        return []
+    return sorted(
+        name[:-3] for name in os.listdir(config.SHARD_DIR)
+        if name.endswith(".db") and TENANT_KEY.fullmatch(name[:-3])
+    )
+
+def vacuum_file(path: str) -> dict:
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    before = file_size(path)
+    bind = create_sqlite_engine(f"sqlite:///{path}")
+    try:
+        with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("VACUUM")
+            connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        bind.dispose()
+    return {"sizeBefore": before, "sizeAfter": file_size(path)}
+
+def resolve(name: str) -> str:
+    # A tenant key or the path of a database file
+    if TENANT_KEY.fullmatch(name) and not name.endswith(".db"):
+        return shard_path(name)
+    return name
+
+def move_file(source: str, target: str):
+    # Copies through SQLite's backup API, which gives a consistent copy even with
+    # a WAL file next to the source, then removes the source. The copy gets a new
+    # etags.DATABASE_ROW, so no ETag issued for either name before still matches.
+    if not os.path.exists(source):
+        raise FileNotFoundError(source)
+    if os.path.exists(target):
+        raise FileExistsError(target)
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    with sqlite3.connect(source) as source_db, sqlite3.connect(target) as target_db:
+        source_db.backup(target_db)
+        if target_db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'TableVersions'").fetchone():
+            target_db.execute(
+                'UPDATE "TableVersions" SET version = abs(random()), '
+                '"modifiedAt" = CAST(strftime(\'%s\', \'now\') AS INTEGER) WHERE "tableName" = ?',
+                (etags.DATABASE_ROW,),
+            )
+    source_db.close()
+    target_db.close()
+    for name in database_files(source):
+        if os.path.exists(name):
+            os.remove(name)
+
+def check_key(key: str):
+    if not TENANT_KEY.fullmatch(key):
+        raise HTTPException(status_code=400, detail="Invalid tenant key")
+    if not os.path.exists(shard_path(key)):
+        raise HTTPException(status_code=404, detail="Shard not found")
+
+admin_router = APIRouter()
+
+@admin_router.get("/admin/shards")
+async def read_shards():
+    now = time.monotonic()
+    shards = []
+    for key in list_tenants():
+        shard = router.open.get(key)
+        shards.append({
+            "tenant": key,
+            "sizeBytes": file_size(shard_path(key)),
+            "open": shard is not None,
+            "active": shard.active if shard is not None else 0,
+            "idleSeconds": round(now - shard.last_used, 1) if shard is not None else None,
+        })
+    return {"enabled": config.SHARDING, **router.stats(), "shards": shards}
+
+@admin_router.post("/admin/shards/{tenant}/vacuum")
+async def vacuum_shard(tenant: str):
+    check_key(tenant)
+    async with router.hold(tenant):
+        return {"tenant": tenant, **await asyncio.to_thread(vacuum_file, shard_path(tenant))}
+
+@admin_router.post("/admin/shards/{tenant}/move")
+async def move_shard(tenant: str, to: str):
+    check_key(tenant)
+    if not TENANT_KEY.fullmatch(to):
+        raise HTTPException(status_code=400, detail="Invalid tenant key")
+    async with router.hold(tenant, to):
+        if os.path.exists(shard_path(to)):
+            raise HTTPException(status_code=409, detail="Target shard already exists")
+        await asyncio.to_thread(move_file, shard_path(tenant), shard_path(to))
+    return {"tenant": to, "sizeBytes": file_size(shard_path(to))}
+
+if __name__ == "__main__":
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else (None, [])
+    try:
+        if command == "list" and not args:
+            for key in list_tenants():
+                print(f"{key}\t{file_size(shard_path(key))}")
+        elif command == "vacuum" and len(args) == 1:
+            sizes = vacuum_file(resolve(args[0]))
+            print(f"Vacuumed {args[0]}: {sizes['sizeBefore']} -> {sizes['sizeAfter']} bytes")
+        elif command == "move" and len(args) == 2:
+            move_file(resolve(args[0]), resolve(args[1]))
+            print(f"Moved {args[0]} to {args[1]}")
+        else:
+            sys.exit("usage: python shards.py list | vacuum <tenant> | move <from> <to>")
+    except FileNotFoundError as exc:
+        sys.exit(f"No database at {exc}")
+    except FileExistsError as exc:
+        sys.exit(f"{exc} already exists")
@@ -0,0 +1,227 @@
+import sys
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import serialization
+from database import engine, get_async_db
+from schemas import StatsResult
+
+# stats.py serves GET /stats, the dashboard numbers: open and answered prayer
+# requests overall and per person, prayer request updates per week and journal
+# streaks. They are read from small summary tables (see models.PrayerRequestStats,
+# UpdateWeekStats and JournalDayStats) instead of grouping the source tables on
+# every load.
+#
+# Triggers on the source tables add a row's contribution on insert, take it away on
+# delete and move it on update, so routes, bulk statements and imports all keep the
+# summaries current. `python stats.py check` recounts everything from the source
+# tables and reports rows that drifted; `python stats.py rebuild` also rewrites the
+# summaries from the recount. Days and weeks are UTC, like the stored timestamps.
+
+# summary table -> (source tables, source columns it depends on, (key column, key
+# expression), {counter column: expression}). {row} is new/old in the triggers and
+# the source table when recounting; rows whose key is NULL aren't counted. Archived
+# rows (see archive.py) still count, so archiving doesn't change the numbers.
+SUMMARIES = {
+    "PrayerRequestStats": (
+        ("PrayerRequests", "ArchivedPrayerRequests"), ("checked", "assignedToId"),
+        ("personId", 'coalesce({row}."assignedToId", 0)'),
+        {"open": "coalesce({row}.checked, 0) = 0", "answered": "coalesce({row}.checked, 0) != 0"},
+    ),
+    "UpdateWeekStats": (
+        ("PrayerRequestUpdates", "ArchivedPrayerRequestUpdates"), ("date",),
+        ("week", "date({row}.date, 'weekday 0', '-6 days')"),
+        {"updates": "1"},
+    ),
+    "JournalDayStats": (
+        ("JournalEntries",), ("createdAt",),
+        ("day", 'date({row}."createdAt")'),
+        {"entries": "1"},
+    ),
+}
+
+def adjust(summary: str, row: str, sign: int) -> str:
+    # Adds (sign 1) or removes (sign -1) the contribution of one source row
+    _, _, (key, key_sql), counters = SUMMARIES[summary]
+    key_sql = key_sql.format(row=row)
+    columns = ", ".join(f'"{column}"' for column in counters)
+    values = ", ".join(f"({expression.format(row=row)}) * {sign}" for expression in counters.values())
+    updates = ", ".join(f'"{column}" = "{column}" + excluded."{column}"' for column in counters)
+    return (
+        f'INSERT INTO "{summary}" ("{key}", {columns}) SELECT {key_sql}, {values} '
+        f'WHERE {key_sql} IS NOT NULL ON CONFLICT ("{key}") DO UPDATE SET {updates};'
+    )
+
+def stats_schema_statements():
+    statements = []
+    for summary, (sources, depends_on, _, _) in SUMMARIES.items():
+        columns = ", ".join(f'"{column}"' for column in depends_on)
+        statements += [statement for source in sources for statement in (
+            f'CREATE TRIGGER IF NOT EXISTS "{source}_stats_ai" AFTER INSERT ON "{source}" BEGIN '
+            f'{adjust(summary, "new", 1)} END',
+            f'CREATE TRIGGER IF NOT EXISTS "{source}_stats_ad" AFTER DELETE ON "{source}" BEGIN '
+            f'{adjust(summary, "old", -1)} END',
+            f'CREATE TRIGGER IF NOT EXISTS "{source}_stats_au" AFTER UPDATE OF {columns} ON "{source}" BEGIN '
+            f'{adjust(summary, "old", -1)} {adjust(summary, "new", 1)} END',
+        )]
+    return statements
+
+def create_stats_schema(bind=engine):
+    with bind.begin() as connection:
+        for summary in SUMMARIES:
+            models.Base.metadata.tables[summary].create(bind=connection, checkfirst=True)
+        for statement in stats_schema_statements():
+            connection.execute(text(statement))
+        # Empty summaries next to existing rows means the data predates the triggers
+        counted = any(
+            connection.execute(text(f'SELECT EXISTS (SELECT 1 FROM "{summary}")')).scalar() for summary in SUMMARIES
+        )
+        uncounted = not counted and any(
+            connection.execute(text(f'SELECT EXISTS (SELECT 1 FROM "{source}")')).scalar()
+            for sources, _, _, _ in SUMMARIES.values() for source in sources
+        )
+    if uncounted:
+        rebuild_stats(bind)
+
+Counts = Dict[str, Dict[object, Tuple[int, ...]]]
+
+def recount(connection) -> Counts:
+    # Every summary computed from scratch from its source table
+    expected = {}
+    for summary, (sources, _, (_, key_sql), counters) in SUMMARIES.items():
+        totals = expected[summary] = {}
+        for source in sources:
+            row = f'"{source}"'
+            key = key_sql.format(row=row)
+            sums = ", ".join(f"sum({expression.format(row=row)})" for expression in counters.values())
+            for key_value, *counts in connection.execute(text(
+                f'SELECT {key}, {sums} FROM "{source}" WHERE {key} IS NOT NULL GROUP BY 1'
+            )):
+                previous = totals.get(key_value, (0,) * len(counts))
+                totals[key_value] = tuple(a + b for a, b in zip(previous, counts))
+    return expected
+
+def stored(connection) -> Counts:
+    current = {}
+    for summary, (_, _, (key, _), counters) in SUMMARIES.items():
+        columns = ", ".join(f'"{column}"' for column in counters)
+        rows = connection.execute(text(f'SELECT "{key}", {columns} FROM "{summary}"'))
+        current[summary] = {row[0]: tuple(row[1:]) for row in rows}
+    return current
+
+def find_drift(expected: Counts, current: Counts) -> List[dict]:
+    # Rows whose stored counts differ from the recount; a row of zeros is the
+    # same as a missing row
+    drift = []
+    for summary, (_, _, _, counters) in SUMMARIES.items():
+        zeros = (0,) * len(counters)
+        for key in sorted(set(expected[summary]) | set(current[summary]), key=str):
+            want = expected[summary].get(key, zeros)
+            have = current[summary].get(key, zeros)
+            if want != have:
+                drift.append({"table": summary, "key": key, "stored": have, "expected": want})
+    return drift
+
+def check_stats(bind=engine) -> List[dict]:
+    with bind.connect() as connection:
+        return find_drift(recount(connection), stored(connection))
+
+def rebuild_stats(bind=engine) -> List[dict]:
+    # Rewrites every summary from the source tables; returns the drift it fixed
+    with bind.begin() as connection:
+        expected = recount(connection)
+        drift = find_drift(expected, stored(connection))
+        for summary, (_, _, (key, _), counters) in SUMMARIES.items():
+            connection.execute(text(f'DELETE FROM "{summary}"'))
+            rows = [
+                {key: row_key, **dict(zip(counters, counts))}
+                for row_key, counts in expected[summary].items()
+            ]
+            if rows:
+                connection.execute(models.Base.metadata.tables[summary].insert(), rows)
+    return drift
+
+def streaks(days: List[date], today: date) -> Tuple[int, int]:
+    # (current, longest) runs of consecutive days; the current run is still going
+    # if its last day is today or yesterday
+    longest = run = 0
+    previous = None
+    for day in days:
+        run = run + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = day
+    current = run if previous is not None and (today - previous).days <= 1 else 0
+    return current, longest
+
+router = APIRouter()
+
+@router.get("/stats", response_model=StatsResult)
+async def read_stats(weeks: int = Query(12, ge=1, le=520), db: AsyncSession = Depends(get_async_db)):
+    # Reads one row per person, week and day with entries, never the source tables
+    today = datetime.utcnow().date()
+    people = (await db.execute(
+        select(
+            models.PrayerRequestStats.personId,
+            models.PrayerRequestStats.open,
+            models.PrayerRequestStats.answered,
+            models.Person.firstName,
+            models.Person.lastName,
+        )
+        .outerjoin(models.Person, models.Person.id == models.PrayerRequestStats.personId)
+        .where((models.PrayerRequestStats.open != 0) | (models.PrayerRequestStats.answered != 0))
+        .order_by(models.PrayerRequestStats.personId)
+    )).all()
+
+    this_week = today - timedelta(days=today.weekday())
+    week_starts = [(this_week - timedelta(weeks=n)).isoformat() for n in reversed(range(weeks))]
+    updates = dict((await db.execute(
+        select(models.UpdateWeekStats.week, models.UpdateWeekStats.updates)
+        .where(models.UpdateWeekStats.week >= week_starts[0])
+    )).all())
+
+    days = list(await db.scalars(
+        select(models.JournalDayStats.day).where(models.JournalDayStats.entries > 0).order_by(models.JournalDayStats.day)
+    ))
+    current, longest = streaks([date.fromisoformat(day) for day in days], today)
+
+    open_count = sum(person.open for person in people)
+    answered = sum(person.answered for person in people)
+    result = SimpleNamespace(
+        prayerRequests=SimpleNamespace(open=open_count, answered=answered, total=open_count + answered),
+        byPerson=[
+            SimpleNamespace(
+                assignedToId=person.personId or None,
+                firstName=person.firstName,
+                lastName=person.lastName,
+                open=person.open,
+                answered=person.answered,
+            )
+            for person in people
+        ],
+        updatesPerWeek=[SimpleNamespace(week=week, updates=updates.get(week, 0)) for week in week_starts],
+        journal=SimpleNamespace(
+            currentStreak=current,
+            longestStreak=longest,
+            daysWithEntries=len(days),
+            lastEntryDate=days[-1] if days else None,
+        ),
+    )
+    return serialization.json_response(StatsResult, result)
+
+if __name__ == "__main__":
+    if sys.argv[1:] not in (["check"], ["rebuild"]):
+        sys.exit("usage: python stats.py check|rebuild")
+    create_stats_schema()
+    drift = check_stats() if sys.argv[1] == "check" else rebuild_stats()
+    for row in drift:
+        print(f"{row['table']} {row['key']}: stored {row['stored']}, expected {row['expected']}")
+    if sys.argv[1] == "check":
+        print(f"{len(drift)} drifted rows")
+        sys.exit(1 if drift else 0)
+    print(f"Statistics rebuilt ({len(drift)} drifted rows fixed)")
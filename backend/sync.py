@@ -0,0 +1,164 @@
+from types import SimpleNamespace
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import serialization
+from database import engine, get_async_db
+from loaders import JOURNAL_ENTRY_PLAN, PRAYER_REQUEST_PLAN, PRAYER_REQUEST_UPDATE_PLAN, TAG_PLAN
+from schemas import SyncResult
+
+# sync.py serves GET /sync?since=<token>, which returns the journal entries, prayer
+# requests, updates and tags created, changed or deleted since the token, so a
+# client can keep a local copy up to date without reloading whole lists.
+#
+# Triggers record every change in SyncChanges (see models.SyncChange), so ORM
+# writes, bulk statements and imports are all picked up, and deletes leave a
+# tombstone. SQLite has a single writer, so the order of seq is the order in which
+# changes were committed and a token never skips a change committed after it.
+#
+# A change to something embedded in a response marks its parent too: updates and
+# tag links mark their prayer request, and prayer requests and links mark the
+# journal entries they belong to. Tag renames are not cascaded; clients should
+# take tag names from the synced tags.
+
+# entity type -> (model, source table, response field, loader plan)
+SYNC_ENTITIES = {
+    "journal_entry": (models.JournalEntry, "JournalEntries", "journalEntries", JOURNAL_ENTRY_PLAN),
+    "prayer_request": (models.PrayerRequest, "PrayerRequests", "prayerRequests", PRAYER_REQUEST_PLAN),
+    "prayer_request_update": (models.PrayerRequestUpdate, "PrayerRequestUpdates", "prayerRequestUpdates", PRAYER_REQUEST_UPDATE_PLAN),
+    "tag": (models.Tag, "tags", "tags", TAG_PLAN),
+}
+
+def mark(entity_type: str, ids_sql: str, op: str = "update") -> str:
+    # Records a change for the rows of entity_type whose id is in ids_sql (a
+    # subquery or single value). Only rows that still exist are marked, so a
+    # cascade never overwrites a tombstone.
+    source = SYNC_ENTITIES[entity_type][1]
+    return (
+        f'INSERT OR REPLACE INTO "SyncChanges" ("entityType", "entityId", deleted, op) '
+        f"SELECT '{entity_type}', id, 0, '{op}' FROM \"{source}\" WHERE id IN ({ids_sql});"
+    )
+
+def backfill(entity_type: str) -> str:
+    # Records a create for every row of entity_type with no entry in the log yet,
+    # i.e. rows written before the triggers existed
+    source = SYNC_ENTITIES[entity_type][1]
+    return (
+        f'INSERT INTO "SyncChanges" ("entityType", "entityId", deleted, op) '
+        f"SELECT '{entity_type}', id, 0, 'create' FROM \"{source}\" WHERE id NOT IN "
+        f'(SELECT "entityId" FROM "SyncChanges" WHERE "entityType" = \'{entity_type}\')'
+    )
+
+def tombstone(entity_type: str, id_sql: str) -> str:
+    return (
+        f'INSERT OR REPLACE INTO "SyncChanges" ("entityType", "entityId", deleted, op) '
+        f"VALUES ('{entity_type}', {id_sql}, 1, 'delete');"
+    )
+
+def mark_prayer_request(id_sql: str, op: str = "update") -> str:
+    # A prayer request is embedded in the journal entries it is linked to
+    return mark("prayer_request", id_sql, op) + mark(
+        "journal_entry", f'SELECT "journalId" FROM journal_prayer_request WHERE "prayerRequestId" = {id_sql}'
+    )
+
+def trigger(name: str, event: str, table: str, body: str):
+    return name, f'CREATE TRIGGER "{name}" AFTER {event} ON "{table}" BEGIN {body} END'
+
+def sync_schema_statements():
+    return [
+        trigger("JournalEntries_sync_ai", "INSERT", "JournalEntries", mark("journal_entry", "new.id", "create")),
+        trigger("JournalEntries_sync_au", "UPDATE", "JournalEntries", mark("journal_entry", "new.id")),
+        trigger("JournalEntries_sync_ad", "DELETE", "JournalEntries", tombstone("journal_entry", "old.id")),
+
+        trigger("PrayerRequests_sync_ai", "INSERT", "PrayerRequests", mark_prayer_request("new.id", "create")),
+        trigger("PrayerRequests_sync_au", "UPDATE", "PrayerRequests", mark_prayer_request("new.id")),
+        trigger("PrayerRequests_sync_ad", "DELETE", "PrayerRequests", tombstone("prayer_request", "old.id")),
+
+        trigger("PrayerRequestUpdates_sync_ai", "INSERT", "PrayerRequestUpdates",
+                mark("prayer_request_update", "new.id", "create") + mark_prayer_request('new."prayerRequestId"')),
+        trigger("PrayerRequestUpdates_sync_au", "UPDATE", "PrayerRequestUpdates",
+                mark("prayer_request_update", "new.id") + mark_prayer_request('new."prayerRequestId"')
+                + mark_prayer_request('old."prayerRequestId"')),
+        trigger("PrayerRequestUpdates_sync_ad", "DELETE", "PrayerRequestUpdates",
+                tombstone("prayer_request_update", "old.id") + mark_prayer_request('old."prayerRequestId"')),
+
+        trigger("tags_sync_ai", "INSERT", "tags", mark("tag", "new.id", "create")),
+        trigger("tags_sync_au", "UPDATE", "tags", mark("tag", "new.id")),
+        trigger("tags_sync_ad", "DELETE", "tags", tombstone("tag", "old.id")),
+
+        trigger("JournalTag_sync_ai", "INSERT", "JournalTag", mark("journal_entry", 'new."journalId"')),
+        trigger("JournalTag_sync_ad", "DELETE", "JournalTag", mark("journal_entry", 'old."journalId"')),
+        trigger("PrayerRequestTag_sync_ai", "INSERT", "PrayerRequestTag", mark_prayer_request('new."prayerRequestId"')),
+        trigger("PrayerRequestTag_sync_ad", "DELETE", "PrayerRequestTag", mark_prayer_request('old."prayerRequestId"')),
+        trigger("journal_prayer_request_sync_ai", "INSERT", "journal_prayer_request", mark("journal_entry", 'new."journalId"')),
+        trigger("journal_prayer_request_sync_ad", "DELETE", "journal_prayer_request", mark("journal_entry", 'old."journalId"')),
+    ]
+
+def create_sync_schema(bind=engine):
+    with bind.begin() as connection:
+        models.SyncChange.__table__.create(bind=connection, checkfirst=True)
+        columns = {row[1] for row in connection.execute(text('PRAGMA table_info("SyncChanges")'))}
+        if "op" not in columns:
+            connection.execute(text('ALTER TABLE "SyncChanges" ADD COLUMN op VARCHAR NOT NULL DEFAULT \'update\''))
+        # Triggers are recreated each time this runs so they match this file
+        for name, statement in sync_schema_statements():
+            connection.execute(text(f'DROP TRIGGER IF EXISTS "{name}"'))
+            connection.execute(text(statement))
+        # The log covers every existing row, so since=0 returns them all. Decided per
+        # row rather than by whether the table existed: create_all makes the table
+        # before this runs.
+        for entity_type in SYNC_ENTITIES:
+            connection.execute(text(backfill(entity_type)))
+
+def parse_token(since: Optional[str]) -> int:
+    if not since:
+        return 0
+    try:
+        seq = int(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    if seq < 0:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    return seq
+
+router = APIRouter()
+
+@router.get("/sync", response_model=SyncResult)
+async def sync(
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Returns at most limit changes, oldest first. With hasMore set, call again with
+    # the returned token right away to fetch the rest.
+    seq = parse_token(since)
+    changes = (await db.execute(
+        select(models.SyncChange.seq, models.SyncChange.entityType, models.SyncChange.entityId, models.SyncChange.deleted)
+        .where(models.SyncChange.seq > seq)
+        .order_by(models.SyncChange.seq)
+        .limit(limit + 1)
+    )).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    token = changes[-1].seq if changes else seq
+
+    changed = {entity_type: [] for entity_type in SYNC_ENTITIES}
+    deleted = {entity_type: [] for entity_type in SYNC_ENTITIES}
+    for change in changes:
+        if change.entityType in SYNC_ENTITIES:
+            (deleted if change.deleted else changed)[change.entityType].append(change.entityId)
+
+    result = SimpleNamespace(token=str(token), hasMore=has_more, deleted=SimpleNamespace())
+    for entity_type, (model, _, field, plan) in SYNC_ENTITIES.items():
+        rows = []
+        if changed[entity_type]:
+            rows = list(await db.scalars(
+                select(model).options(*plan).where(model.id.in_(changed[entity_type])).order_by(model.id)
+            ))
+        setattr(result, field, rows)
+        setattr(result.deleted, field, deleted[entity_type])
+    return serialization.json_response(SyncResult, result)
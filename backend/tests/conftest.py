@@ -0,0 +1,91 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import httpx
+import pytest
+
+# The app reads its settings when its modules are imported, so the test database
+# and settings go into the environment first. Every test session gets a fresh
+# database in a temporary directory.
+TEST_DIR = tempfile.mkdtemp(prefix="ebenezer-tests-")
+os.environ.update({
+    "DATABASE_PATH": os.path.join(TEST_DIR, "test.db"),
+    "SHARD_DIR": os.path.join(TEST_DIR, "shards"),
+    # The query_count fixture counts statements itself
+    "QUERY_BUDGET_MODE": "off",
+    # Every request goes to the database instead of the page cache
+    "PAGE_CACHE_SIZE": "0",
+    "ARCHIVE_INTERVAL": "0",
+    "LOG_LEVEL": "WARNING",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+import migrations  # noqa: E402
+import querycount  # noqa: E402
+from database import engine  # noqa: E402
+
+class Client:
+    # Sends requests to the app in this process on one event loop, so the
+    # statements a request runs are seen by querycount.count_queries() around it
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return self.loop.run_until_complete(self.client.request(method, url, **kwargs))
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.loop.run_until_complete(self.client.aclose())
+
+@pytest.fixture(scope="session")
+def client():
+    migrations.upgrade(engine)
+    loop = asyncio.new_event_loop()
+    client = Client(loop)
+    yield client
+    client.close()
+    loop.close()
+
+@pytest.fixture(scope="session")
+def seeded(client):
+    # Enough rows with enough relationships that loading any of them one query
+    # per row shows up in the statement counts
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            'INSERT INTO "Person" ("firstName", "lastName") VALUES (\'Ann\', \'Lee\'), (\'Ben\', \'Ode\')'
+        )
+    tag_ids = [client.post("/tags/", json={"name": f"seed-{i}"}).json()["id"] for i in range(4)]
+    for i in range(25):
+        entry = client.post("/journal-entries/", json={
+            "title": f"Entry {i}",
+            "content": "Lorem ipsum " * 50,
+            "bibleVerses": ["John 3:16"],
+            "tags": tag_ids[i % 2:i % 2 + 2],
+            "prayerRequests": [{"title": f"Request {i}", "description": "Please pray", "assignedToId": i % 2 + 1, "tags": tag_ids[:1]}],
+        }).json()
+        request_id = entry["prayerRequests"][0]["id"]
+        for j in range(2):
+            client.post(f"/prayer-requests/{request_id}/updates/", json={"title": f"Update {j}", "content": "Answered"})
+    return tag_ids
+
+@pytest.fixture
+def query_count(client):
+    # query_count(method, url, route, **kwargs) sends a request and fails the test
+    # when it runs more statements than QUERY_BUDGETS[(method, route)]; returns
+    # the response and the querycount.QueryCounter
+    def request(method: str, url: str, route: str, **kwargs):
+        with querycount.count_queries() as counter:
+            response = client.request(method, url, **kwargs)
+        assert response.status_code == 200, response.text
+        querycount.check_budget(method, route, counter)
+        return response, counter
+    return request
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import archive
+import config
+from database import engine
+
+def test_journal_entries_include_archived_prayer_requests_on_request(client, query_count):
+    entry = client.post("/journal-entries/", json={
+        "title": "archived link",
+        "content": "answered",
+        "prayerRequests": [{"title": "answered", "checked": True}, {"title": "open"}],
+    }).json()
+    answered, still_open = (request["id"] for request in entry["prayerRequests"])
+    with engine.begin() as connection:
+        connection.execute(
+            text('UPDATE "PrayerRequests" SET "updatedAt" = :old WHERE id = :id'),
+            {"old": datetime(2000, 1, 1), "id": answered},
+        )
+        cutoff = datetime.utcnow() - timedelta(days=config.ARCHIVE_AFTER_DAYS)
+        assert archive.archive_batch(connection, cutoff, config.ARCHIVE_BATCH_SIZE) == 1
+
+    url = f"/journal-entries/{entry['id']}"
+    assert [request["id"] for request in client.get(url).json()["prayerRequests"]] == [still_open]
+    response, _ = query_count("GET", url, "/journal-entries/{entry_id}", params={"include_archived": "true"})
+    assert [request["id"] for request in response.json()["prayerRequests"]] == [still_open, answered]
+
+    page, _ = query_count("GET", "/journal-entries/", "/journal-entries/", params={"include_archived": "true"})
+    listed = next(item for item in page.json() if item["id"] == entry["id"])
+    assert [request["title"] for request in listed["prayerRequests"]] == ["open", "answered"]
+    fields = client.get("/journal-entries/", params={"include_archived": "true", "fields": "prayerRequests"}).json()
+    assert len(next(item for item in fields if item["id"] == entry["id"])["prayerRequests"]) == 2
+
+def test_archived_ids_are_not_handed_out_again(client):
+    first = client.post("/prayer-requests/", json={"title": "answered", "description": "d", "checked": True}).json()["id"]
+    with engine.begin() as connection:
+        connection.execute(
+            text('UPDATE "PrayerRequests" SET "updatedAt" = :old WHERE id = :id'), {"old": datetime(2000, 1, 1), "id": first}
+        )
+        cutoff = datetime.utcnow() - timedelta(days=config.ARCHIVE_AFTER_DAYS)
+        assert archive.archive_batch(connection, cutoff, config.ARCHIVE_BATCH_SIZE) == 1
+
+    # The archived request was the newest, so without AUTOINCREMENT its id came back
+    second = client.post("/prayer-requests/", json={"title": "brand new", "description": "d"}).json()["id"]
+    assert second > first
+    archived = client.get(f"/prayer-requests/{first}", params={"include_archived": "true"}).json()
+    assert archived["title"] == "answered"
@@ -0,0 +1,80 @@
+import json
+from datetime import datetime
+
+from sqlalchemy import text
+
+import archive
+import backup
+from database import engine
+
+def ndjson(*records) -> str:
+    return "\n".join(json.dumps(record) for record in records)
+
+def test_mistyped_records_are_reported_not_imported(client):
+    response = client.post("/import", content=ndjson(
+        {"type": "header", "version": 1},
+        {"type": "tag", "id": 1, "name": "import-ok"},
+        {"type": "journal_entry", "id": 1, "title": "bad date", "createdAt": "not-a-date"},
+        {"type": "journal_entry", "id": 2, "title": "bad tags", "tags": [{"a": 1}]},
+        {"type": "prayer_request", "id": 1, "title": "bad update", "updates": [{"title": "u", "date": 5}]},
+        {"type": "journal_entry", "id": 3, "title": "import-good", "content": "c", "tags": [1]},
+    ))
+    assert response.status_code == 200
+    body = response.json()
+    assert body["errors"] == [
+        {"line": 3, "lastLine": 3, "detail": "Invalid fields: createdAt"},
+        {"line": 4, "lastLine": 4, "detail": "Invalid fields: tags"},
+        {"line": 5, "lastLine": 5, "detail": "Invalid fields: updates"},
+    ]
+    assert body["imported"]["tag"] == 1
+    assert body["imported"]["journal_entry"] == 1
+    assert body["imported"]["prayer_request"] == 0
+
+def test_failed_batch_reports_its_first_and_last_line(client, monkeypatch):
+    async def fail(self, records, db):
+        raise ValueError("boom")
+    monkeypatch.setattr(backup.Importer, "insert_person", fail)
+    body = client.post("/import", content=ndjson(
+        {"type": "header", "version": 1},
+        {"type": "person", "id": 1, "firstName": "a", "lastName": "b"},
+        {"type": "person", "id": 2, "firstName": "c", "lastName": "d"},
+    )).json()
+    assert body["errors"] == [{"line": 2, "lastLine": 3, "detail": "boom"}]
+
+def test_export_imports_cleanly(client, seeded):
+    exported = client.get("/export").text
+    body = client.post("/import", content=exported).json()
+    assert body["errors"] == []
+    assert body["imported"]["journal_entry"] >= 25
+
+def test_archived_prayer_requests_survive_a_roundtrip(client):
+    tag = client.post("/tags/", json={"name": "backup-archived"}).json()["id"]
+    entry = client.post("/journal-entries/", json={
+        "title": "backup-archived", "content": "c",
+        "prayerRequests": [{"title": "backup-answered", "checked": True, "tags": [tag]}],
+    }).json()
+    answered = entry["prayerRequests"][0]["id"]
+    client.post(f"/prayer-requests/{answered}/updates/", json={"title": "u", "content": "answered"})
+    with engine.begin() as connection:
+        connection.execute(
+            text('UPDATE "PrayerRequests" SET "updatedAt" = :old WHERE id = :id'), {"old": datetime(2000, 1, 1), "id": answered}
+        )
+    assert client.post("/archive/run").json()["started"]
+    client.loop.run_until_complete(archive.archiver.manual)
+
+    records = [json.loads(line) for line in client.get("/export").text.splitlines()]
+    exported = next(r for r in records if r["type"] == "prayer_request" and r["id"] == answered)
+    assert exported["archived"] and exported["archivedAt"] and len(exported["updates"]) == 1
+    assert next(r for r in records if r["type"] == "journal_entry" and r["id"] == entry["id"])["prayerRequests"] == [answered]
+
+    body = client.post("/import", content="\n".join(json.dumps(r) for r in records)).json()
+    assert body["errors"] == []
+    imported = body["idMap"]["prayer_request"][str(answered)]
+    assert client.get(f"/prayer-requests/{imported}").status_code == 404
+    restored = client.get(f"/prayer-requests/{imported}", params={"include_archived": "true"}).json()
+    assert restored["title"] == "backup-answered" and len(restored["updates"]) == 1
+    assert [t["name"] for t in restored["tags"]] == ["backup-archived"]
+    copy = client.get(
+        f"/journal-entries/{body['idMap']['journal_entry'][str(entry['id'])]}", params={"include_archived": "true"}
+    ).json()
+    assert [request["id"] for request in copy["prayerRequests"]] == [imported]
@@ -0,0 +1,45 @@
+import os
+import sqlite3
+from contextlib import closing
+
+import migrations
+from conftest import TEST_DIR
+from database import create_sqlite_engine
+
+def schema_of(db, table):
+    return sorted(db.execute(
+        "SELECT type, name FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger')", (table,)
+    ).fetchall())
+
+def test_autoincrement_ids_rebuilds_tables_from_before_it(monkeypatch):
+    # A database whose hot tables were created without AUTOINCREMENT
+    bind = create_sqlite_engine(f"sqlite:///{os.path.join(TEST_DIR, 'old-ids.db')}")
+    for table, _ in migrations.AUTOINCREMENT_TABLES:
+        monkeypatch.setitem(table.dialect_options["sqlite"], "autoincrement", False)
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:4])
+    migrations.upgrade(bind)
+    monkeypatch.undo()
+
+    path = bind.url.database
+    with closing(sqlite3.connect(path)) as db:
+        assert "AUTOINCREMENT" not in db.execute("SELECT sql FROM sqlite_master WHERE name = 'PrayerRequests'").fetchone()[0]
+        db.execute('INSERT INTO "PrayerRequests" (id, title, checked) VALUES (1, \'hot\', 0)')
+        db.execute('INSERT INTO "ArchivedPrayerRequests" (id, title, checked) VALUES (7, \'archived\', 1)')
+        db.commit()
+        before = {table.name: schema_of(db, table.name) for table, _ in migrations.AUTOINCREMENT_TABLES}
+
+    assert migrations.upgrade(bind) == [(5, "autoincrement ids")]
+    bind.dispose()
+
+    with closing(sqlite3.connect(path)) as db:
+        for table, _ in migrations.AUTOINCREMENT_TABLES:
+            assert "AUTOINCREMENT" in db.execute("SELECT sql FROM sqlite_master WHERE name = ?", (table.name,)).fetchone()[0]
+            assert schema_of(db, table.name) == before[table.name]
+        assert db.execute('SELECT id, title FROM "PrayerRequests"').fetchall() == [(1, "hot")]
+        # The sequence starts past the archived id, and the table's triggers still fire
+        db.execute('INSERT INTO "PrayerRequests" (title, checked) VALUES (\'new\', 0)')
+        assert db.execute('SELECT max(id) FROM "PrayerRequests"').fetchone()[0] == 8
+        assert db.execute(
+            'SELECT 1 FROM "SyncChanges" WHERE "entityType" = \'prayer_request\' AND "entityId" = 8'
+        ).fetchone()
+        db.commit()
@@ -0,0 +1,35 @@
+import pytest
+
+import querycount
+from querycount import QUERY_BUDGETS
+
+LIST_ROUTES = [
+    ("/journal-entries/", {}),
+    ("/journal-entries/", {"tags": "seeded"}),
+    ("/journal-entries/", {"include_archived": "true"}),
+    ("/prayer-requests/", {}),
+    ("/prayer-requests/", {"include_archived": "true"}),
+    ("/tags/", {}),
+]
+
+@pytest.mark.parametrize("route, params", LIST_ROUTES)
+def test_list_route_stays_within_budget(seeded, query_count, route, params):
+    params = {name: seeded[0] if value == "seeded" else value for name, value in params.items()}
+    response, counter = query_count("GET", route, route, params=params)
+    assert len(response.json()) >= 4
+    assert 0 < counter.count <= QUERY_BUDGETS[("GET", route)]
+
+# Pages of seeded rows only: a page holding rows without any related rows (as
+# other tests leave behind) skips the queries for those relationships
+@pytest.mark.parametrize("route, seeded_tag", [("/journal-entries/", 1), ("/prayer-requests/", 0), ("/tags/", None)])
+def test_query_count_does_not_grow_with_page_size(seeded, query_count, route, seeded_tag):
+    params = {} if seeded_tag is None else {"tags": seeded[seeded_tag]}
+    _, small = query_count("GET", route, route, params={"limit": 1, **params})
+    _, large = query_count("GET", route, route, params={"limit": 100, **params})
+    assert large.count == small.count
+
+def test_check_budget_fails_over_budget():
+    counter = querycount.QueryCounter()
+    counter.count = QUERY_BUDGETS[("GET", "/tags/")] + 1
+    with pytest.raises(querycount.QueryBudgetExceeded):
+        querycount.check_budget("GET", "/tags/", counter)
@@ -0,0 +1,9 @@
+def test_snippets_escape_entry_content(client):
+    client.post("/journal-entries/", json={
+        "title": "Markup", "content": 'hopeful <script>alert(1)</script> <img src=x onerror="alert(2)"> news',
+    })
+    results = client.get("/search", params={"q": "hopeful"}).json()
+    snippet = next(result["snippet"] for result in results if result["title"] == "Markup")
+    assert snippet.startswith("<mark>hopeful</mark>")
+    assert "<script>" not in snippet and "<img" not in snippet
+    assert "&lt;script&gt;" in snippet
@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+import pytest
+
+import cache
+import config
+import shards
+
+@pytest.fixture
+def sharded(client, monkeypatch):
+    monkeypatch.setattr(config, "SHARDING", True)
+    # The page cache is off for the other tests
+    monkeypatch.setattr(cache.page_cache, "maxsize", 16)
+    yield client
+    client.loop.run_until_complete(shards.router.stop())
+
+def test_moved_shard_leaves_nothing_cached_under_its_old_key(sharded):
+    alice, carol = {"X-Tenant-ID": "move-alice"}, {"X-Tenant-ID": "move-carol"}
+    sharded.post("/tags/", json={"name": "secret"}, headers=alice)
+    before = sharded.get("/tags/", headers=alice)
+    assert [tag["name"] for tag in before.json()] == ["secret"]
+
+    assert sharded.post("/admin/shards/move-alice/move", params={"to": "move-carol"}).status_code == 200
+    sharded.post("/tags/", json={"name": "fresh"}, headers=alice)
+
+    after = sharded.get("/tags/", headers=alice)
+    assert [tag["name"] for tag in after.json()] == ["fresh"]
+    assert after.headers["etag"] != before.headers["etag"]
+    assert sharded.get("/tags/", headers={**alice, "If-None-Match": before.headers["etag"]}).status_code == 200
+    assert [tag["name"] for tag in sharded.get("/tags/", headers=carol).json()] == ["secret"]
+
+def test_requests_wait_for_a_move_of_their_shard(sharded, monkeypatch):
+    alice, carol = {"X-Tenant-ID": "race-alice"}, {"X-Tenant-ID": "race-carol"}
+    sharded.post("/tags/", json={"name": "before"}, headers=alice)
+    move_file = shards.move_file
+
+    def slow_move(source, target):
+        time.sleep(0.2)
+        move_file(source, target)
+    monkeypatch.setattr(shards, "move_file", slow_move)
+
+    async def write_during_move():
+        await asyncio.sleep(0.05)
+        return await sharded.client.post("/tags/", json={"name": "during"}, headers=alice)
+
+    async def move_and_write():
+        return await asyncio.gather(
+            sharded.client.post("/admin/shards/race-alice/move", params={"to": "race-carol"}), write_during_move(),
+        )
+
+    moved, written = sharded.loop.run_until_complete(move_and_write())
+    assert moved.status_code == 200 and written.status_code == 200
+    # The write waited for the move and went to the new, empty race-alice
+    assert [tag["name"] for tag in sharded.get("/tags/", headers=alice).json()] == ["during"]
+    assert [tag["name"] for tag in sharded.get("/tags/", headers=carol).json()] == ["before"]
@@ -0,0 +1,20 @@
+from sqlalchemy import text
+
+import sync
+from database import engine
+
+def test_rows_missing_from_the_change_log_are_backfilled(client, seeded):
+    # As in a database whose rows were written before SyncChanges existed
+    with engine.begin() as connection:
+        connection.execute(text('DELETE FROM "SyncChanges"'))
+    assert client.get("/sync", params={"since": 0}).json()["tags"] == []
+
+    sync.create_sync_schema(engine)
+    synced = client.get("/sync", params={"since": 0, "limit": 5000}).json()
+    assert {tag["id"] for tag in synced["tags"]} >= set(seeded)
+    assert len(synced["journalEntries"]) >= 25
+
+    # Running it again adds nothing
+    token = synced["token"]
+    sync.create_sync_schema(engine)
+    assert client.get("/sync", params={"since": token}).json()["tags"] == []
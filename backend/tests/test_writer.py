@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+import config
+import writer
+
+@pytest.fixture
+def queued(client, monkeypatch):
+    monkeypatch.setattr(config, "WRITE_QUEUE", True)
+    yield client
+    client.loop.run_until_complete(writer.writer.stop())
+
+def test_bulk_and_import_writes_go_through_the_writer(queued):
+    before = writer.writer.operations
+    body = queued.post("/tags/bulk", json={"create": [{"name": "queued-a"}, {"name": "queued-b"}]}).json()
+    assert body["committed"] and [result["status"] for result in body["results"]] == ["ok", "ok"]
+    assert writer.writer.operations == before + 1
+
+    # partial mode: one operation per create, update or delete step
+    body = queued.post(
+        "/tags/bulk", params={"mode": "partial"}, json={"update": [{"id": body["results"][0]["id"], "name": "queued-c"}]}
+    ).json()
+    assert [result["status"] for result in body["results"]] == ["ok"]
+    assert writer.writer.operations == before + 2
+
+    body = queued.post("/import", content=json.dumps({"type": "tag", "id": 1, "name": "queued-import"})).json()
+    assert body["errors"] == [] and body["imported"]["tag"] == 1
+    assert writer.writer.operations == before + 3
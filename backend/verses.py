@@ -0,0 +1,204 @@
+import json
+import re
+import sys
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import etags
+import models
+import serialization
+from database import engine, get_async_db
+from loaders import JOURNAL_ENTRY_PLAN
+from pagination import JOURNAL_ENTRY_KEY, fetch_page, set_next_cursor
+from schemas import JournalEntry
+
+# verses.py parses the Bible references of journal entries ("John 3:16",
+# "John 3:16-18", "Romans 8:28-9:5", "Psalm 23", "Genesis 1-3") into JournalVerse
+# rows and serves GET /verses/{ref}/journal-entries, which finds the entries whose
+# references overlap ref. References that don't parse stay in bibleVerses but get
+# no JournalVerse row.
+
+# Keys are chapter * CHAPTER_SPAN + verse; a reference without verses covers the
+# whole chapter, 0 to CHAPTER_SPAN - 1.
+CHAPTER_SPAN = 1000
+
+# Common abbreviations and alternative names, after normalize_book()
+BOOK_ALIASES = {
+    "gen": "genesis", "ex": "exodus", "exod": "exodus", "lev": "leviticus", "num": "numbers",
+    "deut": "deuteronomy", "josh": "joshua", "judg": "judges", "ps": "psalms", "psa": "psalms",
+    "psalm": "psalms", "prov": "proverbs", "eccl": "ecclesiastes", "song of solomon": "song of songs",
+    "isa": "isaiah", "jer": "jeremiah", "lam": "lamentations", "ezek": "ezekiel", "dan": "daniel",
+    "matt": "matthew", "mt": "matthew", "mk": "mark", "lk": "luke", "jn": "john", "rom": "romans",
+    "1 cor": "1 corinthians", "2 cor": "2 corinthians", "gal": "galatians", "eph": "ephesians",
+    "phil": "philippians", "col": "colossians", "1 thess": "1 thessalonians", "2 thess": "2 thessalonians",
+    "1 tim": "1 timothy", "2 tim": "2 timothy", "heb": "hebrews", "jas": "james", "1 pet": "1 peter",
+    "2 pet": "2 peter", "rev": "revelation", "revelations": "revelation",
+}
+
+REFERENCE = re.compile(
+    r"^\s*(?P<book>(?:[1-3]\s*)?[^\d\s][^\d]*?)\.?\s+(?P<c1>\d+)(?:\s*:\s*(?P<v1>\d+))?"
+    r"(?:\s*[-–—]\s*(?P<x>\d+)(?:\s*:\s*(?P<v2>\d+))?)?\s*$"
+)
+
+class VerseRange(NamedTuple):
+    book: str
+    chapterStart: int
+    verseStart: Optional[int]
+    chapterEnd: int
+    verseEnd: Optional[int]
+
+    @property
+    def startKey(self) -> int:
+        return self.chapterStart * CHAPTER_SPAN + (self.verseStart or 0)
+
+    @property
+    def endKey(self) -> int:
+        return self.chapterEnd * CHAPTER_SPAN + (self.verseEnd if self.verseEnd is not None else CHAPTER_SPAN - 1)
+
+def normalize_book(book: str) -> str:
+    book = re.sub(r"\s+", " ", book.replace(".", " ")).strip().lower()
+    book = re.sub(r"^([1-3])\s*", r"\1 ", book)
+    return BOOK_ALIASES.get(book, book)
+
+def parse_reference(reference: str) -> Optional[VerseRange]:
+    match = REFERENCE.match(reference or "")
+    if match is None:
+        return None
+    book = normalize_book(match["book"])
+    c1 = int(match["c1"])
+    v1 = int(match["v1"]) if match["v1"] else None
+    x = int(match["x"]) if match["x"] else None
+    v2 = int(match["v2"]) if match["v2"] else None
+    if x is None:
+        # "John 3:16" or "Psalm 23"
+        parsed = VerseRange(book, c1, v1, c1, v1)
+    elif v2 is not None:
+        # "Romans 8:28-9:5"
+        parsed = VerseRange(book, c1, v1, x, v2)
+    elif v1 is not None:
+        # "John 3:16-18": the second number is a verse in the same chapter
+        parsed = VerseRange(book, c1, v1, c1, x)
+    else:
+        # "Genesis 1-3": whole chapters
+        parsed = VerseRange(book, c1, None, x, None)
+    verses = [verse for verse in (parsed.verseStart, parsed.verseEnd) if verse is not None]
+    if parsed.endKey < parsed.startKey or any(verse >= CHAPTER_SPAN for verse in verses):
+        return None
+    return parsed
+
+def verse_rows(journal_id: int, references: Iterable[str]) -> List[dict]:
+    rows = []
+    for position, reference in enumerate(references):
+        parsed = parse_reference(reference)
+        if parsed is None:
+            continue
+        rows.append({
+            "journalId": journal_id,
+            "position": position,
+            "reference": reference,
+            **parsed._asdict(),
+            "startKey": parsed.startKey,
+            "endKey": parsed.endKey,
+        })
+    return rows
+
+async def replace_verses(db: AsyncSession, entries: Iterable[Tuple[int, Iterable[str]]]):
+    # Rewrites the JournalVerse rows of the given (journal id, references) pairs
+    entries = list(entries)
+    if not entries:
+        return
+    await db.execute(delete(models.JournalVerse).where(models.JournalVerse.journalId.in_([id for id, _ in entries])))
+    rows = [row for journal_id, references in entries for row in verse_rows(journal_id, references)]
+    if rows:
+        await db.execute(insert(models.JournalVerse), rows)
+
+def verse_schema_statements():
+    # Verse rows go away with their entry, however it is deleted
+    return [
+        'CREATE TRIGGER IF NOT EXISTS "JournalEntries_verses_ad" AFTER DELETE ON "JournalEntries" BEGIN '
+        'DELETE FROM "JournalVerse" WHERE "journalId" = old.id; END',
+    ]
+
+def create_verse_schema(bind=engine):
+    with bind.begin() as connection:
+        models.JournalVerse.__table__.create(bind=connection, checkfirst=True)
+        for index in models.JournalVerse.__table__.indexes:
+            index.create(bind=connection, checkfirst=True)
+        for statement in verse_schema_statements():
+            connection.execute(text(statement))
+        # References stored before the table existed are only in the JSON column
+        needs_migration = connection.execute(text(
+            'SELECT NOT EXISTS (SELECT 1 FROM "JournalVerse") AND EXISTS '
+            '(SELECT 1 FROM "JournalEntries" WHERE "bibleVerses" NOT IN (\'[]\', \'\'))'
+        )).scalar()
+    if needs_migration:
+        rebuild_verses(bind)
+
+def rebuild_verses(bind=engine, batch_size: int = 500):
+    # Re-parses bibleVerses of every journal entry into JournalVerse
+    with bind.begin() as connection:
+        connection.execute(delete(models.JournalVerse))
+        last_id = 0
+        while True:
+            batch = connection.execute(
+                select(models.JournalEntry.id, models.JournalEntry.bibleVerses)
+                .where(models.JournalEntry.id > last_id)
+                .order_by(models.JournalEntry.id)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            rows = []
+            for journal_id, raw in batch:
+                try:
+                    references = json.loads(raw or "[]")
+                except ValueError:
+                    references = []
+                rows += verse_rows(journal_id, [r for r in references if isinstance(r, str)])
+            if rows:
+                connection.execute(insert(models.JournalVerse), rows)
+
+router = APIRouter()
+
+@router.get(
+    "/verses/{ref}/journal-entries",
+    response_model=List[JournalEntry],
+    dependencies=[etags.conditional_get(etags.JOURNAL_ENTRY_TABLES)],
+)
+async def read_journal_entries_for_verse(
+    ref: str,
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    parsed = parse_reference(ref)
+    if parsed is None:
+        raise HTTPException(status_code=400, detail="Invalid Bible reference")
+    # Overlap of [startKey, endKey] ranges, served by the (book, startKey, endKey,
+    # journalId) index
+    matching = (
+        select(models.JournalVerse.journalId)
+        .where(
+            models.JournalVerse.book == parsed.book,
+            models.JournalVerse.startKey <= parsed.endKey,
+            models.JournalVerse.endKey >= parsed.startKey,
+        )
+    )
+    stmt = select(models.JournalEntry).options(*JOURNAL_ENTRY_PLAN).where(models.JournalEntry.id.in_(matching))
+    entries, next_cursor = await fetch_page(db, stmt, JOURNAL_ENTRY_KEY, cursor, skip, limit)
+    set_next_cursor(response, next_cursor)
+    return serialization.json_response(List[JournalEntry], entries, response)
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python verses.py backfill")
+    create_verse_schema()
+    rebuild_verses()
+    print("Journal verse references rebuilt")
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from fastapi import APIRouter
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+import config
+from database import ASYNC_SQLALCHEMY_DATABASE_URL, apply_performance_pragmas
+
+# writer.py is the optional group-commit mode for the write routes. SQLite takes one
+# writer at a time, so with every route committing on its own session a burst of
+# writes queues on the database lock, and each write pays for its own commit.
+#
+# With WRITE_QUEUE on, routes hand their changes to run() as an operation, an async
+# function of a session; the /bulk routes and /import hand over one per transaction
+# they used to commit. A single writer task takes operations off a queue and
+# applies up to WRITE_BATCH_SIZE of them in one transaction (waiting at most
+# WRITE_BATCH_WAIT_MS for a batch to fill), each in a savepoint of its own: an
+# operation that raises (a 404, a constraint violation) is rolled back alone and its
+# caller gets the exception, the others still commit together. Every caller gets its
+# own result back through a future once the batch has committed.
+#
+# With WRITE_QUEUE off (the default) run() applies the operation on the request's
+# session and commits it there, as before. So does SHARDING (see shards.py), where
+# each tenant's database has a write lock of its own already.
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+Operation = Callable[[AsyncSession], Awaitable[T]]
+
+def _connect(dbapi_connection, connection_record):
+    # Let SQLAlchemy, not the sqlite3 module, decide when transactions start, so
+    # SAVEPOINTs nest inside the batch's transaction
+    dbapi_connection.isolation_level = None
+
+def _begin(conn):
+    # Take the write lock when the batch starts instead of at its first write
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+def create_writer_engine(url: str):
+    # One connection: the writer task is the only user
+    writer_engine = create_async_engine(
+        url, connect_args={"check_same_thread": False}, poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0
+    )
+    if config.SQLITE_PROFILE == "performance":
+        event.listen(writer_engine.sync_engine, "connect", apply_performance_pragmas)
+    event.listen(writer_engine.sync_engine, "connect", _connect)
+    event.listen(writer_engine.sync_engine, "begin", _begin)
+    return writer_engine
+
+engine = create_writer_engine(ASYNC_SQLALCHEMY_DATABASE_URL)
+WriterSession = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+class Writer:
+    def __init__(self):
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.batches = 0
+        self.operations = 0
+        self.failed = 0
+        self.largest_batch = 0
+
+    def start(self):
+        # Also called on the first submit(), so the queue lives on the loop serving
+        # requests even when startup handlers didn't run
+        loop = asyncio.get_running_loop()
+        if self.task is not None and not self.task.done() and self.loop is loop:
+            return
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=config.WRITE_QUEUE_SIZE)
+        self.task = loop.create_task(self.run_forever())
+
+    async def stop(self):
+        # Commits what is already queued, then ends the writer task
+        if self.task is None:
+            return
+        if self.loop is asyncio.get_running_loop() and not self.task.done():
+            await self.queue.put(None)
+            await self.task
+        self.task = None
+
+    async def submit(self, operation: Operation) -> T:
+        if self.task is None or self.task.done() or self.loop is not asyncio.get_running_loop():
+            self.start()
+        future = self.loop.create_future()
+        await self.queue.put((operation, future))
+        return await future
+
+    async def next_batch(self) -> Tuple[List[tuple], bool]:
+        # Blocks for the first operation, then takes what else arrives within
+        # WRITE_BATCH_WAIT_MS; returns the batch and whether stop() was called
+        batch = [await self.queue.get()]
+        deadline = self.loop.time() + config.WRITE_BATCH_WAIT_MS / 1000
+        while batch[-1] is not None and len(batch) < config.WRITE_BATCH_SIZE:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - self.loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        stopping = batch[-1] is None
+        return [item for item in batch if item is not None], stopping
+
+    async def run_forever(self):
+        while True:
+            batch, stopping = await self.next_batch()
+            if batch:
+                try:
+                    await self.commit_batch(batch)
+                except Exception:
+                    logger.exception("Write batch of %d operations failed", len(batch))
+            if stopping:
+                return
+
+    async def commit_batch(self, batch: List[tuple]):
+        # Callers that gave up (client disconnected) before their turn are skipped
+        batch = [(operation, future) for operation, future in batch if not future.done()]
+        results = []
+        try:
+            async with WriterSession() as session:
+                for operation, _ in batch:
+                    try:
+                        async with session.begin_nested():
+                            results.append((True, await operation(session)))
+                    except Exception as exc:
+                        results.append((False, exc))
+                await session.commit()
+        except Exception as exc:
+            # The commit itself failed, so nothing in the batch was written
+            self.failed += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            raise
+        self.batches += 1
+        self.operations += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future), (ok, value) in zip(batch, results):
+            if not ok:
+                self.failed += 1
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": config.WRITE_QUEUE,
+            "running": self.task is not None and not self.task.done(),
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "batches": self.batches,
+            "operations": self.operations,
+            "failed": self.failed,
+            "meanBatch": round(self.operations / self.batches, 2) if self.batches else 0.0,
+            "largestBatch": self.largest_batch,
+            "batchSize": config.WRITE_BATCH_SIZE,
+            "batchWaitMs": config.WRITE_BATCH_WAIT_MS,
+        }
+
+writer = Writer()
+
+async def run(db: AsyncSession, operation: Operation) -> T:
+    # Applies operation and commits it; returns what operation returned. Callers
+    # reload anything they respond with on their own session afterwards.
+    if not config.WRITE_QUEUE or config.SHARDING:
+        result = await operation(db)
+        await db.commit()
+        return result
+    return await writer.submit(operation)
+
+router = APIRouter()
+
+@router.get("/writer/status")
+async def writer_status():
+    return writer.stats()